@@ -40,7 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'frontend',
-    'backend',
+    'backend.apps.BackendConfig',
 ]
 
 MIDDLEWARE = [
@@ -122,3 +122,34 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Video streaming
+
+# Number of bytes read at a time when a clip is streamed without sendfile
+VIDEO_STREAM_BLOCK_SIZE = 512 * 1024
+
+# Proxies of clips that can't be played in the browser
+
+# Directory of the proxies
+PROXY_CACHE_DIR = os.path.join(BASE_DIR, 'proxy_cache')
+
+# Largest total size of the proxies in bytes, the least recently used proxies are removed first
+PROXY_CACHE_SIZE = 20 * 1024 ** 3
+
+# Largest height of a proxy in pixels
+PROXY_MAX_HEIGHT = 480
+
+# Sprites of frames spread evenly over each clip
+
+# Directory of the sprites
+SPRITE_CACHE_DIR = os.path.join(BASE_DIR, 'sprite_cache')
+
+# Number of frames in a sprite
+SPRITE_FRAMES = 10
+
+# Width of each frame in a sprite in pixels
+SPRITE_WIDTH = 160
+
+# Seconds a browser may cache a sprite
+SPRITE_MAX_AGE = 365 * 24 * 60 * 60
@@ -1,5 +1,17 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
 class BackendConfig(AppConfig):
     name = 'backend'
+
+    def ready(self):
+        # Resume object detection and generate proxies in the process serving requests, not in the autoreloader or
+        # other commands
+        if 'runserver' in sys.argv and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv):
+            from .object_detector import get_scheduler
+            from .proxy_cache import get_proxy_generator
+            get_scheduler().start()
+            get_proxy_generator().start()
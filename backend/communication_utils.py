@@ -10,6 +10,7 @@ PROJECT_ID = 'project_id'
 FOLDER_ID = 'folder_id'
 CAMERA_ID = 'camera_id'
 CLIP_ID = 'clip_id'
+NEXT_CLIP_ID = 'next_clip_id'
 FILTER_ID = 'filter_id'
 PROGRESS_ID = 'progress_id'
 AREA_ID = "area_id"
@@ -20,6 +21,7 @@ CLIP_NAME = 'clip_name'
 
 # --- OS related ---
 FILE_PATH = 'file_path'
+HARD_LINK = 'hard_link'
 
 # --- Objects ---
 PROJECTS = 'projects'
@@ -115,12 +117,7 @@ def get_project_path(clip: Clip):
     :param clip: The clip.
     :return: Project path to clip.
     """
-    res = os.path.join(clip.folder.name, clip.name + '.' + clip.video_format)
-    curr = clip.folder
-    while curr.parent is not None:
-        res = os.path.join(curr.parent.name, res)
-        curr = curr.parent
-    return res
+    return os.path.join(*clip.folder.get_tree_path(), clip.name + '.' + clip.video_format)
 
 
 def date_str_to_datetime(date_str: Optional[str]) -> timezone.datetime:
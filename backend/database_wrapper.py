@@ -1,13 +1,17 @@
-from typing import List, Optional, Tuple, Dict
+import bisect
+from typing import List, Optional, Tuple, Dict, Iterable
+from collections import Counter
+
+import numpy as np
 from django.utils import timezone
 from decimal import Decimal
-from django.db.models import Q
-import hashlib
-import cv2
+from django.db import transaction
+from django.db.models import Q, F, Prefetch, prefetch_related_objects, Subquery, ExpressionWrapper, DateTimeField
 
 from .communication_utils import replace_sep
+from .video_probe import probe_video
 from .models import Project, Folder, Filter, Camera, ObjectDetection, Object, ObjectClass, Clip, Resolution, Progress, \
-    Area
+    Area, DetectionJob, ObjectCount, DetectedObject, in_subtrees, merge_timeline
 
 """
 This is the wrapper to the database.
@@ -110,16 +114,17 @@ def add_folder_to_project(fid: int, pid: int) -> None:
     p = get_project_by_id(pid=pid)
     assert p is not None
 
-    for f in p.folders.all():
-        if nf == f or nf in get_subfolders_recursive(fid=f.id):
+    folders = p.folders.all()[::1]
+    for f in folders:
+        if nf.lineage.startswith(f.lineage):
             return
 
-    nf_subfolders = get_subfolders_recursive(fid=fid)
-    for f in p.folders.all():
-        if f in nf_subfolders:
+    for f in folders:
+        if f.lineage.startswith(nf.lineage):
             delete_folder_from_project(pid=pid, fid=f.id)
 
     p.folders.add(nf)
+    p.filter_set.update(matching_clips_up_to_date=False)
 
 
 def delete_folder_from_project(fid: int, pid: int) -> None:
@@ -134,6 +139,7 @@ def delete_folder_from_project(fid: int, pid: int) -> None:
     p = get_project_by_id(pid=pid)
     assert p is not None
     p.folders.remove(f)
+    p.filter_set.update(matching_clips_up_to_date=False)
 
 
 def get_folders_in_project(pid: int) -> List[Folder]:
@@ -258,13 +264,9 @@ def get_subfolders_recursive(fid: int) -> List[Folder]:
     :param fid: The id of the folder.
     :return: A list of folders.
     """
-    res = []
-    q = [fid]
-    while q:
-        sfs = get_subfolders(fid=q.pop(0))
-        res += sfs
-        q += [f.id for f in sfs]
-    return res
+    f = get_folder_by_id(fid=fid)
+    assert f is not None
+    return Folder.objects.filter(lineage__startswith=f.lineage).exclude(id=f.id).order_by('lineage')[::1]
 
 
 def delete_folder(fid: int) -> None:
@@ -304,7 +306,7 @@ def get_subfolders_to_entries() -> List[Folder]:
 
 def create_clip(fid: int, clip_name: str, video_format: str, start_time: timezone.datetime,
                 end_time: timezone.datetime, latitude: Decimal, longitude: Decimal,
-                width: int, height: int, frame_rate: float, camera_name: str) -> int:
+                width: int, height: int, frame_rate: float, camera_name: str, hash_sum: str = None) -> int:
     """
     Creates a clip if not already in database.
     Fetches id if clip already in database.
@@ -321,6 +323,7 @@ def create_clip(fid: int, clip_name: str, video_format: str, start_time: timezon
     :param height: Height of clip in pixels.
     :param frame_rate: The frame rate of the clip in FPS.
     :param camera_name: The name of the camera the clip belongs to.
+    :param hash_sum: Hash sum of the clip's first frame. Computed from the clip if not given.
     :return: The created clip's id.
     """
     f = get_folder_by_id(fid=fid)
@@ -335,49 +338,175 @@ def create_clip(fid: int, clip_name: str, video_format: str, start_time: timezon
     if video_format in PLAYABLE_FORMATS:
         clip.playable = True
 
-    hash_sum = create_hash_sum(f, clip)
+    if hash_sum is None:
+        hash_sum = create_hash_sum(f, clip)
     assert hash_sum is not None
     clip.hash_sum = hash_sum
     clip.save()
 
-    find_duplicate_overlapping_clips(cmid=camera.id, cid=clip.id)
+    find_duplicate_overlapping_clips(cmid=camera.id, cids=[clip.id])
+    update_matching_clips(cids=[clip.id])
 
     return clip.id
 
 
-def find_duplicate_overlapping_clips(cmid: int, cid: int) -> None:
-    """
-    Check for duplicates and overlapping clips.
+def create_clips_bulk(clips: List[dict]) -> List[int]:
+    """
+    Creates many clips, their cameras and resolutions in a single transaction.
+    Does the same as calling create_clip for each clip but with a constant number of queries for all
+    cameras, resolutions and clips. Clips already in the database are not changed.
+
+    :param clips: List of dictionaries with the same parameters as create_clip (hash_sum is required).
+    :return: The ids of the clips, in the same order as the given clips.
+    """
+    if not clips:
+        return []
+
+    with transaction.atomic():
+        folders = Folder.objects.in_bulk({c['fid'] for c in clips})
+        assert all(c['fid'] in folders for c in clips)
+
+        # Pre-resolve cameras and create the missing ones
+        def camera_key(c: dict) -> Tuple[str, Decimal, Decimal]:
+            return c['camera_name'], Decimal(c['latitude']).quantize(Decimal('.00000001')), \
+                   Decimal(c['longitude']).quantize(Decimal('.00000001'))
+
+        names = {c['camera_name'] for c in clips}
+        cameras = {(cm.name, cm.latitude, cm.longitude): cm for cm in Camera.objects.filter(name__in=names)}
+        new_cameras = {}
+        for c in clips:
+            key = camera_key(c)
+            if key not in cameras and key not in new_cameras:
+                new_cameras[key] = Camera(name=key[0], latitude=key[1], longitude=key[2])
+                new_cameras[key].full_clean(validate_unique=False)
+        if new_cameras:
+            Camera.objects.bulk_create(new_cameras.values())
+            cameras = {(cm.name, cm.latitude, cm.longitude): cm for cm in Camera.objects.filter(name__in=names)}
+
+        # Pre-resolve resolutions and create the missing ones
+        widths = {c['width'] for c in clips}
+        resolutions = {}
+        for r in Resolution.objects.filter(width__in=widths).order_by('-id'):
+            resolutions[(r.width, r.height)] = r
+        new_resolutions = {(c['width'], c['height']) for c in clips} - resolutions.keys()
+        if new_resolutions:
+            Resolution.objects.bulk_create([Resolution(width=w, height=h) for w, h in new_resolutions])
+            for r in Resolution.objects.filter(width__in=widths).order_by('-id'):
+                resolutions[(r.width, r.height)] = r
+
+        # Create the clips that are not already in the database
+        def clip_key(folder_id: int, name: str, video_format: str) -> Tuple[int, str, str]:
+            return folder_id, name, video_format
+
+        existing = {clip_key(*values[:3]): values[3] for values in Clip.objects.filter(
+            folder__in=folders.keys(), name__in={c['clip_name'] for c in clips}
+        ).values_list('folder_id', 'name', 'video_format', 'id')}
+        new_clips = {}
+        for c in clips:
+            key = clip_key(c['fid'], c['clip_name'], c['video_format'])
+            if key in existing or key in new_clips:
+                continue
+            assert c['hash_sum'] is not None
+            clip = Clip(folder=folders[c['fid']], name=c['clip_name'], video_format=c['video_format'],
+                        start_time=c['start_time'], end_time=c['end_time'], camera=cameras[camera_key(c)],
+                        resolution=resolutions[(c['width'], c['height'])], frame_rate=c['frame_rate'],
+                        hash_sum=c['hash_sum'], playable=c['video_format'] in PLAYABLE_FORMATS)
+            clip.full_clean(exclude=['folder', 'camera', 'resolution'], validate_unique=False)
+            new_clips[key] = clip
+        Clip.objects.bulk_create(new_clips.values())
+        ids = {clip_key(*values[:3]): values[3] for values in Clip.objects.filter(
+            folder__in=folders.keys(), name__in={c['clip_name'] for c in clips}
+        ).values_list('folder_id', 'name', 'video_format', 'id')}
+
+        # Update the time span of each camera once
+        changed_cameras = {}
+        for clip in new_clips.values():
+            cm = clip.camera
+            cm.start_time = clip.start_time if cm.start_time is None else min(clip.start_time, cm.start_time)
+            cm.end_time = clip.end_time if cm.end_time is None else max(clip.end_time, cm.end_time)
+            changed_cameras[cm.id] = cm
+        Camera.objects.bulk_update(changed_cameras.values(), ['start_time', 'end_time'])
+
+        new_cids = [ids[key] for key in new_clips]
+        for cmid in {clip.camera.id for clip in new_clips.values()}:
+            find_duplicate_overlapping_clips(cmid=cmid, cids=new_cids)
+        update_matching_clips(cids=new_cids)
+
+    return [ids[clip_key(c['fid'], c['clip_name'], c['video_format'])] for c in clips]
+
+
+def find_duplicate_overlapping_clips(cmid: int, cids: List[int] = None) -> None:
+    """
+    Check for duplicates and overlapping clips on a camera.
+    Clips are swept in order of start time, so only clips that overlap in time are compared,
+    and the found relations are saved in bulk.
+    If clips are given, only relations to those clips are checked and only clips close to them are fetched.
 
     :param cmid: Camera id.
-    :param cid: Clip id.
+    :param cids: List of clip ids. If None all clips on the camera are checked.
     :return: None.
     """
     camera = get_camera_by_id(cmid=cmid)
-    clip = get_clip_by_id(cid=cid)
+    assert camera is not None
 
-    for c in camera.clip_set.all():
-        if clip != c:
-            if clip.hash_sum == c.hash_sum:
-                clip.duplicates.add(c)
-            elif clip.start_time <= c.start_time < clip.end_time or \
-                    clip.start_time < c.end_time <= clip.end_time or \
-                    clip.start_time > c.start_time and clip.end_time < c.end_time:
-                clip.overlap.add(c)
+    if cids is None:
+        clips = camera.clip_set.all()[::1]
+        new = {clip.id for clip in clips}
+    else:
+        new_clips = camera.clip_set.filter(id__in=cids)[::1]
+        if not new_clips:
+            return
+        new = {clip.id for clip in new_clips}
+        start_time = min(clip.start_time for clip in new_clips)
+        end_time = max(clip.end_time for clip in new_clips)
+        clips = camera.clip_set.filter(Q(id__in=new) | Q(start_time__lt=end_time, end_time__gt=start_time) |
+                                       Q(hash_sum__in={clip.hash_sum for clip in new_clips}))[::1]
+
+    # Clips with the same hash sum are duplicates
+    duplicates = set()
+    by_hash_sum = {}
+    for clip in clips:
+        if clip.hash_sum is not None:
+            by_hash_sum.setdefault(clip.hash_sum, []).append(clip.id)
+    for group in by_hash_sum.values():
+        for i, a in enumerate(group):
+            for b in group[i + 1:]:
+                if a in new or b in new:
+                    duplicates.add((a, b))
 
+    # Clips that are active when another clip starts overlap with it
+    overlap = set()
+    active = []
+    for clip in sorted(clips, key=lambda c: (c.start_time, c.end_time)):
+        active = [c for c in active if c.end_time > clip.start_time]
+        for c in active:
+            if (c.id in new or clip.id in new) and c.start_time < clip.end_time and \
+                    (clip.hash_sum is None or c.hash_sum != clip.hash_sum):
+                overlap.add((c.id, clip.id))
+        active.append(clip)
 
-def create_hash_sum(folder: Folder, clip: Clip) -> Optional[str] or Optional[None]:
-    file = replace_sep(folder.path + folder.name + "\\" + clip.name + "." + clip.video_format)
-    file_hash = hashlib.sha256()
+    add_clip_relations(through=Clip.duplicates.through, pairs=duplicates)
+    add_clip_relations(through=Clip.overlap.through, pairs=overlap)
 
-    cap = cv2.VideoCapture(file)
-    success, frame = cap.read()
 
-    if success:
-        file_hash.update(frame)
-        cap.release()
-        return file_hash.hexdigest()
-    else:
+def add_clip_relations(through, pairs: set) -> None:
+    """
+    Saves symmetrical relations between clips in bulk, ignoring relations that already exist.
+
+    :param through: The intermediate model of the relation.
+    :param pairs: Set of pairs of clip ids.
+    """
+    if pairs:
+        through.objects.bulk_create([through(from_clip_id=a, to_clip_id=b) for a, b in pairs] +
+                                    [through(from_clip_id=b, to_clip_id=a) for a, b in pairs],
+                                    ignore_conflicts=True)
+
+
+def create_hash_sum(folder: Folder, clip: Clip) -> Optional[str] or Optional[None]:
+    file = replace_sep(folder.path + folder.name + "\\" + clip.name + "." + clip.video_format)
+    try:
+        return probe_video(file_path=file)[4]
+    except FileNotFoundError:
         return None
 
 
@@ -389,7 +518,7 @@ def get_clip_by_id(cid: int) -> Optional[Clip]:
     :return: The specified clip or None.
     """
     try:
-        return Clip.objects.get(id=cid)
+        return Clip.objects.select_related('folder').get(id=cid)
     except Clip.DoesNotExist:
         return None
 
@@ -425,6 +554,69 @@ def delete_clip(cid: int) -> None:
         pass
 
 
+def get_next_clip(cid: int, max_gap: timezone.timedelta) -> Optional[int]:
+    """
+    Gets the clip on the same camera that starts first at most the given gap after the end of the given clip.
+    Looked up as a range in the camera and time index of clips, in one query.
+
+    :param cid: The clip's id.
+    :param max_gap: The longest time between the end of the clip and the start of the next clip.
+    :return: The id of the next clip or None.
+    """
+    clip = Clip.objects.filter(id=cid)
+    end_time = Subquery(clip.values('end_time'))
+    return Clip.objects.filter(camera_id=Subquery(clip.values('camera_id')), start_time__gte=end_time,
+                               start_time__lte=ExpressionWrapper(end_time + max_gap, output_field=DateTimeField())) \
+        .exclude(id=cid).order_by('start_time', 'id').values_list('id', flat=True).first()
+
+
+def get_playback_chain_in_camera(cmid: int, start_time: timezone.datetime, end_time: timezone.datetime,
+                                 max_gap: timezone.timedelta) -> List[Tuple[Clip, Optional[int]]]:
+    """
+    Gets the clips of a camera that overlap the given interval in order of start time, each with the id of the clip
+    that is played after it, as given by get_next_clip.
+    The next clips are either in the interval or start at most the gap after the clips in it, so they are found with
+    two range queries for any number of clips.
+
+    :param cmid: The camera's id.
+    :param start_time: Start of the interval.
+    :param end_time: End of the interval.
+    :param max_gap: The longest time between the end of a clip and the start of the next clip.
+    :return: A list of clips, with only their times, and the ids of their next clips or None.
+    """
+    clips = Clip.objects.filter(camera_id=cmid, start_time__lte=end_time, end_time__gte=start_time) \
+        .only('id', 'start_time', 'end_time').order_by('start_time', 'id')[::1]
+    if not clips:
+        return []
+
+    # Start times and ids of all clips that may be played next, in the order get_next_clip picks them
+    starts = [(clip.start_time, clip.id) for clip in clips]
+    starts += Clip.objects.filter(camera_id=cmid, start_time__gt=end_time,
+                                  start_time__lte=max(clip.end_time for clip in clips) + max_gap) \
+        .order_by('start_time', 'id').values_list('start_time', 'id')[::1]
+
+    chain = []
+    for clip in clips:
+        next_cid = None
+        for start, cid in starts[bisect.bisect_left(starts, (clip.end_time,)):]:
+            if start > clip.end_time + max_gap:
+                break
+            if cid != clip.id:
+                next_cid = cid
+                break
+        chain.append((clip, next_cid))
+    return chain
+
+
+def get_all_unplayable_clips() -> List[Clip]:
+    """
+    Gets all clips that can't be played in the browser.
+
+    :return: A list of clips, with their folders.
+    """
+    return Clip.objects.filter(playable=False).select_related('folder').order_by('id')[::1]
+
+
 def get_all_clips_from_folder(fid: int) -> List[Clip]:
     """
     Gets all clips in the given folder.
@@ -444,15 +636,16 @@ def get_all_clips_from_folder_recursive(fid: int) -> List[Clip]:
     :param fid: The id of the folder.
     :return: A list of all clips.
     """
-    res = get_all_clips_from_folder(fid=fid)
-    for folder in get_subfolders_recursive(fid=fid):
-        res += get_all_clips_from_folder(fid=folder.id)
-    return res
+    f = get_folder_by_id(fid=fid)
+    assert f is not None
+    return Clip.objects.filter(folder__lineage__startswith=f.lineage)[::1]
 
 
 def get_all_clips_matching_filter(fid: int) -> List[Clip]:
     """
     gets all te clips that is part of the project and matches the filter
+    The result is materialized in the filter and only recomputed if the filter has been invalidated.
+
     :param fid: The filter the clips should match
     :return: A list of all clips that is part of the project and matches the filter
     """
@@ -460,13 +653,38 @@ def get_all_clips_matching_filter(fid: int) -> List[Clip]:
     filter = get_filter_by_id(fid)
     assert filter is not None
 
-    clips = get_all_clips_in_project(filter.project.id)
-    res = []
+    if not filter.matching_clips_up_to_date:
+        # Only the flag is written so changes made to the filter meanwhile are kept. It is set before matching,
+        # with the filter read again, so changes made while matching invalidate the matching clips.
+        Filter.objects.filter(id=fid).update(matching_clips_up_to_date=True)
+        filter.refresh_from_db()
+        folders = get_folders_in_project(pid=filter.project.id)
+        clips = Clip.objects.filter(in_subtrees(folders=folders, prefix='folder__'))
+        filter.matching_clips.set(filter.get_matching_clips(clips=clips))
 
-    for clip in clips:
-        if filter.clip_match_filter(clip):
-            res.append(clip)
-    return res
+    return filter.matching_clips.select_related('camera', 'folder').order_by('id')[::1]
+
+
+def update_matching_clips(cids: List[int]) -> None:
+    """
+    Matches the given clips against all filters that has an up to date set of matching clips and
+    whose project contains the clips. Used instead of recomputing the whole set when clips are added or detected.
+    Each filter is only matched against the clips in its project, as the clips may be spread over many folders.
+
+    :param cids: The clips' ids.
+    """
+    clips = Clip.objects.filter(id__in=cids)
+
+    folders = set()
+    for folder in Folder.objects.filter(clip__in=clips).distinct():
+        folders.update(folder.get_ancestor_ids())
+
+    for f in Filter.objects.filter(project__folders__in=folders, matching_clips_up_to_date=True).distinct() \
+            .select_related('project'):
+        project_clips = clips.filter(in_subtrees(folders=f.project.folders.all(), prefix='folder__'))
+        matching = f.get_matching_clips(clips=project_clips).values_list('id', flat=True)[::1]
+        f.matching_clips.remove(*[cid for cid in cids if cid not in matching])
+        f.matching_clips.add(*matching)
 
 
 def get_all_clips_in_project(pid: int) -> List[Clip]:
@@ -475,11 +693,18 @@ def get_all_clips_in_project(pid: int) -> List[Clip]:
     :return: A list of all clips that is part of the project
     """
     folders = get_folders_in_project(pid)
-    clips = []
+    return Clip.objects.filter(in_subtrees(folders=folders, prefix='folder__')).select_related('folder')[::1]
 
-    for folder in folders:
-        clips.extend(get_all_clips_from_folder_recursive(folder.id))
-    return clips
+
+def prefetch_clip_relations(clips: List[Clip]) -> None:
+    """
+    Fetches the object detections, duplicates and overlapping clips of all the given clips at once,
+    so the clips can be serialized without querying the database for each clip.
+
+    :param clips: The clips.
+    """
+    prefetch_related_objects(clips, Prefetch('objectdetection_set', queryset=ObjectDetection.objects.only('clip')),
+                             'duplicates', 'overlap')
 
 
 # --- Camera ---
@@ -524,7 +749,7 @@ def delete_camera(cmid: int) -> None:
 
 
 def get_objects_in_camera(cmid: int, start_time: timezone.datetime = None, end_time: timezone.datetime = None,
-                          object_classes: List[str] = None) -> List[Object]:
+                          object_classes: List[str] = None) -> List[DetectedObject]:
     """
     Returns all objects from the camera meeting the specified requirements.
 
@@ -541,29 +766,30 @@ def get_objects_in_camera(cmid: int, start_time: timezone.datetime = None, end_t
     if end_time is None:
         end_time = cm.end_time
 
-    ods = []
-    for c in cm.clip_set.all():
-        ods += c.objectdetection_set.filter(Q(start_time__gte=start_time, end_time__lte=end_time) |
-                                            Q(start_time__lte=start_time, end_time__gte=start_time) |
-                                            Q(start_time__lte=end_time, end_time__gte=end_time))
-    res = []
-    for od in ods:
-        res += get_objects_in_detection(odid=od.id, start_time=start_time, end_time=end_time,
-                                        object_classes=object_classes)
-    return res
+    ods = ObjectDetection.objects.filter(clip__camera=cm, start_time__lte=end_time, end_time__gte=start_time) \
+        .order_by('clip_id', 'id')
+    return read_timelines(ods=ods, start_time=start_time, end_time=end_time, object_classes=object_classes)
 
 
 def get_all_cameras_in_project(pid: int) -> List[Camera]:
     """
-    Gets all cameras in a project.
+    Gets all cameras in a project, each with the ids of its clips in the project as clip_ids.
+    The cameras and the ids of the clips are fetched with one query each, without making objects of the clips.
 
     :param pid: The id of the project
-    :return: A list of all cameras in the project.
+    :return: A list of all cameras in the project, ordered by id.
     """
-    res = set()
-    for clip in get_all_clips_in_project(pid=pid):
-        res.add(clip.camera)
-    return list(res)
+    folders = get_folders_in_project(pid)
+    clips = Clip.objects.filter(in_subtrees(folders=folders, prefix='folder__'))
+
+    clip_ids = {}
+    for cmid, cid in clips.order_by('camera_id', 'id').values_list('camera_id', 'id'):
+        clip_ids.setdefault(cmid, []).append(cid)
+
+    cameras = Camera.objects.filter(id__in=clips.values('camera_id')).order_by('id')[::1]
+    for camera in cameras:
+        camera.clip_ids = clip_ids.get(camera.id, [])
+    return cameras
 
 
 # --- Filter ---
@@ -629,6 +855,8 @@ def add_included_clip_to_filter(fid: int, cid: int) -> None:
     clip = get_clip_by_id(cid)
     assert clip is not None
     f.included_clips.add(clip)
+    f.matching_clips_up_to_date = False
+    f.save()
 
 
 def add_excluded_clip_to_filter(fid: int, cid: int) -> None:
@@ -643,6 +871,8 @@ def add_excluded_clip_to_filter(fid: int, cid: int) -> None:
     clip = get_clip_by_id(cid)
     assert clip is not None
     f.excluded_clips.add(clip)
+    f.matching_clips_up_to_date = False
+    f.save()
 
 
 def modify_filter(fid: int, start_time: timezone.datetime = None, end_time: timezone.datetime = None,
@@ -701,6 +931,7 @@ def modify_filter(fid: int, start_time: timezone.datetime = None, end_time: time
     if min_frame_rate is not None:
         f.min_frame_rate = min_frame_rate
 
+    f.matching_clips_up_to_date = False
     f.project.last_updated = timezone.datetime.now()
     f.project.save()
     f.save()
@@ -757,6 +988,36 @@ def create_object_detection(cid: int, sample_rate: float, start_time: timezone.d
     return od.id
 
 
+def object_detection_exists(cid: int, sample_rate: float, start_time: timezone.datetime,
+                            end_time: timezone.datetime) -> bool:
+    """
+    Checks if a clip has already been analyzed with the same sample rate and interval.
+
+    :param cid: The id of the clip.
+    :param sample_rate: The sample rate of the object detection.
+    :param start_time: Start time of object detection.
+    :param end_time: End time of object detection.
+    :return: Whether the object detection exists.
+    """
+    return ObjectDetection.objects.filter(clip_id=cid, sample_rate=sample_rate, start_time=start_time,
+                                          end_time=end_time).exists()
+
+
+def get_finer_object_detections(cid: int, sample_rate: float, start_time: timezone.datetime,
+                                end_time: timezone.datetime) -> List[ObjectDetection]:
+    """
+    Gets the object detections of a clip with the same or a finer sample rate that overlap the given interval.
+
+    :param cid: The id of the clip.
+    :param sample_rate: The largest sample rate.
+    :param start_time: Start of the interval.
+    :param end_time: End of the interval.
+    :return: A list of object detections.
+    """
+    return ObjectDetection.objects.filter(clip_id=cid, sample_rate__lte=sample_rate, start_time__lte=end_time,
+                                          end_time__gte=start_time).order_by('id')[::1]
+
+
 def get_object_detection_by_id(odid: int) -> Optional[ObjectDetection]:
     """
     Gets an object detection by id.
@@ -777,7 +1038,9 @@ def delete_object_detection(odid: int) -> None:
     :param odid: The object detection's id.
     """
     try:
-        ObjectDetection.objects.get(id=odid).delete()
+        od = ObjectDetection.objects.get(id=odid)
+        od.delete()
+        update_matching_clips(cids=[od.clip.id])
     except ObjectDetection.DoesNotExist:
         pass
 
@@ -785,6 +1048,7 @@ def delete_object_detection(odid: int) -> None:
 def add_objects_to_detection(odid: int, objects: List[Tuple[str, timezone.datetime]]) -> None:
     """
     Adds found objects to an object detection.
+    All objects are validated and saved at once.
 
     :param odid: The object detection's id.
     :param objects: List of tuples with classes and time of objects found in detection.
@@ -792,14 +1056,53 @@ def add_objects_to_detection(odid: int, objects: List[Tuple[str, timezone.dateti
     """
     od = get_object_detection_by_id(odid=odid)
     assert od is not None
-    for obj_cls, time in objects:
-        object_class = ObjectClass.objects.get_or_create(object_class=obj_cls)[0]
-        Object.objects.create(object_detection=od, object_class=object_class, time=time)
+    if not objects:
+        return
+
+    with transaction.atomic():
+        object_classes = get_object_classes_by_name(names={obj_cls for obj_cls, _ in objects})
+
+        res = []
+        for obj_cls, time in objects:
+            obj = Object(object_detection=od, object_class=object_classes[obj_cls], time=time)
+            obj.full_clean(exclude=['object_detection', 'object_class'])
+            res.append(obj)
+        Object.objects.bulk_create(res)
+
+        timeline = ObjectDetection.objects.select_for_update().values_list('timeline', flat=True).get(id=od.id)
+        ObjectDetection.objects.filter(id=od.id).update(timeline=merge_timeline(
+            timeline=timeline, offsets=[(obj.time - od.start_time) // timezone.timedelta(microseconds=1) for obj in res],
+            object_classes=[obj.object_class_id for obj in res]))
+
+        added = Counter(obj.object_class_id for obj in res)
+        counts = ObjectCount.objects.select_for_update().filter(object_detection=od, object_class_id__in=list(added))[::1]
+        for count in counts:
+            count.count += added.pop(count.object_class_id)
+        ObjectCount.objects.bulk_update(counts, ['count'])
+        ObjectCount.objects.bulk_create([ObjectCount(object_detection=od, object_class_id=ocid, count=n)
+                                         for ocid, n in added.items()])
+
+        update_matching_clips(cids=[od.clip_id])
+
+
+def get_object_classes_by_name(names: set) -> Dict[str, ObjectClass]:
+    """
+    Gets object classes by name and creates the ones not in the database.
+
+    :param names: Set of names of object classes.
+    :return: A dictionary from name to object class.
+    """
+    res = {oc.object_class: oc for oc in ObjectClass.objects.filter(object_class__in=names)}
+    missing = names - res.keys()
+    if missing:
+        ObjectClass.objects.bulk_create([ObjectClass(object_class=name) for name in missing], ignore_conflicts=True)
+        res.update({oc.object_class: oc for oc in ObjectClass.objects.filter(object_class__in=missing)})
+    return res
 
 
 def get_objects_in_detection(odid: int, start_time: timezone.datetime = None,
                              end_time: timezone.datetime = None,
-                             object_classes: List[str] = None) -> List[Object]:
+                             object_classes: List[str] = None) -> List[DetectedObject]:
     """
     Returns all objects from object detection meeting the specified requirements.
 
@@ -811,15 +1114,62 @@ def get_objects_in_detection(odid: int, start_time: timezone.datetime = None,
     """
     od = get_object_detection_by_id(odid=odid)
     assert od is not None
-    if start_time is None:
-        start_time = od.start_time
-    if end_time is None:
-        end_time = od.end_time
-    if object_classes is None:
-        return od.object_set.filter(time__gte=start_time, time__lte=end_time)[::1]
-    else:
-        return od.object_set.filter(time__gte=start_time, time__lte=end_time,
-                                    object_class__object_class__in=object_classes)[::1]
+    return read_timelines(ods=[od], start_time=start_time, end_time=end_time, object_classes=object_classes)
+
+
+def get_object_counts_in_clips(cids: List[int]) -> Dict[int, Tuple[float, Dict[str, int]]]:
+    """
+    Gets the sample rate and the number of objects of each class for the object detection with the lowest
+    sample rate of each clip.
+
+    :param cids: The clips' ids.
+    :return: A dictionary from clip id to a tuple (sample rate, dictionary from object class to number of objects).
+             Clips without object detections are left out.
+    """
+    rows = ObjectDetection.objects.filter(clip_id__in=cids).order_by('clip_id', 'sample_rate', 'id') \
+        .values_list('clip_id', 'id', 'sample_rate', 'objectcount__object_class__object_class', 'objectcount__count')
+
+    res = {}
+    chosen = {}
+    for cid, odid, sample_rate, object_class, count in rows:
+        if cid not in chosen:
+            chosen[cid] = odid
+            res[cid] = (sample_rate, {})
+        if chosen[cid] == odid and object_class is not None:
+            res[cid][1][object_class] = count
+    return res
+
+
+def read_timelines(ods: Iterable[ObjectDetection], start_time: timezone.datetime = None,
+                   end_time: timezone.datetime = None, object_classes: List[str] = None) -> List[DetectedObject]:
+    """
+    Reads the objects meeting the specified requirements from the timelines of object detections.
+
+    :param ods: The object detections.
+    :param start_time: A minimum time for objects.
+    :param end_time: A maximum time for objects.
+    :param object_classes: A list of the interesting object classes.
+    :return: A list of objects, ordered by object detection and time.
+    """
+    timelines = [(od, od.get_timeline()) for od in ods]
+    ocids = np.unique(np.concatenate([timeline['object_class'] for _, timeline in timelines] or [[]]))
+    names = ObjectClass.objects.filter(id__in=ocids.tolist())
+    if object_classes is not None:
+        names = names.filter(object_class__in=object_classes)
+    names = dict(names.values_list('id', 'object_class'))
+    wanted = np.array(list(names.keys()), dtype=np.uint32)
+
+    res = []
+    for od, timeline in timelines:
+        matching = np.isin(timeline['object_class'], wanted)
+        if start_time is not None:
+            matching &= timeline['offset'] >= (start_time - od.start_time) // timezone.timedelta(microseconds=1)
+        if end_time is not None:
+            matching &= timeline['offset'] <= (end_time - od.start_time) // timezone.timedelta(microseconds=1)
+        for offset, ocid, count in timeline[matching].tolist():
+            res += [DetectedObject(object_class=names[ocid],
+                                   time=od.start_time + timezone.timedelta(microseconds=offset))] * count
+    return res
 
 
 # --- Progress ---
@@ -874,6 +1224,69 @@ def delete_progress(pid: int) -> None:
         pass
 
 
+# --- Detection job ---
+
+def create_detection_jobs(pid: int, cids: List[int], sample_rate: float, start_time: Optional[timezone.datetime],
+                          end_time: Optional[timezone.datetime]) -> None:
+    """
+    Creates one pending object detection job for each clip.
+
+    :param pid: The id of the progress of the request.
+    :param cids: List of clip ids.
+    :param sample_rate: The sample rate of the object detection.
+    :param start_time: Start time of object detection or None for the start of the clips.
+    :param end_time: End time of object detection or None for the end of the clips.
+    """
+    jobs = [DetectionJob(progress_id=pid, clip_id=cid, sample_rate=sample_rate, start_time=start_time,
+                         end_time=end_time) for cid in cids]
+    for job in jobs:
+        job.full_clean(exclude=['progress', 'clip'])
+    DetectionJob.objects.bulk_create(jobs)
+
+
+def take_detection_job(pid: int) -> Optional[DetectionJob]:
+    """
+    Takes the oldest pending object detection job in a request and marks it as running.
+    A job is only taken if it is still pending when marked, so no two schedulers run the same job.
+
+    :param pid: The id of the progress of the request.
+    :return: The job, with its clip, or None if there are no pending jobs.
+    """
+    while True:
+        job = DetectionJob.objects.filter(progress_id=pid, state=DetectionJob.PENDING) \
+            .select_related('clip__folder').order_by('id').first()
+        if job is None:
+            return None
+        if DetectionJob.objects.filter(id=job.id, state=DetectionJob.PENDING).update(state=DetectionJob.RUNNING) == 1:
+            job.state = DetectionJob.RUNNING
+            return job
+
+
+def finish_detection_job(jid: int, failed: bool = False) -> None:
+    """
+    Marks an object detection job as done or failed and updates the progress of its request.
+    Does nothing if the job has been deleted.
+
+    :param jid: The id of the job.
+    :param failed: Whether the job failed.
+    """
+    job = DetectionJob.objects.filter(id=jid).first()
+    if job is not None:
+        DetectionJob.objects.filter(id=jid).update(state=DetectionJob.FAILED if failed else DetectionJob.DONE)
+        Progress.objects.filter(id=job.progress_id).update(current=F('current') + 1)
+
+
+def reset_detection_jobs() -> List[int]:
+    """
+    Marks running object detection jobs as pending again, used when no jobs can be running.
+
+    :return: The ids of the progress of all requests with pending jobs, oldest first.
+    """
+    DetectionJob.objects.filter(state=DetectionJob.RUNNING).update(state=DetectionJob.PENDING)
+    return DetectionJob.objects.filter(state=DetectionJob.PENDING).order_by('progress_id') \
+        .values_list('progress_id', flat=True).distinct()[::1]
+
+
 # --- Resolution ---
 
 def get_all_resolutions_in_project(pid: int) -> List[Resolution]:
@@ -930,6 +1343,8 @@ def create_area(latitude: Decimal, longitude: Decimal, radius: int, fid: int) ->
 
     area = Area.objects.get_or_create(latitude=lat, longitude=lon, radius=radius)[0]
     f.areas.add(area)
+    f.matching_clips_up_to_date = False
+    f.save()
 
     return area.id
 
@@ -947,6 +1362,7 @@ def delete_area(aid: int, fid: int) -> int:
 
     try:
         area = Area.objects.get(id=aid)
+        Filter.objects.filter(areas=area).update(matching_clips_up_to_date=False)
         f.areas.get(id=aid).delete()
     except Area.DoesNotExist:
         pass
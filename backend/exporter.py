@@ -1,6 +1,17 @@
-from django.http import HttpResponse, JsonResponse
-from zipfile import ZipFile
-import io
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import connection
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+from typing import Iterator
+import logging
+import shutil
+import tarfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 
 from .database_wrapper import *
 from .communication_utils import *
@@ -8,6 +19,12 @@ from .communication_utils import *
 
 # This file represents the backend Exporter.
 
+# Number of bytes read from a clip at a time when exporting
+CHUNK_SIZE = 1024 * 1024
+
+# Linux ioctl that clones a file by sharing its data (a reflink)
+FICLONE = 0x40049409
+
 def export_filter(fid: int) -> HttpResponse:
     """
     Exports a filter to JSON.
@@ -43,10 +60,10 @@ def export_filter(fid: int) -> HttpResponse:
 
 def export_clips(fid: int) -> HttpResponse:
     """
-    Compresses all filtered clips and exports them.
+    Archives all filtered clips and streams the archive while it is created.
 
     :param fid: Filter id.
-    :return: Compressed clips.
+    :return: Archived clips.
     """
     f = get_filter_by_id(fid=fid)
     if f is None:
@@ -54,19 +71,179 @@ def export_clips(fid: int) -> HttpResponse:
         response.status_code = 204
         return response
 
-    # Create zip archive
-    buffer = io.BytesIO()
-    res = ZipFile(buffer, 'w')
-
-    clips = get_all_clips_matching_filter(fid=fid)
-    for clip in clips:
-        res.write(str(clip), arcname=get_project_path(clip=clip))  # clip
-        res.write(str(clip) + ".txt", arcname=get_project_path(clip=clip) + ".txt")  # metadata
-
-    res.close()
+    files = []
+    for clip in get_all_clips_matching_filter(fid=fid):
+        files.append((str(clip), get_project_path(clip=clip)))  # clip
+        files.append((str(clip) + ".txt", get_project_path(clip=clip) + ".txt"))  # metadata
 
     # Create response
-    response = HttpResponse(buffer.getvalue())
+    response = StreamingHttpResponse(stream_zip(files=files))
     response['Content-Type'] = 'application/x-zip-compressed'
     response['Content-Disposition'] = 'attachment; filename={0}_clips.zip'.format(f.project.name)
     return response
+
+
+def export_clips_to_path(data: dict) -> (int, dict):
+    """
+    Exports all filtered clips to a directory or a tar archive on the server, in the background.
+    Clips in a directory are linked or cloned when the file system allows it, see copy_file.
+
+    :param data: Filter id, path of a new or empty directory or of a new tar archive (.tar)
+                 and whether clips may be hard linked.
+    :return: Status code, progress id.
+    """
+    try:
+        fid = data[FILTER_ID]
+        target = data[FILE_PATH]
+    except KeyError:
+        return 400, {}  # Bad request
+
+    f = get_filter_by_id(fid=fid)
+    if f is None:
+        return 204, {}  # No content
+
+    if os.path.isfile(target) or os.path.isdir(target) and os.listdir(target):
+        return 400, {}  # Target is not new or empty
+
+    files = []
+    for clip in get_all_clips_matching_filter(fid=fid):
+        files.append((str(clip), get_project_path(clip=clip)))  # clip
+        files.append((str(clip) + ".txt", get_project_path(clip=clip) + ".txt"))  # metadata
+
+    # Create a progress object to keep track of the export.
+    pid = create_progress(total=len(files))
+
+    run_in_background(export_files, files=files, target=target, pid=pid, hard_link=bool(data.get(HARD_LINK, False)))
+
+    return 200, {PROGRESS_ID: pid}
+
+
+def export_files(files: List[Tuple[str, str]], target: str, pid: int, hard_link: bool = False) -> None:
+    """
+    Exports files to a directory or a tar archive (if the target ends with .tar) and updates the progress
+    after each file. Files that can't be exported are logged and skipped.
+
+    :param files: List of tuples with the path of a file and its path in the export.
+    :param target: Path of the directory or tar archive.
+    :param pid: The id of the progress.
+    :param hard_link: Whether files exported to a directory may be hard linked.
+    """
+    if target.endswith('.tar'):
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        with tarfile.open(target, 'w') as archive:
+            for path, arcname in files:
+                try:
+                    archive.add(path, arcname=arcname)
+                except OSError as e:
+                    logging.error(msg="Could not export {0}: {1!r}".format(path, e))
+                update_progress(pid=pid)
+    else:
+        for path, arcname in files:
+            dst = os.path.join(target, arcname)
+            try:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                copy_file(src=path, dst=dst, hard_link=hard_link)
+            except OSError as e:
+                logging.error(msg="Could not export {0}: {1!r}".format(path, e))
+            update_progress(pid=pid)
+
+
+def run_in_background(target, **kwargs) -> None:
+    """
+    Runs a function in a new thread, which closes its database connection when the function is done.
+
+    :param target: The function.
+    :param kwargs: Keyword arguments to the function.
+    """
+    def run():
+        try:
+            target(**kwargs)
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def copy_file(src: str, dst: str, hard_link: bool = False) -> None:
+    """
+    Copies a file as cheaply as the file system allows. Tries, in order: a hard link (if allowed),
+    a reflink which shares the data until either file is changed, copy_file_range which copies inside the kernel
+    and lastly shutil.copyfile, which uses sendfile where available.
+
+    :param src: Path of the file.
+    :param dst: Path of the copy.
+    :param hard_link: Whether the copy may be a hard link to the file.
+    """
+    if hard_link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass  # E.g. on another file system
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass  # Not supported by the file system
+
+        try:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            return
+        except (AttributeError, OSError):
+            pass  # Not supported by the platform or file systems
+
+    shutil.copyfile(src, dst)
+
+
+def stream_zip(files: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    Creates a zip archive piece by piece, so only a chunk of a file is kept in memory at a time.
+    Files are stored without compression since clips are already compressed. Zip64 is used when needed.
+
+    :param files: List of tuples with the path of a file and its name in the archive.
+    :return: An iterator of the archive's data.
+    """
+    stream = ZipStream()
+    with ZipFile(stream, 'w', compression=ZIP_STORED) as archive:
+        for path, arcname in files:
+            with open(path, 'rb') as src, archive.open(ZipInfo.from_file(path, arcname=arcname), 'w') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    dst.write(chunk)
+                    yield stream.take()
+            yield stream.take()
+    yield stream.take()
+
+
+class ZipStream:
+    """
+    A write only stream for a ZipFile, from which the written data is taken piece by piece.
+    As the stream can't seek, sizes and checksums are written after each file.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        """
+        Takes the data written since the last call.
+
+        :return: The data.
+        """
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
@@ -1,12 +1,16 @@
-import re, logging
+import re, logging, time
 import pytz
+import django
+from concurrent.futures import ProcessPoolExecutor
 from django.conf import settings
-import cv2
 import os
 
 from .database_wrapper import *
 from .communication_utils import *
 from .serialization import *
+from .video_probe import probe_video
+from .thumbnailer import get_sprite_generator, needs_sprite
+from .proxy_cache import get_proxy_generator
 
 # This file represents the backend File Manager.
 
@@ -101,11 +105,18 @@ def remove_folder(data: dict) -> (int, dict):
     return get_source_folders(data=data)
 
 
-def build_file_structure(file_path: str) -> None:
+def build_file_structure(file_path: str, processes: int = None, batch_size: int = 100,
+                         checkpoint: str = None) -> None:
     """
     Traverses the user's file system from the given folder downwards while adding all folder and clips to the database.
 
+    The folders are added while walking the file system. The clips are then probed in a process pool and written to the
+    database in batches, see add_clips.
+
     :param file_path: Absolute path to folder in file system.
+    :param processes: Number of processes used to probe clips. Defaults to the number of CPUs.
+    :param batch_size: Number of clips written to the database in each transaction.
+    :param checkpoint: Path to a checkpoint file which makes it possible to resume an interrupted run.
     """
 
     # Get absolute path
@@ -125,31 +136,124 @@ def build_file_structure(file_path: str) -> None:
     parent_id = create_root_folder(path=path, name=name)
 
     # Traverse all subfolders and add them to the database.
-    traverse_subfolders(path=file_path, parent_id=parent_id)
+    clips = traverse_subfolders(path=file_path, parent_id=parent_id)
+
+    # Add all found clips to the database.
+    add_clips(clips=clips, processes=processes, batch_size=batch_size, checkpoint=checkpoint)
 
 
-def traverse_subfolders(path: str, parent_id: int) -> None:
+def traverse_subfolders(path: str, parent_id: int) -> List[Tuple[str, int, str, str]]:
     """
     Recursive helper to build_file_structure.
+    Adds all folders to the database and collects the clips in them.
 
     :param path: The absolute path to a folder.
     :param parent_id: The parent folder's id.
+    :return: List of tuples with the clips' file path, folder id, name and format.
     """
+    clips = []
     for entry in os.scandir(path):  # Iterate over all entries in the folder.
         file_path = os.path.join(path, entry.name)  # Save file path to current entry.
         if entry.is_dir():
             fid = create_subfolder(parent_fid=parent_id, name=entry.name)
-            traverse_subfolders(path=file_path, parent_id=fid)  # Traverse subfolders of entry.
+            clips += traverse_subfolders(path=file_path, parent_id=fid)  # Traverse subfolders of entry.
         elif entry.is_file():
-            is_clip, name, suffix = analyze_file(entry.name)
+            try:
+                is_clip, name, suffix = analyze_file(entry.name)
+            except ValueError:
+                continue  # File without suffix.
             if is_clip:
-                try:
-                    create_clip(**get_clip_info(file_path=file_path, folder_id=parent_id, name=name,
-                                                video_format=suffix))
-                except ValueError:
-                    logging.info(msg="Invalid metadata found for: " + file_path)
-                except FileNotFoundError:
-                    logging.info(msg="No metadata found for: " + file_path)
+                clips.append((file_path, parent_id, name, suffix))
+    return clips
+
+
+def add_clips(clips: List[Tuple[str, int, str, str]], processes: int = None, batch_size: int = 100,
+              checkpoint: str = None) -> None:
+    """
+    Probes the given clips in a process pool and writes them to the database in batches.
+
+    Every finished batch is appended to the checkpoint file (if given) and clips already in the checkpoint file are
+    skipped. The checkpoint file is removed when all clips have been added.
+
+    :param clips: List of tuples with the clips' file path, folder id, name and format.
+    :param processes: Number of processes used to probe clips. Defaults to the number of CPUs.
+    :param batch_size: Number of clips written to the database in each transaction.
+    :param checkpoint: Path to a checkpoint file.
+    """
+    done = read_checkpoint(checkpoint=checkpoint)
+    clips = [clip for clip in clips if os.path.abspath(clip[0]) not in done]
+
+    start = time.time()
+    added = 0
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as pool:
+        batch = []
+        for file_path, clip_info in zip((clip[0] for clip in clips),
+                                        pool.map(probe_clip, clips, chunksize=max(1, batch_size // 10))):
+            batch.append((file_path, clip_info))
+            if len(batch) >= batch_size:
+                added += write_clips(batch=batch, checkpoint=checkpoint)
+                batch = []
+                print("Added {0}/{1} clips ({2:.1f} clips/s)".format(added, len(clips), added / (time.time() - start)))
+        added += write_clips(batch=batch, checkpoint=checkpoint)
+
+    print("Added {0} clips in {1:.1f} s".format(added, time.time() - start))
+
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        os.remove(checkpoint)
+
+
+def probe_clip(clip: Tuple[str, int, str, str]) -> Optional[dict]:
+    """
+    Finds all information related to a clip.
+    Runs in a worker process and should therefore not use the database.
+
+    :param clip: Tuple with the clip's file path, folder id, name and format.
+    :return: A dictionary that can be used as input to create_clip or None if the clip is invalid.
+    """
+    file_path, folder_id, name, video_format = clip
+    try:
+        clip_info = get_clip_info(file_path=file_path, folder_id=folder_id, name=name, video_format=video_format)
+    except ValueError:
+        logging.info(msg="Invalid metadata found for: " + file_path)
+        return None
+    except FileNotFoundError:
+        logging.info(msg="No metadata found for: " + file_path)
+        return None
+    if clip_info['hash_sum'] is None:
+        logging.info(msg="Could not read: " + file_path)
+        return None
+    return clip_info
+
+
+def write_clips(batch: List[Tuple[str, Optional[dict]]], checkpoint: str = None) -> int:
+    """
+    Writes a batch of probed clips to the database in one transaction and adds them to the checkpoint file.
+
+    :param batch: List of tuples with the clips' file path and the result of probe_clip.
+    :param checkpoint: Path to a checkpoint file.
+    :return: Number of clips written to the database.
+    """
+    clip_infos = [clip_info for file_path, clip_info in batch if clip_info is not None]
+    create_clips_bulk(clips=clip_infos)
+
+    if checkpoint is not None:
+        with open(file=checkpoint, mode='a') as f:
+            f.writelines(os.path.abspath(file_path) + '\n' for file_path, clip_info in batch)
+
+    return len(clip_infos)
+
+
+def read_checkpoint(checkpoint: str = None) -> set:
+    """
+    Reads the file paths of all clips in a checkpoint file.
+
+    :param checkpoint: Path to a checkpoint file.
+    :return: A set of absolute file paths or an empty set if there is no checkpoint file.
+    """
+    if checkpoint is None or not os.path.isfile(checkpoint):
+        return set()
+    with open(file=checkpoint, mode='r') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
 
 
 def analyze_file(file: str) -> (bool, str, str):
@@ -187,58 +291,48 @@ def get_clips(data: dict) -> (int, dict):
     except AssertionError:
         return 204, {}  # No content
 
+    # Make sprites of the clips ahead of time since the project is being viewed
+    get_sprite_generator().request(paths=[path for path in map(str, clips_in_project) if needs_sprite(src=path)])
+
+    prefetch_clip_relations(clips=clips_in_project)
     res = modify_clip_objectdetection_set({CLIPS: serialize(clips_in_project)})
+    add_proxy_availability(data=res, clips=clips_in_project)
 
     return 200, os_aware(res)
 
 
+def add_proxy_availability(data: dict, clips: List[Clip]) -> dict:
+    """
+    Adds to all clips whether a proxy of the clip exists. Clips that can't be played in the browser
+    can still be viewed, but the first view of a clip without a proxy waits for it to be generated.
+
+    :param data: dict with clips.
+    :param clips: The clips.
+    :return: dict with proxy_available
+    """
+    cache = get_proxy_generator().cache
+    available = {clip.id: cache.contains(src=str(clip)) for clip in clips if not clip.playable}
+    for clip in data[CLIPS]:
+        clip['proxy_available'] = available.get(clip['id'], False)
+
+    return data
+
+
 def modify_clip_objectdetection_set(data: dict) -> dict:
     """
-    Modifies all clips objectdetection_set.
+    Modifies all clips objectdetection_set to the sample rate and number of objects of each class
+    of the object detection with the lowest sample rate.
 
     :param data: dict with clips.
     :return: dict with modified objectdetection_set
     """
+    counts = get_object_counts_in_clips(cids=[clip['id'] for clip in data[CLIPS]])
     for clip in data[CLIPS]:
-        lowest_rate = None
-        obj_det = None
-        obj_set = {}
-
-        # find the object detection with lowest rate
-        for odid in clip['objectdetection_set']:
-            od = get_object_detection_by_id(odid=odid)
-            if obj_det is None and lowest_rate is None:
-                obj_det = od
-                lowest_rate = od.sample_rate
-            if od.sample_rate < lowest_rate:
-                obj_det = od
-                lowest_rate = od.sample_rate
-
-        if obj_det is None:
-            clip['objectdetection_set'] = None
+        if clip['id'] in counts:
+            rate, objects = counts[clip['id']]
+            clip['objectdetection_set'] = {'rate': rate, 'objects': objects}
         else:
-            # find all objects, their class, and amount of that class
-            car_count = 0
-            person_count = 0
-            bicycle_count = 0
-
-            for obj in get_objects_in_detection(odid=obj_det.id):
-                oc = obj.object_class.object_class
-                if oc == 'car':
-                    car_count += 1
-                elif oc == 'person':
-                    person_count += 1
-                elif oc == 'bicycle':
-                    bicycle_count += 1
-
-            if car_count > 0:
-                obj_set['car'] = car_count
-            if person_count > 0:
-                obj_set['person'] = person_count
-            if bicycle_count > 0:
-                obj_set['bicycle'] = bicycle_count
-
-            clip['objectdetection_set'] = {'rate': lowest_rate, 'objects': obj_set}
+            clip['objectdetection_set'] = None
 
     return data
 
@@ -266,6 +360,7 @@ def get_clip_info(file_path: str, folder_id: int, name: str, video_format: str)
     """
     Finds all information related to the clip and returns a dictionary that can be used as input to the
     function create_clip in the database wrapper.
+    The clip is only opened once to get both its details and its hash sum.
 
     :param file_path: The absolute path to a clip.
     :param folder_id: The clip's parent folder's id.
@@ -274,11 +369,11 @@ def get_clip_info(file_path: str, folder_id: int, name: str, video_format: str)
     :return: A dictionary with the valid parameters for create_clip in database_wrapper.py.
     """
     latitude, longitude, start_time, camera_name = parse_metadata(file_path=file_path)
-    duration, frame_rate, width, height = get_clip_details(file_path=file_path)
-    end_time = start_time + timezone.timedelta(seconds=duration)
+    duration, frame_rate, width, height, hash_sum = probe_video(file_path=file_path)
+    end_time = start_time + timezone.timedelta(seconds=int(duration))
     return {'fid': folder_id, 'clip_name': name, 'video_format': video_format, 'start_time': start_time,
             'end_time': end_time, 'latitude': latitude, 'longitude': longitude, 'width': width, 'height': height,
-            'frame_rate': frame_rate, 'camera_name': camera_name}
+            'frame_rate': frame_rate, 'camera_name': camera_name, 'hash_sum': hash_sum}
 
 
 def parse_metadata(file_path: str) -> (Decimal, Decimal, timezone.datetime, str):
@@ -330,23 +425,3 @@ def parse_metadata(file_path: str) -> (Decimal, Decimal, timezone.datetime, str)
         raise wrong_format_error
 
     return lat, lon, start_time, camera_name
-
-
-def get_clip_details(file_path: str) -> (int, float, int, int):
-    """
-    Gets a clip's duration, frame rate and dimensions (width, height).
-
-    :param file_path: The absolute path to a clip.
-    :return: Duration in seconds, frame rate in FPS and width and height in pixels.
-             This is given in the form of a tuple (duration, frame rate, width, height).
-    """
-    # Check if clip exists
-    if not os.path.isfile(path=file_path):
-        raise FileNotFoundError
-
-    cap = cv2.VideoCapture(file_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    return int(frames / fps), fps, width, height
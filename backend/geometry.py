@@ -0,0 +1,61 @@
+from typing import Tuple
+
+import numpy as np
+
+# This file represents the backend Geometry.
+# Positions are given in decimal degrees and distances in meters, on a spherical earth.
+# The functions take scalars or arrays and broadcast them like NumPy does.
+
+EARTH_RADIUS = 6371008.8  # Mean radius in meters
+
+
+def haversine(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """
+    Gets the great-circle distance between positions.
+
+    :param lon1: Longitude of the first positions.
+    :param lat1: Latitude of the first positions.
+    :param lon2: Longitude of the second positions.
+    :param lat2: Latitude of the second positions.
+    :return: The distances in meters.
+    """
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(x, dtype=float)) for x in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_areas(longitudes, latitudes, areas) -> np.ndarray:
+    """
+    Checks which positions are within which circular areas.
+
+    :param longitudes: Longitude of the positions.
+    :param latitudes: Latitude of the positions.
+    :param areas: Rows of longitude, latitude and radius in meters of the areas.
+    :return: A boolean matrix with a row per position and a column per area.
+    """
+    areas = np.asarray(areas, dtype=float).reshape(-1, 3)
+    longitudes = np.asarray(longitudes, dtype=float).reshape(-1, 1)
+    latitudes = np.asarray(latitudes, dtype=float).reshape(-1, 1)
+    return haversine(longitudes, latitudes, areas[:, 0], areas[:, 1]) <= areas[:, 2]
+
+
+def bounding_box(longitude: float, latitude: float, radius: float) -> Tuple[float, float, float, float]:
+    """
+    Gets the smallest box of longitudes and latitudes containing a circular area.
+    Areas reaching a pole or the antimeridian get boxes spanning all longitudes.
+
+    :param longitude: Longitude of the center of the area.
+    :param latitude: Latitude of the center of the area.
+    :param radius: Radius of the area in meters.
+    :return: Smallest longitude, smallest latitude, largest longitude and largest latitude.
+    """
+    angle = radius / EARTH_RADIUS
+    min_lat = latitude - np.degrees(angle)
+    max_lat = latitude + np.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return -180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0)
+
+    dlon = np.degrees(np.arcsin(min(np.sin(angle) / np.cos(np.radians(latitude)), 1.0)))
+    if longitude - dlon < -180 or longitude + dlon > 180:
+        return -180.0, min_lat, 180.0, max_lat
+    return longitude - dlon, min_lat, longitude + dlon, max_lat
@@ -0,0 +1,51 @@
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from backend.geometry import within_areas
+
+
+def decimal_is_within(area: tuple, longitude: Decimal, latitude: Decimal) -> bool:
+    """
+    The check areas used to do, one camera and area at a time in Decimal with a fixed scale per degree.
+    """
+    lon, lat, radius = area
+    return radius >= Decimal.sqrt((Decimal(57475) * (lon - longitude)) ** 2 + (Decimal(111395) * (lat - latitude)) ** 2)
+
+
+class Command(BaseCommand):
+    help = 'Times checking which cameras are within which areas in Decimal and in NumPy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cameras', type=int, default=10000, help='Number of random cameras')
+        parser.add_argument('--areas', type=int, default=10, help='Number of random areas')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random positions')
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs['seed'])
+
+        def position():
+            return (Decimal(rng.uniform(16.0, 19.0)).quantize(Decimal('.00000001')),
+                    Decimal(rng.uniform(58.0, 60.0)).quantize(Decimal('.00000001')))
+
+        cameras = [position() for _ in range(kwargs['cameras'])]
+        areas = [position() + (rng.randint(100, 50000),) for _ in range(kwargs['areas'])]
+
+        start = time.perf_counter()
+        expected = [[decimal_is_within(area, lon, lat) for area in areas] for lon, lat in cameras]
+        decimal_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        within = within_areas(longitudes=[lon for lon, _ in cameras], latitudes=[lat for _, lat in cameras],
+                              areas=areas)
+        numpy_time = time.perf_counter() - start
+
+        differences = int((np.array(expected, dtype=bool).reshape(within.shape) != within).sum())
+        self.stdout.write("{0} cameras x {1} areas".format(len(cameras), len(areas)))
+        self.stdout.write("Decimal: {0:.3f} s".format(decimal_time))
+        self.stdout.write("NumPy:   {0:.3f} s ({1:.0f}x faster)".format(numpy_time, decimal_time / numpy_time))
+        self.stdout.write("Differing checks: {0} (the Decimal scale is only right near 59 degrees latitude)"
+                          .format(differences))
@@ -0,0 +1,103 @@
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from backend.database_wrapper import create_root_folder
+from backend.models import Camera, Clip, Object, ObjectClass, ObjectCount, ObjectDetection, Resolution, merge_timeline
+
+# The tables holding copies of the found objects
+OBJECT_TABLES = [
+    ("Object rows", Object),
+    ("Timelines", ObjectDetection),
+    ("Object counts", ObjectCount),
+]
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Measures the space the found objects take as Object rows, timelines and object counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--detections', type=int, default=10000, help='Number of synthetic object detections')
+        parser.add_argument('--seconds', type=int, default=60, help='Length of each object detection in seconds')
+        parser.add_argument('--objects', type=int, default=3, help='Largest number of objects in each second')
+        parser.add_argument('--classes', type=int, default=10, help='Number of object classes')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random objects')
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("Table sizes are read from the dbstat table of SQLite.")
+            return
+
+        # Work on a new test database so the real one is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            start = time.perf_counter()
+            self.populate(detections=kwargs['detections'], seconds=kwargs['seconds'], objects=kwargs['objects'],
+                          classes=kwargs['classes'], rng=random.Random(kwargs['seed']))
+            objects = Object.objects.count()
+            self.stdout.write("Created {0} object detections with {1} objects in {2:.0f} s".format(
+                ObjectDetection.objects.count(), objects, time.perf_counter() - start))
+            self.write_sizes(objects=objects)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def populate(detections: int, seconds: int, objects: int, classes: int, rng: random.Random) -> None:
+        """
+        Creates object detections of a clip each, with up to the given number of objects found each second,
+        and stores the objects the way add_objects_to_detection does.
+        """
+        start_time = timezone.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        length = timezone.timedelta(seconds=seconds)
+        fid = create_root_folder(path='/benchmark/', name='clips')
+        resolution = Resolution.objects.create(width=640, height=480)
+        camera = Camera.objects.create(name='Camera', latitude=0, longitude=0)
+        ObjectClass.objects.bulk_create(ObjectClass(object_class='class{0}'.format(i)) for i in range(classes))
+        ocids = ObjectClass.objects.values_list('id', flat=True)[::1]
+
+        for first in range(0, detections, BATCH_SIZE):
+            n = min(BATCH_SIZE, detections - first)
+            Clip.objects.bulk_create(
+                Clip(folder_id=fid, name='clip{0}'.format(i), video_format='mp4', camera=camera,
+                     start_time=start_time + i * length, end_time=start_time + (i + 1) * length,
+                     resolution=resolution, frame_rate=25.0, playable=True) for i in range(first, first + n))
+            clips = Clip.objects.order_by('-id')[:n].values_list('id', 'start_time', 'end_time')[::-1]
+
+            found = [[(sec, rng.choice(ocids)) for sec in range(seconds) for _ in range(rng.randint(0, objects))]
+                     for _ in clips]
+            ObjectDetection.objects.bulk_create(
+                ObjectDetection(clip_id=cid, sample_rate=1.0, start_time=st, end_time=et,
+                                timeline=merge_timeline(timeline=b'', offsets=[sec * 10 ** 6 for sec, _ in objs],
+                                                        object_classes=[ocid for _, ocid in objs]))
+                for (cid, st, et), objs in zip(clips, found))
+            ods = ObjectDetection.objects.order_by('-id')[:n].values_list('id', 'start_time')[::-1]
+
+            Object.objects.bulk_create(
+                Object(object_detection_id=odid, object_class_id=ocid, time=st + timezone.timedelta(seconds=sec))
+                for (odid, st), objs in zip(ods, found) for sec, ocid in objs)
+            ObjectCount.objects.bulk_create(
+                ObjectCount(object_detection_id=odid, object_class_id=ocid, count=count)
+                for (odid, _), objs in zip(ods, found) for ocid, count in Counter(ocid for _, ocid in objs).items())
+
+    def write_sizes(self, objects: int) -> None:
+        """
+        Writes the space taken by each copy of the objects, with the indexes of its table.
+        Only the timeline column is counted for object detections.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat AS s JOIN sqlite_master AS m '
+                           'ON s.name = m.name GROUP BY m.tbl_name')
+            sizes = dict(cursor.fetchall())
+            cursor.execute('SELECT SUM(LENGTH(timeline)) FROM "{0}"'.format(ObjectDetection._meta.db_table))
+            sizes[ObjectDetection._meta.db_table] = cursor.fetchone()[0] or 0
+
+        for name, model in OBJECT_TABLES:
+            size = sizes.get(model._meta.db_table, 0)
+            self.stdout.write("  {0}: {1:.1f} MB, {2:.1f} bytes per object".format(
+                name, size / 1024 ** 2, size / max(objects, 1)))
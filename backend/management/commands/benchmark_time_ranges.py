@@ -0,0 +1,141 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend.database_wrapper import create_root_folder, get_next_clip, get_objects_in_camera
+from backend.models import Camera, Clip, Object, ObjectClass, ObjectDetection, Resolution
+from backend.video_manager import SEQUENTIAL_CLIP_GAP
+
+# The composite indexes on time ranges, and the table and foreign key column each of them replaced
+TIME_RANGE_INDEXES = [
+    (Clip, 'clip_camera_time_idx', 'camera_id'),
+    (ObjectDetection, 'detection_clip_time_idx', 'clip_id'),
+    (Object, 'object_detection_time_idx', 'object_detection_id'),
+]
+
+BATCH_SIZE = 10000
+
+
+def scan_next_clip(clip: Clip):
+    """
+    The lookup of the next clip used to be done by scanning all clips of the camera.
+    """
+    for c in clip.camera.clip_set.all():
+        if clip != c and clip.end_time <= c.start_time <= clip.end_time + SEQUENTIAL_CLIP_GAP:
+            return c.id
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Times time range queries on a synthetic database with and without the camera and time indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clips', type=int, default=1000000, help='Number of synthetic clips')
+        parser.add_argument('--clips-per-camera', type=int, default=1000, help='Number of clips on each camera')
+        parser.add_argument('--detected', type=int, default=10,
+                            help='Every nth clip gets an object detection')
+        parser.add_argument('--objects', type=int, default=5, help='Number of objects in each object detection')
+        parser.add_argument('--lookups', type=int, default=200, help='Number of random clips to time lookups from')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random clips')
+
+    def handle(self, *args, **kwargs):
+        # Work on a new test database so the real one is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            start = time.perf_counter()
+            self.populate(clips=kwargs['clips'], clips_per_camera=kwargs['clips_per_camera'],
+                          detected=kwargs['detected'], objects=kwargs['objects'])
+            self.stdout.write("Created {0} clips, {1} object detections and {2} objects in {3:.0f} s".format(
+                Clip.objects.count(), ObjectDetection.objects.count(), Object.objects.count(),
+                time.perf_counter() - start))
+
+            rng = random.Random(kwargs['seed'])
+            cids = rng.sample(range(1, kwargs['clips'] + 1), min(kwargs['lookups'], kwargs['clips']))
+
+            self.stdout.write("With time range indexes:")
+            self.time_lookups(cids=cids)
+            self.replace_indexes()
+            self.stdout.write("With foreign key indexes only:")
+            self.time_lookups(cids=cids)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def populate(clips: int, clips_per_camera: int, detected: int, objects: int) -> None:
+        """
+        Creates cameras with back to back clips of a minute each, and object detections of some of the clips.
+        """
+        start_time = timezone.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        minute = timezone.timedelta(minutes=1)
+        fid = create_root_folder(path='/benchmark/', name='clips')
+        resolution = Resolution.objects.create(width=640, height=480)
+        classes = [ObjectClass.objects.create(object_class=name).id for name in ['car', 'person', 'bicycle']]
+
+        cameras = (clips + clips_per_camera - 1) // clips_per_camera
+        Camera.objects.bulk_create(
+            Camera(name='Camera {0}'.format(i), latitude=0, longitude=0, start_time=start_time,
+                   end_time=start_time + clips_per_camera * minute) for i in range(cameras))
+        cmids = Camera.objects.order_by('id').values_list('id', flat=True)[::1]
+
+        for first in range(0, clips, BATCH_SIZE):
+            Clip.objects.bulk_create(
+                Clip(folder_id=fid, name='clip{0}'.format(i), video_format='mp4',
+                     camera_id=cmids[i // clips_per_camera], start_time=start_time + i % clips_per_camera * minute,
+                     end_time=start_time + (i % clips_per_camera + 1) * minute, resolution=resolution,
+                     frame_rate=25.0, playable=True)
+                for i in range(first, min(first + BATCH_SIZE, clips)))
+
+        for first in range(0, clips, BATCH_SIZE * detected):
+            detected_clips = Clip.objects.filter(id__in=range(first + 1, first + BATCH_SIZE * detected + 1, detected))
+            ObjectDetection.objects.bulk_create(
+                ObjectDetection(clip_id=cid, sample_rate=1.0, start_time=st, end_time=et)
+                for cid, st, et in detected_clips.values_list('id', 'start_time', 'end_time'))
+        for first in range(0, ObjectDetection.objects.count(), BATCH_SIZE):
+            Object.objects.bulk_create(
+                Object(object_detection_id=odid, object_class_id=classes[(odid + k) % len(classes)],
+                       time=st + k * minute / objects)
+                for odid, st in ObjectDetection.objects.filter(id__gt=first, id__lte=first + BATCH_SIZE)
+                .values_list('id', 'start_time')
+                for k in range(objects))
+
+    def time_lookups(self, cids: list) -> None:
+        """
+        Times lookups from each of the given clips and writes the number of queries and the time per lookup.
+        """
+        hour = timezone.timedelta(hours=1)
+        lookups = [
+            ("Next clip, scanning the camera", scan_next_clip),
+            ("Next clip", lambda clip: get_next_clip(cid=clip.id, max_gap=SEQUENTIAL_CLIP_GAP)),
+            ("Objects on the camera in an hour",
+             lambda clip: get_objects_in_camera(cmid=clip.camera_id, start_time=clip.start_time,
+                                                end_time=clip.start_time + hour)),
+            ("Classes found in the clip",
+             lambda clip: Object.objects.filter(object_detection__clip_id=clip.id,
+                                                time__range=(clip.start_time, clip.end_time))
+             .values_list('object_class', flat=True).distinct()[::1]),
+        ]
+        for name, lookup in lookups:
+            clips = Clip.objects.filter(id__in=cids)[::1]
+            reset_queries()  # The query log only keeps the last queries
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for clip in clips:
+                    lookup(clip)
+                elapsed = time.perf_counter() - start
+            self.stdout.write("  {0}: {1:.1f} queries, {2:.3f} ms per lookup".format(
+                name, len(queries) / len(clips), 1000 * elapsed / len(clips)))
+
+    @staticmethod
+    def replace_indexes() -> None:
+        """
+        Replaces the time range indexes with the foreign key indexes they made redundant.
+        """
+        with connection.cursor() as cursor:
+            for model, index, column in TIME_RANGE_INDEXES:
+                table = model._meta.db_table
+                cursor.execute('DROP INDEX "{0}"'.format(index))
+                cursor.execute('CREATE INDEX "{0}_{1}" ON "{0}" ("{1}")'.format(table, column))
@@ -1,17 +1,38 @@
+import hashlib
+import os
+
 from django.core.management.base import BaseCommand
 from backend.file_manager import build_file_structure
 
 
+def default_checkpoint(folder: str) -> str:
+    """
+    Gets the checkpoint file of an entry folder, so interrupted runs on different folders don't share one.
+
+    :param folder: Path to the entry folder.
+    :return: Name of the checkpoint file in the working directory.
+    """
+    key = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:16]
+    return 'setentryfolder-{0}.checkpoint'.format(key)
+
+
 class Command(BaseCommand):
     help = 'Sets entry folder to given file path.'
 
     def add_arguments(self, parser):
         parser.add_argument('folder', type=str, help='Path to entry folder')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of processes used to read clips (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of clips written to the database at a time')
+        parser.add_argument('--checkpoint', type=str, default=None,
+                            help='File used to resume an interrupted run (default: one per entry folder)')
 
     def handle(self, *args, **kwargs):
         folder = kwargs['folder']
         try:
-            build_file_structure(file_path=folder)
+            build_file_structure(file_path=folder, processes=kwargs['processes'], batch_size=kwargs['batch_size'],
+                                 checkpoint=kwargs['checkpoint'] or default_checkpoint(folder=folder))
             self.stdout.write("Successfully added entry folder.")
         except ValueError as e:
             self.stdout.write(str(e))
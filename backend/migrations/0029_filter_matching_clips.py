@@ -0,0 +1,23 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0028_merge_20200429_1558'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filter',
+            name='matching_clips',
+            field=models.ManyToManyField(related_name='matching_filter', to='backend.Clip'),
+        ),
+        migrations.AddField(
+            model_name='filter',
+            name='matching_clips_up_to_date',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+def set_lineage(apps, schema_editor):
+    Folder = apps.get_model('backend', 'Folder')
+    lineages = {None: '/'}
+    folders = list(Folder.objects.all())
+    while folders:
+        done, remaining = [], []
+        for folder in folders:
+            if folder.parent_id in lineages:
+                folder.lineage = lineages[folder.parent_id] + str(folder.id) + '/'
+                lineages[folder.id] = folder.lineage
+                done.append(folder)
+            else:
+                remaining.append(folder)
+        Folder.objects.bulk_update(done, ['lineage'])
+        folders = remaining
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0029_filter_matching_clips'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='lineage',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(set_lineage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:52
+
+from django.db import migrations
+
+
+def set_path(apps, schema_editor):
+    Folder = apps.get_model('backend', 'Folder')
+    paths = {}
+    changed = []
+    for folder in sorted(Folder.objects.all(), key=lambda f: f.lineage.count('/')):
+        if folder.parent_id is not None and folder.path != paths[folder.parent_id]:
+            folder.path = paths[folder.parent_id]
+            changed.append(folder)
+        paths[folder.id] = folder.path + folder.name + '/'
+    Folder.objects.bulk_update(changed, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0030_folder_lineage'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_path, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:34
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0031_folder_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_rate', models.FloatField(validators=[django.core.validators.MinValueValidator(0.0)], verbose_name='sample rate (s)')),
+                ('start_time', models.DateTimeField(blank=True, null=True, verbose_name='start time')),
+                ('end_time', models.DateTimeField(blank=True, null=True, verbose_name='end time')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('clip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.Clip')),
+                ('progress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.Progress')),
+            ],
+        ),
+    ]
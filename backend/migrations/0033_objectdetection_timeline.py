@@ -0,0 +1,50 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:43
+
+import numpy as np
+from django.db import migrations, models
+from django.utils import timezone
+
+# Packing of the timeline when this migration was written, kept here so later changes to the models don't change it
+TIMELINE_DTYPE = np.dtype([('offset', '<i8'), ('object_class', '<u4'), ('count', '<u4')])
+
+
+def merge_timeline(timeline: bytes, offsets: list, object_classes: list) -> bytes:
+    added = np.ones(len(offsets), dtype=TIMELINE_DTYPE)
+    added['offset'] = offsets
+    added['object_class'] = object_classes
+    entries = np.concatenate([np.frombuffer(timeline, dtype=TIMELINE_DTYPE), added])
+
+    keys, inverse = np.unique(entries[['offset', 'object_class']], return_inverse=True)
+    res = np.empty(len(keys), dtype=TIMELINE_DTYPE)
+    res['offset'] = keys['offset']
+    res['object_class'] = keys['object_class']
+    res['count'] = np.bincount(inverse.ravel(), weights=entries['count'], minlength=len(keys))
+    return res.tobytes()
+
+
+def set_timeline(apps, schema_editor):
+    ObjectDetection = apps.get_model('backend', 'ObjectDetection')
+    Object = apps.get_model('backend', 'Object')
+    for od in ObjectDetection.objects.all():
+        objects = Object.objects.filter(object_detection=od).values_list('time', 'object_class_id')
+        od.timeline = merge_timeline(timeline=b'',
+                                     offsets=[(time - od.start_time) // timezone.timedelta(microseconds=1)
+                                              for time, _ in objects],
+                                     object_classes=[ocid for _, ocid in objects])
+        od.save(update_fields=['timeline'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0032_detectionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='objectdetection',
+            name='timeline',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(set_timeline, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_counts(apps, schema_editor):
+    Object = apps.get_model('backend', 'Object')
+    ObjectCount = apps.get_model('backend', 'ObjectCount')
+    counts = Object.objects.order_by().values('object_detection', 'object_class').annotate(n=models.Count('id'))
+    ObjectCount.objects.bulk_create([ObjectCount(object_detection_id=c['object_detection'],
+                                                 object_class_id=c['object_class'], count=c['n']) for c in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0033_objectdetection_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('object_class', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='backend.ObjectClass')),
+                ('object_detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.ObjectDetection')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='objectcount',
+            constraint=models.UniqueConstraint(fields=('object_detection', 'object_class'), name='object count constraint'),
+        ),
+        migrations.RunPython(set_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0034_objectcount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='camera',
+            index=models.Index(fields=['latitude', 'longitude'], name='camera_position_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0035_camera_position_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clip',
+            name='camera',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='backend.Camera'),
+        ),
+        migrations.AlterField(
+            model_name='object',
+            name='object_detection',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend.ObjectDetection'),
+        ),
+        migrations.AlterField(
+            model_name='objectdetection',
+            name='clip',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend.Clip'),
+        ),
+        migrations.AddIndex(
+            model_name='clip',
+            index=models.Index(fields=['camera', 'start_time', 'end_time'], name='clip_camera_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='object',
+            index=models.Index(fields=['object_detection', 'time', 'object_class'], name='object_detection_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='objectdetection',
+            index=models.Index(fields=['clip', 'start_time', 'end_time'], name='detection_clip_time_idx'),
+        ),
+    ]
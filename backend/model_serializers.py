@@ -13,7 +13,7 @@ class FolderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Folder
-        exclude = ['is_entry']
+        exclude = ['is_entry', 'lineage']
 
 
 class ResolutionSerializer(serializers.ModelSerializer):
@@ -35,12 +35,21 @@ class ProjectSerializer(serializers.ModelSerializer):
 
 class CameraSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
-    clip_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    clip_set = serializers.SerializerMethodField()
 
     class Meta:
         model = Camera
         fields = '__all__'
 
+    def get_clip_set(self, camera: Camera) -> list:
+        """
+        Gets the ids of the clips of the camera, or only of the ones already given as clip_ids, for example the clips
+        in a project.
+        """
+        if hasattr(camera, 'clip_ids'):
+            return camera.clip_ids
+        return [clip.id for clip in camera.clip_set.all()]
+
 
 class ObjectClassSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
@@ -55,7 +64,7 @@ class FilterSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Filter
-        exclude = ['project', 'areas']
+        exclude = ['project', 'areas', 'matching_clips', 'matching_clips_up_to_date']
 
 
 class ObjectDetectionSerializer(serializers.ModelSerializer):
@@ -63,7 +72,7 @@ class ObjectDetectionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ObjectDetection
-        fields = '__all__'
+        exclude = ['timeline']
 
 
 class ObjectSerializer(serializers.ModelSerializer):
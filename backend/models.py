@@ -1,12 +1,23 @@
+from typing import List, Iterable, NamedTuple, Optional, Set
+
+import numpy as np
 from django.db import models
+from django.db.models.functions import Concat, Substr
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.utils.functional import cached_property
 from decimal import Decimal
+
+from . import geometry
 from django.utils.timezone import utc
 
 INT_MAX_VALUE = 2147483647
 
+# An entry in the timeline of an object detection: a time given in microseconds from the start of the object detection,
+# the id of an object class and the number of objects of that class found at that time.
+TIMELINE_DTYPE = np.dtype([('offset', '<i8'), ('object_class', '<u4'), ('count', '<u4')])
+
 
 class Resolution(models.Model):
     """
@@ -26,6 +37,13 @@ class Folder(models.Model):
     Path represents a location in the user's file system which doesn't include the name of the folder.
     All paths are stored with / as separator between directories regardless of OS.
     The last character in the path is always /.
+    The path of a subfolder is always the path to its parent, so the absolute path to a folder is known without
+    visiting its ancestors. It's updated for the whole subtree when a folder is renamed or moved.
+    Filters in projects of the old and new ancestors of a renamed or moved folder with clips have to match
+    their clips again.
+
+    Lineage is the ids of the folder's ancestors and the folder itself, for example /1/4/9/ for folder 9.
+    It's kept up to date on save and used to get all folders in a subtree with one query.
 
     NOTE:
         Uses cascade for parent so the folder will be deleted if the parent is deleted (recursively).
@@ -35,6 +53,7 @@ class Folder(models.Model):
     path = models.CharField(max_length=200)
     name = models.CharField(max_length=200)
     is_entry = models.BooleanField(default=False)
+    lineage = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
 
     class Meta:
         constraints = [
@@ -42,13 +61,7 @@ class Folder(models.Model):
         ]
 
     def __str__(self):
-        res = self.name
-        curr = self
-        while curr.parent is not None:
-            res = curr.parent.name + '/' + res
-            curr = curr.parent
-        res = curr.path + res
-        return res
+        return self.path + self.name
 
     def clean(self):
         if not self.path and self.parent is None:
@@ -57,8 +70,49 @@ class Folder(models.Model):
             raise ValidationError("The last character in the path must be \ or / depending on OS.")
 
     def save(self, *args, **kwargs):
+        if self.parent is not None:
+            self.path = str(self.parent) + '/'
         self.full_clean()
-        return super(Folder, self).save(*args, **kwargs)
+
+        old_path = None
+        if self.lineage:
+            old_path = '{0}{1}/'.format(*Folder.objects.values_list('path', 'name').get(id=self.id))
+        res = super(Folder, self).save(*args, **kwargs)
+
+        # The id is needed for the lineage so it can only be updated after the folder is saved
+        lineage = (self.parent.lineage if self.parent is not None else '/') + str(self.id) + '/'
+        path = str(self) + '/'
+        old_lineage = self.lineage
+        moved = bool(old_lineage) and (lineage != old_lineage or path != old_path)
+        if moved:
+            Folder.objects.filter(lineage__startswith=old_lineage).exclude(id=self.id).update(
+                lineage=Concat(models.Value(lineage), Substr('lineage', len(old_lineage) + 1)),
+                path=Concat(models.Value(path), Substr('path', len(old_path) + 1)))
+        if lineage != old_lineage:
+            Folder.objects.filter(id=self.id).update(lineage=lineage)
+            self.lineage = lineage
+
+        # The clips of the subtree may have left or joined the projects of the old and new ancestors
+        if moved and Clip.objects.filter(folder__lineage__startswith=lineage).exists():
+            ancestors = {int(i) for i in (old_lineage + lineage).split('/') if i}
+            Filter.objects.filter(project__folders__in=ancestors).update(matching_clips_up_to_date=False)
+        return res
+
+    def get_ancestor_ids(self) -> List[int]:
+        """
+        Gets the ids of the folder's ancestors and the folder itself without any queries.
+
+        :return: A list of ids, starting with the root folder.
+        """
+        return [int(i) for i in self.lineage.strip('/').split('/')]
+
+    def get_tree_path(self) -> List[str]:
+        """
+        Gets the names of the folder's ancestors and the folder itself without any queries.
+
+        :return: A list of names, starting with the root folder.
+        """
+        return str(self).split('/')[-len(self.get_ancestor_ids()):]
 
 
 class Project(models.Model):
@@ -95,6 +149,18 @@ class Area(models.Model):
         """
         return self.radius >= distance(self.longitude, self.latitude, longitude, latitude)
 
+    def get_bounding_box(self) -> models.Q:
+        """
+        Get a condition matching the positions in a box around the area, which can be looked up in the position index
+        of cameras. The box is slightly larger than the area to not be affected by rounding.
+        :return: A condition for filtering cameras
+        """
+        margin = 0.000001
+        min_lon, min_lat, max_lon, max_lat = geometry.bounding_box(float(self.longitude), float(self.latitude),
+                                                                   self.radius)
+        return models.Q(latitude__range=(min_lat - margin, max_lat + margin),
+                        longitude__range=(min_lon - margin, max_lon + margin))
+
     def clean(self):
         if not (Decimal(value="-180.0") <= self.longitude <= Decimal(value="180.0")):
             raise ValidationError("Longitude must be between -180 and 180")
@@ -132,6 +198,9 @@ class Camera(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['name', 'latitude', 'longitude'], name='name and position constraint'),
         ]
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='camera_position_idx'),
+        ]
 
     def __str__(self):
         return "Camera {0} at ({1}, {0})".format(self.name, self.latitude, self.longitude)
@@ -168,11 +237,12 @@ class Clip(models.Model):
         Uses cascade for folder so the clip will be deleted if the folder is deleted.
         Uses protect for camera which means that a camera can't be deleted if a corresponding clip is in the database.
         When a clip  is saved the start and end time of its camera is updated.
+        Clips are indexed by camera and time, which also serves lookups by camera alone.
     """
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     video_format = models.CharField('format', max_length=5)
-    camera = models.ForeignKey(Camera, on_delete=models.PROTECT)
+    camera = models.ForeignKey(Camera, on_delete=models.PROTECT, db_index=False)
     start_time = models.DateTimeField('start time')
     end_time = models.DateTimeField('end time')
     resolution = models.ForeignKey(Resolution, on_delete=models.PROTECT)
@@ -186,6 +256,9 @@ class Clip(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['folder', 'name', 'video_format'], name='clip path constraint')
         ]
+        indexes = [
+            models.Index(fields=['camera', 'start_time', 'end_time'], name='clip_camera_time_idx'),
+        ]
 
     def __str__(self):
         return self.folder.__str__() + '/' + self.name + '.' + self.video_format
@@ -214,6 +287,9 @@ class Filter(models.Model):
 
     Location (latitude, longitude) is given in decimal degrees.
 
+    Matching clips is a materialized set of the clips that match the filter.
+    It's only valid while matching clips up to date is True.
+
     NOTE:
         Uses cascade for project so the filter will be deleted if the project is deleted.
         Uses protect for object class so the object class can't be deleted if the filter still exists.
@@ -227,6 +303,8 @@ class Filter(models.Model):
     min_frame_rate = models.PositiveIntegerField("Minimum frame Rate", default=0)
     whitelisted_resolutions = models.ManyToManyField(Resolution)
     areas = models.ManyToManyField(Area, default=None)
+    matching_clips = models.ManyToManyField(Clip, related_name="matching_filter")
+    matching_clips_up_to_date = models.BooleanField(default=False)
 
     def clip_match_filter(self, clip: Clip) -> bool:
         """
@@ -283,6 +361,68 @@ class Filter(models.Model):
 
         return True
 
+    def get_matching_clips(self, clips: models.QuerySet) -> models.QuerySet:
+        """
+        Narrows down the given clips to the ones matching the filter.
+        Gives the same result as clip_match_filter but lets the database evaluate the whole filter in one query.
+
+        :param clips: The clips to match against, should be part of the same project as the filter.
+        :return: A QuerySet with the clips that match the filter.
+        """
+        # Check if the clip within time boundaries
+        matching = models.Q(start_time__lte=self.end_time, end_time__gte=self.start_time)
+
+        # Check if the clip has the desired resolution (if any is whitelisted)
+        matching &= ~models.Exists(self.whitelisted_resolutions.all()) | models.Exists(
+            self.whitelisted_resolutions.filter(width=models.OuterRef('resolution__width'),
+                                                height=models.OuterRef('resolution__height')))
+
+        # Check if the clip has higher than or equal minimum frame rate
+        matching &= models.Q(frame_rate__gte=self.min_frame_rate)
+
+        # Check if clip is in the right location (if any area is given)
+        if self.cameras_in_areas is not None:
+            matching &= models.Q(camera_id__in=self.cameras_in_areas)
+
+        # Check if clip contains the correct objects, i.e. that all classes in the filter were detected in the clip
+        # during the filters time
+        nr_of_classes = self.classes.count()
+        if nr_of_classes:
+            found_classes = Object.objects.filter(
+                object_detection__clip=models.OuterRef('pk'), object_class__in=self.classes.all(),
+                time__gte=self.start_time, time__lte=self.end_time
+            ).order_by().values('object_detection__clip').annotate(
+                n=models.Count('object_class', distinct=True)).values('n')
+            clips = clips.annotate(found_classes=models.Subquery(found_classes, output_field=models.IntegerField()))
+            matching &= models.Q(found_classes=nr_of_classes)
+
+        # Excluded clips are never matched and included clips are always matched
+        return clips.filter(~models.Q(id__in=self.excluded_clips.values('id')),
+                            models.Q(id__in=self.included_clips.values('id')) | matching)
+
+    @cached_property
+    def cameras_in_areas(self) -> Optional[Set[int]]:
+        """
+        The cameras within any of the areas of the filter. The cameras in the bounding boxes of the areas are found in
+        one query using the position index and then checked exactly, all areas at once.
+        Kept for the lifetime of the filter object, so areas should not be changed on the same object.
+
+        :return: A set of camera ids, or None if the filter has no areas.
+        """
+        areas = self.areas.all()[::1]
+        if not areas:
+            return None
+
+        bounding_boxes = models.Q(pk__in=[])
+        for area in areas:
+            bounding_boxes |= area.get_bounding_box()
+        candidates = np.array(Camera.objects.filter(bounding_boxes).values_list('id', 'longitude', 'latitude'),
+                              dtype=float).reshape(-1, 3)
+
+        within = geometry.within_areas(longitudes=candidates[:, 1], latitudes=candidates[:, 2],
+                                       areas=[(a.longitude, a.latitude, a.radius) for a in areas]).any(axis=1)
+        return set(candidates[within, 0].astype(int).tolist())
+
     def __str__(self):
         return self.id
 
@@ -301,14 +441,27 @@ class ObjectDetection(models.Model):
 
     Sample rate is given in seconds.
 
+    The found objects are also kept in a packed timeline with one entry per time and object class
+    (see TIMELINE_DTYPE), which can be read without loading the objects one by one. The Object rows are still
+    kept since filters match classes against them in SQL. The timeline adds about a fifth to their size:
+    15 against 82 bytes per object with up to three objects found each second, as measured by the
+    benchmark_object_storage command.
+
     NOTE:
         Uses cascade for clip so the entity will be deleted if the clip is deleted.
         Sample rate equal to 0.0 means run object detection on all frames.
+        Object detections are indexed by clip and time, which also serves lookups by clip alone.
     """
-    clip = models.ForeignKey(Clip, on_delete=models.CASCADE)
+    clip = models.ForeignKey(Clip, on_delete=models.CASCADE, db_index=False)
     sample_rate = models.FloatField('sample rate (s)', validators=[MinValueValidator(0.0)])
     start_time = models.DateTimeField('start time')
     end_time = models.DateTimeField('end time')
+    timeline = models.BinaryField(default=b'', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['clip', 'start_time', 'end_time'], name='detection_clip_time_idx'),
+        ]
 
     def __str__(self):
         return "Object detection from {0} to {1} with {2} as sample rate" \
@@ -326,6 +479,14 @@ class ObjectDetection(models.Model):
         self.full_clean()
         return super(ObjectDetection, self).save(*args, **kwargs)
 
+    def get_timeline(self) -> np.ndarray:
+        """
+        Gets the packed timeline of the found objects, ordered by time and object class.
+
+        :return: A read only array of TIMELINE_DTYPE.
+        """
+        return np.frombuffer(self.timeline, dtype=TIMELINE_DTYPE)
+
 
 class Object(models.Model):
     """
@@ -334,11 +495,17 @@ class Object(models.Model):
     NOTE:
         Uses cascade for object detection so the object will be deleted if the object detection is deleted.
         Uses protect for object class so the object class can't be deleted if the object still exists.
+        Objects are indexed by object detection, time and class, which also serves lookups by object detection alone.
     """
-    object_detection = models.ForeignKey(ObjectDetection, on_delete=models.CASCADE)
+    object_detection = models.ForeignKey(ObjectDetection, on_delete=models.CASCADE, db_index=False)
     object_class = models.ForeignKey(ObjectClass, on_delete=models.PROTECT)
     time = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['object_detection', 'time', 'object_class'], name='object_detection_time_idx'),
+        ]
+
     def __str__(self):
         return "{0} at {1}".format(self.object_class, self.time)
 
@@ -351,6 +518,59 @@ class Object(models.Model):
         return super(Object, self).save(*args, **kwargs)
 
 
+class ObjectCount(models.Model):
+    """
+    The number of objects of a class spotted by an object detection.
+    Kept up to date when objects are added, so clips can be summarized without reading their objects.
+    Takes about 6 bytes per object, as measured by the benchmark_object_storage command.
+
+    NOTE:
+        Uses cascade for object detection so the count will be deleted if the object detection is deleted.
+        Uses protect for object class so the object class can't be deleted if the count still exists.
+    """
+    object_detection = models.ForeignKey(ObjectDetection, on_delete=models.CASCADE)
+    object_class = models.ForeignKey(ObjectClass, on_delete=models.PROTECT)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['object_detection', 'object_class'], name='object count constraint'),
+        ]
+
+    def __str__(self):
+        return "{0} {1}".format(self.count, self.object_class)
+
+
+class DetectedObject(NamedTuple):
+    """
+    An object read from the timeline of an object detection.
+    """
+    object_class: str
+    time: timezone.datetime
+
+
+def merge_timeline(timeline: bytes, offsets: List[int], object_classes: List[int]) -> bytes:
+    """
+    Adds objects to a packed timeline. Objects of the same class found at the same time share one entry.
+
+    :param timeline: A packed timeline.
+    :param offsets: The times of the objects, given in microseconds from the start of the object detection.
+    :param object_classes: The ids of the objects' classes.
+    :return: The packed timeline with the objects added.
+    """
+    added = np.ones(len(offsets), dtype=TIMELINE_DTYPE)
+    added['offset'] = offsets
+    added['object_class'] = object_classes
+    entries = np.concatenate([np.frombuffer(timeline, dtype=TIMELINE_DTYPE), added])
+
+    keys, inverse = np.unique(entries[['offset', 'object_class']], return_inverse=True)
+    res = np.empty(len(keys), dtype=TIMELINE_DTYPE)
+    res['offset'] = keys['offset']
+    res['object_class'] = keys['object_class']
+    res['count'] = np.bincount(inverse.ravel(), weights=entries['count'], minlength=len(keys))
+    return res.tobytes()
+
+
 def overlap(s1: timezone.datetime, e1: timezone.datetime, s2: timezone.datetime, e2: timezone.datetime) -> bool:
     """
     Check whether timespan 1 overlaps timespan 2
@@ -385,13 +605,62 @@ class Progress(models.Model):
         return super(Progress, self).save(*args, **kwargs)
 
 
-def distance(lon1: Decimal, lat1: Decimal, lon2: Decimal, lat2: Decimal) -> Decimal:
+class DetectionJob(models.Model):
+    """
+    Object detection to run on a clip as part of a request, which keeps track of its progress.
+
+    Start and end time is the requested interval, which is None to analyze the whole clip.
+    Jobs are pending until a worker takes them and running until they are done or failed.
+
+    NOTE:
+        Uses cascade for progress so the request is cancelled if its progress is deleted.
+        Uses cascade for clip so the job will be deleted if the clip is deleted.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    progress = models.ForeignKey(Progress, on_delete=models.CASCADE)
+    clip = models.ForeignKey(Clip, on_delete=models.CASCADE)
+    sample_rate = models.FloatField('sample rate (s)', validators=[MinValueValidator(0.0)])
+    start_time = models.DateTimeField('start time', null=True, blank=True)
+    end_time = models.DateTimeField('end time', null=True, blank=True)
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING, db_index=True)
+
+    def __str__(self):
+        return "Detection of clip {0} ({1})".format(self.clip_id, self.state)
+
+    def clean(self):
+        if self.start_time is not None and self.end_time is not None and self.start_time > self.end_time:
+            raise ValidationError("Start time must be before end time.")
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        return super(DetectionJob, self).save(*args, **kwargs)
+
+
+def distance(lon1: Decimal, lat1: Decimal, lon2: Decimal, lat2: Decimal) -> float:
     """
-    get the distance between point 1 and 2
+    get the distance between point 1 and 2 in meters
     :param lon1: Longitude of point 1
     :param lat1: latitude of point 1
     :param lon2: Longitude of point 2
     :param lat2: latitude of point 2
-    :return: whether timespan 1 overlaps timespan 2
+    :return: the great-circle distance between the points
+    """
+    return float(geometry.haversine(lon1, lat1, lon2, lat2))
+
+
+def in_subtrees(folders: Iterable[Folder], prefix: str = '') -> models.Q:
+    """
+    Get a condition matching the given folders and all their subfolders
+    :param folders: The root folders of the subtrees
+    :param prefix: Lookup of the folder from the filtered model, for example 'folder__' for clips
+    :return: A condition for filtering a QuerySet, which matches nothing if no folders are given
     """
-    return Decimal.sqrt((Decimal(57475)*(lon1 - lon2)) ** 2 + (Decimal(111395)*(lat1 - lat2)) ** 2)
+    q = models.Q(pk__in=[])
+    for folder in folders:
+        q |= models.Q(**{prefix + 'lineage__startswith': folder.lineage})
+    return q
@@ -1,11 +1,17 @@
 import cv2
+import django
 import numpy as np
 import threading
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor, Future, wait, FIRST_COMPLETED
 
 from .communication_utils import *
 from .database_wrapper import delete_progress as dbw_delete_progress
 from .database_wrapper import *
 from .serialization import *
+from .video_probe import get_capture_details, sample_frames
 
 
 # This file represents the backend Object Detector.
@@ -31,10 +37,8 @@ def detect_objects(data: dict) -> (int, dict):
     # Create a progress object to keep track of object detection.
     pid = create_progress(total=len(clip_ids))
 
-    # Start a new thread for an object detector.
-    od = ObjectDetector()
-    od_thread = threading.Thread(target=od.run_object_detection, args=(clip_ids, pid, rate, start_time, end_time))
-    od_thread.start()
+    # Let the scheduler run object detection in its worker processes.
+    get_scheduler().submit(cids=clip_ids, pid=pid, rate=rate, start_time=start_time, end_time=end_time)
 
     return 200, {PROGRESS_ID: pid}
 
@@ -75,17 +79,139 @@ def delete_progress(data: dict) -> (int, dict):
     return 200, {}
 
 
+def get_detection_interval(clip: Clip, start_time: Optional[timezone.datetime],
+                           end_time: Optional[timezone.datetime]) -> \
+        Tuple[int, Optional[int], timezone.datetime, timezone.datetime]:
+    """
+    Calculates which part of a clip to run object detection on.
+
+    :param clip: The clip.
+    :param start_time: Start time of object detection.
+    :param end_time: End time of object detection.
+    :return: Start and end second in the clip (end is None for the end of the clip) and start and end time of the
+             object detection. This is given in the form of a tuple (start sec, end sec, start time, end time).
+    """
+    if start_time is None:
+        start_sec = 0
+        detection_start_time = clip.start_time
+    else:
+        start_sec = max(int((start_time - clip.start_time).total_seconds()), 0)
+        detection_start_time = max(start_time, clip.start_time)
+
+    if end_time is None:
+        end_sec = None
+        detection_end_time = clip.end_time
+    else:
+        if end_time > clip.end_time:
+            end_sec = max(int((clip.end_time - clip.start_time).total_seconds()), start_sec)
+            detection_end_time = clip.end_time
+        else:
+            end_sec = max(int((end_time - clip.start_time).total_seconds()), start_sec)
+            detection_end_time = end_time
+
+    return start_sec, end_sec, detection_start_time, detection_end_time
+
+
+def save_detection(clip: Clip, rate: int, start_time: timezone.datetime, end_time: timezone.datetime,
+                   res: List[Tuple[str, int]]) -> None:
+    """
+    Saves the result of object detection on a clip to the database.
+
+    :param clip: The clip.
+    :param rate: Seconds between each analyzed frame.
+    :param start_time: Start time of object detection.
+    :param end_time: End time of object detection.
+    :param res: List of tuples with object class and second in the clip when it was detected.
+    """
+    # Seconds are rounded down when detecting so the time is kept inside the interval
+    objects = [(obj_cls, min(max(clip.start_time + timezone.timedelta(seconds=sec), start_time), end_time))
+               for obj_cls, sec in res]
+    create_object_detection(cid=clip.id, sample_rate=rate, start_time=start_time, end_time=end_time,
+                            objects=objects)
+
+
+def plan_detection(clip: Clip, rate: float, start_sec: int, end_sec: Optional[int],
+                   detections: List[ObjectDetection]) -> \
+        Tuple[List[Tuple[float, Optional[float]]], List[Tuple[str, int]]]:
+    """
+    Works out which parts of a clip still need object detection, given the object detections of the clip.
+    An object detection covers the frames it has analyzed, so one with the same or a finer sample rate that
+    analyzed every requested frame can answer the request. Objects found in other frames are left out.
+    Objects are stored to the whole second, so only object detections that analyzed at most one frame each second
+    are reused.
+
+    :param clip: The clip.
+    :param rate: Seconds between each analyzed frame.
+    :param start_sec: Which second in clip to start object detection.
+    :param end_sec: Which second in clip to end object detection or None for the end of the clip.
+    :param detections: Object detections of the clip with the same or a finer sample rate.
+    :return: The gaps to run object detection on, as tuples of start and end second (end is None for the end of
+             the clip), and the reused objects, as tuples of object class and second in the clip.
+    """
+    frame_rate = int(clip.frame_rate)
+    if frame_rate < 1:
+        return [(start_sec, end_sec)], []
+
+    def frames(start: int, end: Optional[int], sample_rate: float) -> Tuple[int, Optional[int], int]:
+        # Same frames as analyzed by ObjectDetector.detect
+        return start * frame_rate, None if end is None else end * frame_rate, max(int(sample_rate * frame_rate), 1)
+
+    def before(a: int, b: Optional[int]) -> bool:
+        return b is None or a < b
+
+    def first_sample(frame: int) -> int:
+        return start + -(-(frame - start) // step) * step
+
+    start, end, step = frames(start=start_sec, end=end_sec, sample_rate=rate)
+
+    # Find which requested frames each object detection has analyzed
+    covered = []
+    for od in detections:
+        od_start_sec, od_end_sec, _, _ = get_detection_interval(
+            clip=clip, start_time=od.start_time, end_time=od.end_time if od.end_time < clip.end_time else None)
+        od_start, od_end, od_step = frames(start=od_start_sec, end=od_end_sec, sample_rate=od.sample_rate)
+        if od_step >= frame_rate and step % od_step == 0 and (start - od_start) % od_step == 0:
+            a = max(start, od_start)
+            b = od_end if end is None else end if od_end is None else min(end, od_end)
+            if before(a, b):
+                covered.append((a, b, od))
+
+    # Reuse objects from the covered frames and detect the rest
+    gaps = []
+    objects = []
+    pos = start
+    for a, b, od in sorted(covered, key=lambda c: c[0]):
+        if pos is None:
+            break
+        if a > pos:
+            gaps.append((pos, a))
+        a = max(a, pos)
+        if before(a, b):
+            for obj in read_timelines(ods=[od]):
+                sec = int((obj.time - clip.start_time).total_seconds())
+                frame = first_sample(max(sec * frame_rate, a))
+                if frame < (sec + 1) * frame_rate and before(frame, b):
+                    objects.append((obj.object_class, sec))
+            pos = b if b is None else max(pos, b)
+    if pos is not None and before(pos, end):
+        gaps.append((pos, end))
+
+    gaps = [(first_sample(a), b) for a, b in gaps if before(first_sample(a), b)]
+    return [(a / frame_rate, None if b is None else b / frame_rate) for a, b in gaps], objects
+
+
 class ObjectDetector:
     """
     Modified the following example:
     https://pysource.com/2019/06/27/yolo-object-detection-using-opencv-with-python/
     """
 
-    def __init__(self, yolov: str = 'yolov3-tiny', debug: bool = False):  # debug
+    def __init__(self, yolov: str = 'yolov3-tiny', batch_size: int = 8, debug: bool = False):  # debug
         """
         Loads YOLO.
 
         :param yolov: YOLO version (weights and cfg must be in utils).
+        :param batch_size: Number of frames analyzed by YOLO at a time.
         :param debug: Display all processed frames for user.
         """
         self.net = cv2.dnn.readNet("backend{0}utils{0}{1}.weights".format(os.path.sep, yolov),
@@ -94,7 +220,8 @@ class ObjectDetector:
         with open("backend{0}utils{0}coco.names".format(os.path.sep), "r") as f:
             self.classes = [line.strip() for line in f.readlines()]
         self.layer_names = self.net.getLayerNames()
-        self.output_layers = [self.layer_names[i[0] - 1] for i in self.net.getUnconnectedOutLayers()]
+        self.output_layers = [self.layer_names[i - 1] for i in np.array(self.net.getUnconnectedOutLayers()).flatten()]
+        self.batch_size = batch_size
 
         self.debug = debug  # debug
         if debug:
@@ -119,32 +246,16 @@ class ObjectDetector:
             file_path = replace_sep(str(clip))
 
             # Calculate start and end based on given start and end time
-            if start_time is None:
-                start_sec = 0
-                detection_start_time = clip.start_time
-            else:
-                start_sec = max(int((start_time - clip.start_time).total_seconds()), 0)
-                detection_start_time = max(start_time, clip.start_time)
-
-            if end_time is None:
-                end_sec = None
-                detection_end_time = clip.end_time
-            else:
-                if end_time > clip.end_time:
-                    end_sec = max(int((clip.end_time - clip.start_time).total_seconds()), start_sec)
-                    detection_end_time = clip.end_time
-                else:
-                    end_sec = max(int((end_time - clip.start_time).total_seconds()), start_sec)
-                    detection_end_time = end_time
+            start_sec, end_sec, detection_start_time, detection_end_time = \
+                get_detection_interval(clip=clip, start_time=start_time, end_time=end_time)
 
             if end_sec is None or start_sec < end_sec:
                 # Run object detection on clip
                 res = self.detect(clip=file_path, rate=rate, start=start_sec, end=end_sec)
 
                 # Add result to database
-                objects = [(obj_cls, detection_start_time + timezone.timedelta(seconds=time)) for obj_cls, time in res]
-                create_object_detection(cid=clip.id, sample_rate=rate, start_time=detection_start_time,
-                                        end_time=detection_end_time, objects=objects)
+                save_detection(clip=clip, rate=rate, start_time=detection_start_time, end_time=detection_end_time,
+                               res=res)
 
             # Update progress since detection of one clip is finished
             update_progress(pid=pid)
@@ -153,6 +264,7 @@ class ObjectDetector:
             List[Tuple[str, int]]:
         """
         Detects objects in a clip.
+        Only the analyzed frames are decoded and they are given to YOLO in batches.
 
         :param clip: Absolute path to clip.
         :param rate: Seconds between each analyzed frame.
@@ -169,77 +281,330 @@ class ObjectDetector:
 
         # Setup video
         video = cv2.VideoCapture(clip)
-        frame_rate = int(video.get(cv2.CAP_PROP_FPS))
-        frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        # Convert rate, start and end to frames
-        rate = rate * frame_rate
-        start = int(start * frame_rate)
-        if end is None:
-            end = frames
-        else:
-            end = end * frame_rate
-
-        # Analyze clip frame by frame
-        for i in range(end):
-            success, frame = video.read()
-            if not success:
-                break  # Video is over.
-
-            # Skip clips according to start and rate.
-            if i >= start and i % rate == start % rate:
-                # Prepare frame
-                frame = cv2.resize(frame, None, fx=0.4, fy=0.4)
-                height, width, channels = frame.shape
-
-                # Detect objects
-                blob = cv2.dnn.blobFromImage(frame, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-                self.net.setInput(blob)
-                outs = self.net.forward(self.output_layers)
-
-                # Process result of object detection.
-                class_ids = []
-                confidences = []
-                boxes = []
-                for out in outs:
-                    for detection in out:
-                        scores = detection[5:]
-                        class_id = np.argmax(scores)
-                        confidence = scores[class_id]
-                        if confidence > thresh:
-                            # Detected object
-                            center_x = int(detection[0] * width)
-                            center_y = int(detection[1] * height)
-                            w = int(detection[2] * width)
-                            h = int(detection[3] * height)
-
-                            # Rectangle coordinates
-                            x = int(center_x - w / 2)
-                            y = int(center_y - h / 2)
-                            boxes.append([x, y, w, h])
-                            confidences.append(float(confidence))
-                            class_ids.append(class_id)
-
-                # Non maximum suppression
-                indexes = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
-
-                # Label result
-                for j in range(len(boxes)):
-                    if j in indexes:
-                        # Add detected object to res
-                        label = str(self.classes[class_ids[j]])
-                        res.append((label, int(i / frame_rate)))
-
-                        if self.debug:
-                            x, y, w, h = boxes[j]
-                            color = self.colors[j]
-                            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-                            cv2.putText(frame, label, (x, y + 30), cv2.FONT_HERSHEY_PLAIN, 3, color, 3)
-
-                if self.debug:
-                    # Display frame with detection
-                    cv2.imshow("Image", frame)
-                    cv2.waitKey(0)
-                    cv2.destroyAllWindows()
+        try:
+            fps, frames, _, _ = get_capture_details(cap=video)
+            frame_rate = int(fps)
+
+            # Convert rate, start and end to frames
+            rate = max(int(rate * frame_rate), 1)
+            start = round(start * frame_rate)
+            if end is None:
+                end = frames
+            else:
+                end = round(end * frame_rate)
+
+            # Analyze clip in batches of frames
+            analyzed = 0
+            timer = time.time()
+            batch = []
+            for i, frame in sample_frames(cap=video, start=start, end=end, step=rate):
+                batch.append((int(i / frame_rate), frame))
+                if len(batch) == self.batch_size:
+                    res += self.detect_batch(batch=batch, thresh=thresh)
+                    analyzed += len(batch)
+                    batch = []
+            if batch:
+                res += self.detect_batch(batch=batch, thresh=thresh)
+                analyzed += len(batch)
+        finally:
+            video.release()
+
+        elapsed = time.time() - timer
+        logging.info(msg="Analyzed {0} frames of {1} in {2:.1f} s ({3:.1f} frames/s)".format(
+            analyzed, clip, elapsed, analyzed / elapsed if elapsed else 0))
 
         return res
+
+    def detect_batch(self, batch: List[Tuple[int, np.ndarray]], thresh: float) -> List[Tuple[str, int]]:
+        """
+        Detects objects in a batch of frames with one forward pass through YOLO.
+
+        :param batch: List of tuples with time in seconds and decoded frame.
+        :param thresh: YOLO confidence threshold.
+        :return: List of tuples with object class and time in seconds when it was detected.
+        """
+        res = []
+
+        # Detect objects
+        blob = cv2.dnn.blobFromImages([frame for _, frame in batch], 0.00392, (416, 416), (0, 0, 0), True,
+                                      crop=False)
+        self.net.setInput(blob)
+        outs = [out.reshape(len(batch), -1, out.shape[-1]) for out in self.net.forward(self.output_layers)]
+
+        for b, (sec, frame) in enumerate(batch):
+            height, width = frame.shape[:2]
+
+            # Process result of object detection.
+            class_ids = []
+            confidences = []
+            boxes = []
+            for out in outs:
+                for detection in out[b]:
+                    scores = detection[5:]
+                    class_id = np.argmax(scores)
+                    confidence = scores[class_id]
+                    if confidence > thresh:
+                        # Detected object
+                        center_x = int(detection[0] * width)
+                        center_y = int(detection[1] * height)
+                        w = int(detection[2] * width)
+                        h = int(detection[3] * height)
+
+                        # Rectangle coordinates
+                        x = int(center_x - w / 2)
+                        y = int(center_y - h / 2)
+                        boxes.append([x, y, w, h])
+                        confidences.append(float(confidence))
+                        class_ids.append(class_id)
+
+            # Non maximum suppression
+            indexes = np.array(cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)).flatten()
+
+            # Label result
+            for j in range(len(boxes)):
+                if j in indexes:
+                    # Add detected object to res
+                    label = str(self.classes[class_ids[j]])
+                    res.append((label, sec))
+
+                    if self.debug:
+                        x, y, w, h = boxes[j]
+                        color = self.colors[j]
+                        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                        cv2.putText(frame, label, (x, y + 30), cv2.FONT_HERSHEY_PLAIN, 3, color, 3)
+
+            if self.debug:
+                # Display frame with detection
+                cv2.imshow("Image", frame)
+                cv2.waitKey(0)
+                cv2.destroyAllWindows()
+
+        return res
+
+
+# --- Scheduler ---
+
+scheduler = None  # The scheduler of this process, created when first used
+detector = None  # The object detector of a worker process
+
+
+def get_scheduler() -> 'DetectionScheduler':
+    """
+    Gets the scheduler used for all object detection in this process.
+
+    :return: The scheduler.
+    """
+    global scheduler
+    if scheduler is None:
+        scheduler = DetectionScheduler()
+    return scheduler
+
+
+def init_worker(yolov: str, batch_size: int) -> None:
+    """
+    Sets up a worker process and loads YOLO once for all clips analyzed by it.
+
+    :param yolov: YOLO version.
+    :param batch_size: Number of frames analyzed by YOLO at a time.
+    """
+    global detector
+    django.setup()
+    cv2.setNumThreads(1)  # One process per core instead
+    detector = ObjectDetector(yolov=yolov, batch_size=batch_size)
+
+
+def detect_in_worker(clip: str, rate: float, intervals: List[Tuple[float, Optional[float]]]) -> \
+        List[Tuple[str, int]]:
+    """
+    Detects objects in parts of a clip with the object detector of the worker process.
+
+    :param clip: Absolute path to clip.
+    :param rate: Seconds between each analyzed frame.
+    :param intervals: List of tuples with which second in clip to start and end object detection.
+    :return: List of tuples with object class and time in seconds when it was detected.
+    """
+    res = []
+    for start, end in intervals:
+        res += detector.detect(clip=clip, rate=rate, start=start, end=end)
+    return res
+
+
+class DetectionScheduler:
+    """
+    Runs object detection in a fixed pool of worker processes which load YOLO once.
+
+    Requests are stored as one detection job per clip, so pending jobs are picked up again if the server is restarted.
+    Clips are taken from the requests in turn so a large request doesn't block other requests, and only a
+    bounded number of clips are queued in the pool at a time. Results are saved by the scheduler's thread.
+    Clips that have already been analyzed with the same sample rate and interval are skipped, and earlier object
+    detections with a finer sample rate are reused for the frames they have analyzed.
+    """
+
+    def __init__(self, processes: int = None, queue_size: int = None, yolov: str = 'yolov3-tiny',
+                 batch_size: int = 8):
+        """
+        :param processes: Number of worker processes (default: number of CPUs).
+        :param queue_size: Maximum number of clips queued in the pool (default: twice the number of processes).
+        :param yolov: YOLO version.
+        :param batch_size: Number of frames analyzed by YOLO at a time.
+        """
+        self.processes = processes or os.cpu_count()
+        self.queue_size = queue_size or 2 * self.processes
+        self.yolov = yolov
+        self.batch_size = batch_size
+        self.requests = deque()  # Progress ids of requests with pending jobs
+        self.lock = threading.Lock()
+        self.wakeup = Future()
+        self.thread = None
+
+    def submit(self, cids: List[int], pid: int, rate: int, start_time: Optional[timezone.datetime],
+               end_time: Optional[timezone.datetime]) -> None:
+        """
+        Adds a request to run object detection on the given clips. Starts the scheduler if not already started.
+
+        :param cids: List of clip id:s.
+        :param pid: Progress id.
+        :param rate: Seconds between each analyzed frame.
+        :param start_time: Start time of object detection.
+        :param end_time: End time of object detection.
+        """
+        create_detection_jobs(pid=pid, cids=cids, sample_rate=rate, start_time=start_time, end_time=end_time)
+        self.enqueue(pids=[pid])
+
+    def start(self) -> None:
+        """
+        Starts the scheduler, which first picks up the jobs that were pending or running when it was last stopped.
+        """
+        self.enqueue(pids=[])
+
+    def enqueue(self, pids: List[int]) -> None:
+        """
+        Adds requests with pending jobs to be scheduled and wakes up the scheduler.
+
+        :param pids: Progress ids of the requests.
+        """
+        with self.lock:
+            for pid in pids:
+                if pid not in self.requests:
+                    self.requests.append(pid)
+            if not self.wakeup.done():
+                self.wakeup.set_result(None)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def next_job(self) -> Optional[DetectionJob]:
+        """
+        Takes the next job to run, one job from each request in turn.
+
+        :return: The job or None if there are no pending jobs.
+        """
+        with self.lock:
+            while self.requests:
+                pid = self.requests.popleft()
+                job = take_detection_job(pid=pid)
+                if job is not None:
+                    self.requests.append(pid)
+                    return job
+            return None
+
+    def run(self) -> None:
+        """
+        Gives clips to the worker processes and saves the results, forever.
+        A new pool of worker processes is made if a worker process dies or can't be set up.
+        """
+        self.enqueue(pids=reset_detection_jobs())
+
+        while True:
+            try:
+                self.run_pool()
+            except Exception as e:
+                logging.error(msg="Object detection scheduler failed: {0!r}".format(e))
+                time.sleep(1)  # Don't spin if the failure persists
+
+    def run_pool(self) -> None:
+        """
+        Gives clips to a new pool of worker processes and saves the results until the pool breaks.
+        Jobs that are running when the pool breaks or the scheduler fails are failed.
+        """
+        running = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.processes, initializer=init_worker,
+                                     initargs=(self.yolov, self.batch_size)) as pool:
+                while True:
+                    # Reset before taking jobs so a request submitted after this wakes up the scheduler
+                    with self.lock:
+                        if self.wakeup.done():
+                            self.wakeup = Future()
+                        wakeup = self.wakeup
+
+                    while len(running) < self.queue_size:
+                        job = self.next_job()
+                        if job is None:
+                            break
+                        planned = self.plan_job(job=job, pool=pool)
+                        if planned is not None:
+                            future, start_time, end_time, objects = planned
+                            running[future] = (job, start_time, end_time, objects)
+
+                    done, _ = wait(list(running) + [wakeup], return_when=FIRST_COMPLETED)
+                    broken = False
+                    for future in done:
+                        if future is wakeup:
+                            continue
+                        job, start_time, end_time, objects = running.pop(future)
+                        try:
+                            save_detection(clip=job.clip, rate=job.sample_rate, start_time=start_time,
+                                           end_time=end_time, res=objects + future.result())
+                        except Exception as e:
+                            logging.error(msg="Object detection failed for {0}: {1!r}".format(job.clip, e))
+                            finish_detection_job(jid=job.id, failed=True)
+                            broken |= isinstance(e, BrokenExecutor)
+                        else:
+                            finish_detection_job(jid=job.id)
+                    if broken:
+                        return
+        except BrokenExecutor as e:
+            logging.error(msg="Object detection worker processes failed: {0!r}".format(e))
+        finally:
+            for job, _, _, _ in running.values():
+                finish_detection_job(jid=job.id, failed=True)
+
+    @staticmethod
+    def plan_job(job: DetectionJob, pool: ProcessPoolExecutor) -> Optional[tuple]:
+        """
+        Finds the parts of the clip of a job that need to be analyzed and gives them to the worker processes.
+        Jobs that are already done are finished and jobs that can't be planned are failed.
+
+        :param job: The job.
+        :param pool: The pool of worker processes.
+        :return: A future of the objects found by the worker processes, the detected time interval and the objects
+                 reused from earlier detections, or None if the job is finished.
+        :raises BrokenExecutor: If the pool is broken, after the job is failed.
+        """
+        try:
+            start_sec, end_sec, start_time, end_time = get_detection_interval(
+                clip=job.clip, start_time=job.start_time, end_time=job.end_time)
+            if (end_sec is not None and start_sec >= end_sec) or object_detection_exists(
+                    cid=job.clip.id, sample_rate=job.sample_rate, start_time=start_time, end_time=end_time):
+                finish_detection_job(jid=job.id)
+                return None
+
+            # Only run object detection where earlier detections can't be reused
+            gaps, objects = plan_detection(
+                clip=job.clip, rate=job.sample_rate, start_sec=start_sec, end_sec=end_sec,
+                detections=get_finer_object_detections(cid=job.clip.id, sample_rate=job.sample_rate,
+                                                        start_time=start_time, end_time=end_time))
+            future = Future()
+            if gaps:
+                future = pool.submit(detect_in_worker, clip=replace_sep(str(job.clip)), rate=job.sample_rate,
+                                     intervals=gaps)
+            else:
+                future.set_result([])
+            return future, start_time, end_time, objects
+        except Exception as e:
+            logging.error(msg="Object detection failed for {0}: {1!r}".format(job.clip, e))
+            finish_detection_job(jid=job.id, failed=True)
+            if isinstance(e, BrokenExecutor):
+                raise
+            return None
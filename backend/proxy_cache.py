@@ -0,0 +1,271 @@
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import cv2
+from django.conf import settings
+from django.db import connection
+
+from .database_wrapper import get_all_unplayable_clips
+from .video_probe import get_capture_details
+
+# This file represents the backend Proxy Cache.
+# Clips that can't be played in the browser are transcoded to smaller WebM proxies, which are streamed instead.
+
+PROXY_FORMAT = 'webm'
+PROXY_CONTENT_TYPE = 'video/webm'
+
+# Priorities of proxies to generate, lowest first
+VIEWED = 0
+BACKGROUND = 1
+
+generator = None
+
+
+def get_proxy_generator() -> 'ProxyGenerator':
+    """
+    Gets the proxy generator of the server.
+
+    :return: The proxy generator.
+    """
+    global generator
+    if generator is None:
+        generator = ProxyGenerator(cache=ProxyCache(directory=settings.PROXY_CACHE_DIR,
+                                                    max_size=settings.PROXY_CACHE_SIZE),
+                                   max_height=settings.PROXY_MAX_HEIGHT)
+    return generator
+
+
+def transcode(src: str, dst: str, max_height: int) -> None:
+    """
+    Transcodes a clip to VP8 in WebM, scaled down to at most the given height.
+    The proxy is written to a temporary file first, so a partly written proxy is never served.
+
+    :param src: Absolute path to the clip.
+    :param dst: Path of the proxy.
+    :param max_height: Largest height of the proxy in pixels.
+    """
+    root, ext = os.path.splitext(dst)
+    tmp = root + '.part' + ext  # OpenCV picks the container from the extension
+
+    cap = cv2.VideoCapture(src)
+    try:
+        fps, frames, width, height = get_capture_details(cap=cap)
+        if not cap.isOpened() or not width or not height:
+            raise ValueError("Could not read {0}.".format(src))
+
+        # Keep the aspect ratio and even dimensions
+        scale = min(1.0, max_height / height)
+        size = (max(2 * round(width * scale / 2), 2), max(2 * round(height * scale / 2), 2))
+
+        writer = cv2.VideoWriter(tmp, cv2.VideoWriter_fourcc(*'VP80'), fps or 25, size)
+        try:
+            if not writer.isOpened():
+                raise ValueError("Could not write {0}.".format(tmp))
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    break
+                if (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+        finally:
+            writer.release()
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        cap.release()
+
+    os.replace(tmp, dst)
+
+
+class ProxyCache:
+    """
+    A directory of proxies which is kept below a size limit by removing the least recently used proxies.
+    The access time of a proxy is its last use, while its modification time is kept for the ETag.
+    A proxy is named after the path, size and modification time of its clip, so a clip that is changed gets a new
+    proxy.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        """
+        :param directory: Path to the directory of the proxies.
+        :param max_size: Largest total size of the proxies in bytes.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def get_path(self, src: str) -> str:
+        """
+        Gets the path of the proxy of a clip, which may not exist yet.
+
+        :param src: Absolute path to the clip.
+        :return: Path of the proxy.
+        """
+        stat = os.stat(src)
+        key = '{0}:{1}:{2}'.format(os.path.abspath(src), stat.st_size, stat.st_mtime_ns)
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.' + PROXY_FORMAT)
+
+    def lookup(self, src: str) -> Optional[str]:
+        """
+        Gets the proxy of a clip and marks it as used.
+
+        :param src: Absolute path to the clip.
+        :return: Path of the proxy or None if there is no proxy.
+        """
+        path = self.get_path(src=src)
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def contains(self, src: str) -> bool:
+        """
+        Checks if there is a proxy of a clip, without marking it as used.
+
+        :param src: Absolute path to the clip.
+        :return: Whether there is a proxy of the clip.
+        """
+        try:
+            return os.path.exists(self.get_path(src=src))
+        except FileNotFoundError:
+            return False  # The clip is gone
+
+    def get_proxies(self) -> list:
+        """
+        Gets the proxies in the cache, least recently used first.
+
+        :return: A list of os.DirEntry.
+        """
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.' + PROXY_FORMAT) and
+                       not e.name.endswith('.part.' + PROXY_FORMAT)]
+        except FileNotFoundError:
+            return []
+        return sorted(entries, key=lambda e: e.stat().st_atime_ns)
+
+    def is_full(self) -> bool:
+        """
+        :return: Whether the proxies have reached the size limit.
+        """
+        return sum(e.stat().st_size for e in self.get_proxies()) >= self.max_size
+
+    def add(self, path: str, evict: bool) -> bool:
+        """
+        Keeps a newly written proxy if it fits in the cache.
+
+        :param path: Path of the proxy.
+        :param evict: Whether the least recently used proxies may be removed to make room, else the new proxy is
+                      removed if it doesn't fit.
+        :return: Whether the proxy was kept.
+        """
+        with self.lock:
+            proxies = self.get_proxies()
+            size = sum(e.stat().st_size for e in proxies)
+            for e in proxies:
+                if size <= self.max_size:
+                    break
+                if evict and e.path != path:
+                    size -= e.stat().st_size
+                    os.remove(e.path)
+            if size > self.max_size:
+                os.remove(path)
+                return False
+            return True
+
+
+class ProxyGenerator:
+    """
+    Generates proxies one at a time in a background thread. Proxies of clips being viewed are generated first and
+    may push out the least recently used proxies. In the meantime proxies of all clips that can't be played are
+    generated while the cache has room.
+    """
+
+    def __init__(self, cache: ProxyCache, max_height: int):
+        """
+        :param cache: The cache the proxies are written to.
+        :param max_height: Largest height of the proxies in pixels.
+        """
+        self.cache = cache
+        self.max_height = max_height
+        self.queue = []  # Heap of (priority, order, clip path)
+        self.queued = set()
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self) -> None:
+        """
+        Starts generating proxies, beginning with finding the clips that can't be played.
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def request(self, path: str, priority: int = VIEWED) -> None:
+        """
+        Adds a clip to generate a proxy of and starts the generator if not already started.
+
+        :param path: Absolute path to the clip.
+        :param priority: VIEWED or BACKGROUND.
+        """
+        with self.condition:
+            if (priority, path) not in self.queued:
+                self.queued.add((priority, path))
+                heapq.heappush(self.queue, (priority, next(self.order), path))
+                self.condition.notify()
+        self.start()
+
+    def next_request(self) -> (int, str):
+        """
+        Waits for and takes the clip with the highest priority.
+
+        :return: Priority and path of the clip.
+        """
+        with self.condition:
+            while not self.queue:
+                self.condition.wait()
+            priority, _, path = heapq.heappop(self.queue)
+            self.queued.discard((priority, path))
+            return priority, path
+
+    def generate(self, path: str, priority: int) -> None:
+        """
+        Generates the proxy of a clip, unless it exists or is requested in the background and the cache is full.
+
+        :param path: Absolute path to the clip.
+        :param priority: VIEWED or BACKGROUND.
+        """
+        dst = self.cache.get_path(src=path)
+        if os.path.exists(dst) or priority != VIEWED and self.cache.is_full():
+            return
+        os.makedirs(self.cache.directory, exist_ok=True)
+        transcode(src=path, dst=dst, max_height=self.max_height)
+        self.cache.add(path=dst, evict=priority == VIEWED)
+
+    def run(self) -> None:
+        """
+        Generates requested proxies, forever.
+        """
+        try:
+            for clip in get_all_unplayable_clips():
+                self.request(path=str(clip), priority=BACKGROUND)
+        finally:
+            connection.close()
+
+        while True:
+            priority, path = self.next_request()
+            try:
+                self.generate(path=path, priority=priority)
+            except Exception as e:
+                logging.error(msg="Could not generate proxy of {0}: {1!r}".format(path, e))
@@ -223,6 +223,16 @@ class GetClipsTest(TestCase):
         self.assertEqual(res[CLIPS][1]['objectdetection_set'], {'rate': 10, 'objects': {'person': 2}})
         self.assertEqual(res[CLIPS][2]['objectdetection_set'], None)
 
+    def test_any_class(self):
+        """
+        Test that all classes are counted and that the number of queries doesn't depend on the number of clips.
+        """
+        create_object_detection(cid=self.cid1, sample_rate=1, start_time=self.st, end_time=self.et,
+                                objects=[("dog", self.st), ("dog", self.st)])
+        with self.assertNumQueries(7):
+            code, res = get_clips(data={PROJECT_ID: self.pid})
+        self.assertEqual(res[CLIPS][0]['objectdetection_set'], {'rate': 1, 'objects': {'dog': 2}})
+
 
 class GetFilesTest(TestCase):
     @patch('backend.database_wrapper.create_hash_sum')
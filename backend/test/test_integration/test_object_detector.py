@@ -25,9 +25,8 @@ class DetectObjectsTest(TestCase):
                             end_time=self.et + timezone.timedelta(seconds=3 * i - 2),
                             width=256, height=240, frame_rate=42, camera_name=self.cm_name))
 
-    @patch('backend.object_detector.ObjectDetector')
-    @patch('backend.object_detector.threading')
-    def test_basic(self, mock_threading, mock_od):
+    @patch('backend.object_detector.get_scheduler')
+    def test_basic(self, mock_get_scheduler):
         """
         Makes a simple call.
         """
@@ -190,6 +190,21 @@ class GetCamerasTest(TestCase):
         self.assertEqual(len(res[CAMERAS][0]['clip_set']), 2)
         self.assertEqual(len(res[CAMERAS][1]['clip_set']), 1)
 
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_queries(self, mock_create_hash_sum):
+        """
+        Tests that the number of queries doesn't grow with the number of cameras and clips.
+        """
+        for i in range(10):
+            mock_create_hash_sum.return_value = 'hash{0}'.format(i)
+            create_clip(fid=self.sid, clip_name="test_clip{0}".format(i + 4), video_format="tvf",
+                        start_time=self.st, end_time=self.et, latitude=self.lat, longitude=self.lon + i,
+                        width=256, height=240, frame_rate=42.0, camera_name="Camera {0}".format(i))
+        with self.assertNumQueries(4):
+            code, res = get_cameras(data={PROJECT_ID: self.pid})
+        self.assertEqual(len(res[CAMERAS]), 12)
+        self.assertEqual(sum(len(cm['clip_set']) for cm in res[CAMERAS]), 13)
+
     def test_non_existing_project(self):
         """
         Test with a project id that doesn't exist.
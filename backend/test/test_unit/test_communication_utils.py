@@ -1,8 +1,10 @@
+from decimal import Decimal
 from unittest.mock import patch
 from django.test import TestCase
 
 # Import module
 from backend.communication_utils import *
+from backend.database_wrapper import create_root_folder, create_subfolder, create_clip, get_clip_by_id
 
 
 class OSAware(TestCase):
@@ -31,3 +33,23 @@ class OSAware(TestCase):
         mock_os.path.sep = '\\'
         self.assertEqual(os_aware(self.data_linux), self.data_windows)
         self.assertEqual(os_aware(self.data_windows), self.data_windows)
+
+
+class GetProjectPath(TestCase):
+
+    @patch('backend.database_wrapper.create_hash_sum')
+    def setUp(self, mock_create_hash_sum) -> None:
+        mock_create_hash_sum.return_value = '1234'
+        self.rid = create_root_folder(path='/home/user/', name='test_folder')
+        self.sid = create_subfolder(parent_fid=self.rid, name='test_subfolder')
+        self.cid = create_clip(fid=self.sid, clip_name='test_clip', video_format='tvf',
+                               start_time=timezone.now() - timezone.timedelta(hours=1), end_time=timezone.now(),
+                               latitude=Decimal('0.0'), longitude=Decimal('0.0'), width=256, height=240,
+                               frame_rate=42.0, camera_name='test_camera')
+
+    def test_no_queries(self):
+        clip = get_clip_by_id(cid=self.cid)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_path(clip=clip),
+                             os.path.join('test_folder', 'test_subfolder', 'test_clip.tvf'))
+            self.assertEqual(str(clip), '/home/user/test_folder/test_subfolder/test_clip.tvf')
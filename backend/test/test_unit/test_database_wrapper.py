@@ -1,6 +1,7 @@
-from django.db import IntegrityError
-from django.db.models import ProtectedError
+from django.db import IntegrityError, connection
+from django.db.models import ProtectedError, QuerySet
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from backend.database_wrapper import *
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -557,6 +558,42 @@ class GetSubFoldersRecursiveTest(BaseTestCases.FolderTest):
         """
         self.assertRaises(AssertionError, lambda: get_subfolders_recursive(999))
 
+    def test_one_query(self):
+        """
+        Test that subfolders at all levels are fetched with one query
+        """
+        self.assertNumQueries(2, lambda: get_subfolders_recursive(fid=self.rid))
+
+    def test_lineage(self):
+        """
+        Test that the lineage contains the ids of all ancestors
+        """
+        self.assertEqual(get_folder_by_id(fid=self.sid2).get_ancestor_ids(), [self.rid, self.sid, self.sid2])
+
+    def test_move(self):
+        """
+        Test that the lineage of the whole subtree is updated when a folder is moved
+        """
+        rid2 = create_root_folder(path="/home/other/", name=self.r_name)
+        folder = get_folder_by_id(fid=self.sid)
+        folder.parent = get_folder_by_id(fid=rid2)
+        folder.save()
+        self.assertEqual(get_folder_by_id(fid=self.sid2).get_ancestor_ids(), [rid2, self.sid, self.sid2])
+        self.assertEqual(get_subfolders_recursive(fid=self.rid), [])
+        self.assertEqual(len(get_subfolders_recursive(fid=rid2)), 2)
+        self.assertEqual(str(get_folder_by_id(fid=self.sid2)), "/home/other/test_folder/test_subfolder/" +
+                         self.s_s_name)
+
+    def test_rename(self):
+        """
+        Test that the path of the whole subtree is updated when a folder is renamed
+        """
+        folder = get_folder_by_id(fid=self.rid)
+        folder.name = "renamed"
+        folder.save()
+        self.assertEqual(str(get_folder_by_id(fid=self.sid2)), "/home/user/renamed/test_subfolder/" + self.s_s_name)
+        self.assertEqual(get_folder_by_id(fid=self.sid2).get_tree_path(), ["renamed", self.s_name, self.s_s_name])
+
 
 class DeleteFolderTest(BaseTestCases.FolderTest):
     def setUp(self) -> None:
@@ -809,6 +846,146 @@ class CreateClipTest(BaseTestCases.ClipTest):
         self.assertEqual(clip.duplicates.count(), 0)
 
 
+class CreateClipsBulkTest(BaseTestCases.ClipTest):
+    def clip_info(self, name: str, start_time: timezone.datetime, end_time: timezone.datetime, **kwargs) -> dict:
+        """
+        Creates a clip info dict with default values for the test camera.
+        """
+        return {'fid': self.fid, 'clip_name': name, 'video_format': 'tvf', 'start_time': start_time,
+                'end_time': end_time, 'latitude': self.lat, 'longitude': self.lon, 'width': 256, 'height': 240,
+                'frame_rate': 42.0, 'camera_name': self.cm_name, 'hash_sum': name, **kwargs}
+
+    def test_empty(self):
+        """
+        Test creating no clips.
+        """
+        self.assertEqual(create_clips_bulk(clips=[]), [])
+
+    def test_create(self):
+        """
+        Test that clips, cameras and resolutions are created and reused like in create_clip.
+        """
+        new_st = self.st - timezone.timedelta(hours=1)
+        new_et = self.et + timezone.timedelta(hours=1)
+        cids = create_clips_bulk(clips=[
+            self.clip_info("before", new_st, self.st),
+            self.clip_info("after", self.et, new_et, video_format='mp4'),
+            self.clip_info("other", self.st, self.et, latitude=self.lon, longitude=self.lat, width=10, height=20),
+            self.clip_info("test_clip", self.st, self.et),
+        ])
+        self.assertEqual(len(set(cids)), 4)
+        self.assertEqual(cids[3], self.cid)
+        self.assertEqual(Clip.objects.count(), 4)
+        self.assertEqual(Camera.objects.count(), 2)
+        self.assertEqual(Resolution.objects.count(), 2)
+        self.assertEqual(get_clip_by_id(cid=cids[0]).camera.id, get_clip_by_id(cid=self.cid).camera.id)
+        self.assertTrue(get_clip_by_id(cid=cids[1]).playable)
+        self.assertFalse(get_clip_by_id(cid=cids[0]).playable)
+        cm = get_camera_by_location(latitude=self.lat, longitude=self.lon)
+        self.assertEqual(cm.start_time, new_st)
+        self.assertEqual(cm.end_time, new_et)
+
+    def test_duplicates_and_overlap(self):
+        """
+        Test that duplicates and overlapping clips are found.
+        """
+        cid2, cid3 = create_clips_bulk(clips=[
+            self.clip_info("duplicate", self.st, self.et, hash_sum='1234'),
+            self.clip_info("overlap", self.st + timezone.timedelta(minutes=30), self.et + timezone.timedelta(hours=1)),
+        ])
+        clip = get_clip_by_id(cid=self.cid)
+        self.assertEqual([c.id for c in clip.duplicates.all()], [cid2])
+        self.assertEqual({c.id for c in clip.overlap.all()}, {cid3})
+
+    def test_bad_time(self):
+        """
+        Test that no clips are created if one of them is invalid.
+        """
+        self.assertRaises(ValidationError, create_clips_bulk, clips=[
+            self.clip_info("valid", self.st, self.et), self.clip_info("invalid", self.et, self.st)])
+        self.assertEqual(Clip.objects.count(), 1)
+
+    def test_bad_folder(self):
+        """
+        Test that clips in a non existing folder asserts.
+        """
+        self.assertRaises(AssertionError, create_clips_bulk, clips=[self.clip_info("clip", self.st, self.et, fid=999)])
+
+    def test_number_of_queries(self):
+        """
+        Test that the number of queries doesn't depend on the number of clips.
+        """
+        def create(prefix: str, n: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                create_clips_bulk(clips=[self.clip_info(prefix + str(i), self.st + timezone.timedelta(minutes=i),
+                                                        self.et + timezone.timedelta(minutes=i)) for i in range(n)])
+            return len(queries)
+
+        self.assertEqual(create("a", 3), create("b", 10))
+
+
+class FindDuplicateOverlappingClipsTest(BaseTestCases.ClipTest):
+    def setUp(self) -> None:
+        """
+        Set up clips on one camera, starting every 30 minutes and one hour long.
+        """
+        super().setUp()
+        self.cmid = get_clip_by_id(cid=self.cid).camera.id
+        self.cids = create_clips_bulk(clips=[{
+            'fid': self.fid, 'clip_name': 'clip' + str(i), 'video_format': 'tvf',
+            'start_time': self.et + timezone.timedelta(minutes=30 * i),
+            'end_time': self.et + timezone.timedelta(minutes=30 * i + 60), 'latitude': self.lat,
+            'longitude': self.lon, 'width': 256, 'height': 240, 'frame_rate': 42.0, 'camera_name': self.cm_name,
+            'hash_sum': 'hash' + str(i % 3)} for i in range(6)])
+
+    def assert_relations(self) -> None:
+        """
+        Asserts that the saved relations are the same as when comparing every pair of clips.
+        """
+        clips = Clip.objects.all()[::1]
+        for a in clips:
+            duplicates = {b.id for b in clips if b != a and b.hash_sum == a.hash_sum}
+            overlap = {b.id for b in clips if b != a and b.hash_sum != a.hash_sum and
+                       a.start_time < b.end_time and b.start_time < a.end_time}
+            self.assertEqual({c.id for c in a.duplicates.all()}, duplicates)
+            self.assertEqual({c.id for c in a.overlap.all()}, overlap)
+
+    def test_bulk(self):
+        """
+        Test that relations are found for clips created in bulk.
+        """
+        self.assert_relations()
+
+    def test_all(self):
+        """
+        Test that all relations on a camera are found again when they are missing.
+        """
+        Clip.duplicates.through.objects.all().delete()
+        Clip.overlap.through.objects.all().delete()
+        find_duplicate_overlapping_clips(cmid=self.cmid)
+        self.assert_relations()
+
+    def test_incremental(self):
+        """
+        Test that only relations to the given clip are added.
+        """
+        Clip.duplicates.through.objects.all().delete()
+        Clip.overlap.through.objects.all().delete()
+        find_duplicate_overlapping_clips(cmid=self.cmid, cids=[self.cids[1]])
+        clip = get_clip_by_id(cid=self.cids[1])
+        self.assertEqual({c.id for c in clip.duplicates.all()}, {self.cids[4]})
+        self.assertEqual({c.id for c in clip.overlap.all()}, {self.cids[0], self.cids[2]})
+        self.assertEqual(get_clip_by_id(cid=self.cids[3]).overlap.count(), 0)
+
+    def test_twice(self):
+        """
+        Test that existing relations are kept when checking again.
+        """
+        find_duplicate_overlapping_clips(cmid=self.cmid)
+        find_duplicate_overlapping_clips(cmid=self.cmid, cids=self.cids)
+        self.assert_relations()
+
+
 class GetClipByIdTest(BaseTestCases.ClipTest):
     def test_existing_cid(self):
         """
@@ -862,6 +1039,87 @@ class DeleteClipTest(BaseTestCases.ClipTest):
         self.assertEqual(Clip.objects.count(), 1)
 
 
+class GetAllUnplayableClipsTest(BaseTestCases.ClipTest):
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_unplayable(self, mock_create_hash_sum):
+        """
+        Test that only clips that can't be played are returned.
+        """
+        cid = create_clip(fid=self.fid, clip_name="test_clip", video_format="mp4", start_time=self.st,
+                          end_time=self.et, latitude=self.lat, longitude=self.lon, width=256, height=240,
+                          frame_rate=42.0, camera_name=self.cm_name)
+        with self.assertNumQueries(1):
+            clips = get_all_unplayable_clips()
+            self.assertEqual([str(clip) for clip in clips], ['/home/user/test_folder/test_clip.tvf'])
+        self.assertTrue(get_clip_by_id(cid=cid).playable)
+
+
+class GetNextClipTest(BaseTestCases.ClipTest):
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_next_clip(self, mock_create_hash_sum):
+        """
+        Test that the clip starting first within the gap is found, in one query using the camera and time index.
+        """
+        cids = [create_clip(fid=self.fid, clip_name="test_clip{0}".format(s), video_format="tvf",
+                            start_time=self.et + timezone.timedelta(seconds=s),
+                            end_time=self.et + timezone.timedelta(seconds=s + 60), latitude=self.lat,
+                            longitude=self.lon, width=256, height=240, frame_rate=42.0, camera_name=self.cm_name)
+                for s in [3, 1, 10]]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_next_clip(cid=self.cid, max_gap=timezone.timedelta(seconds=5)), cids[1])
+        self.assertEqual(len(queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            self.assertIn('clip_camera_time_idx', str(cursor.fetchall()))
+        self.assertIsNone(get_next_clip(cid=cids[2], max_gap=timezone.timedelta(seconds=5)))
+
+    def test_no_next_clip(self):
+        """
+        Test that a clip is not its own next clip.
+        """
+        self.assertIsNone(get_next_clip(cid=self.cid, max_gap=timezone.timedelta(hours=2)))
+
+
+class GetPlaybackChainInCameraTest(BaseTestCases.ClipTest):
+    @patch('backend.database_wrapper.create_hash_sum')
+    def setUp(self, mock_create_hash_sum) -> None:
+        """
+        Create clips of a minute each after the first clip, with gaps of various lengths.
+        """
+        super().setUp()
+        self.gap = timezone.timedelta(seconds=5)
+        self.cids = [self.cid]
+        for s in [3, 1, 64, 200, 262]:
+            self.cids.append(create_clip(fid=self.fid, clip_name="test_clip{0}".format(s), video_format="tvf",
+                                         start_time=self.et + timezone.timedelta(seconds=s),
+                                         end_time=self.et + timezone.timedelta(seconds=s + 60), latitude=self.lat,
+                                         longitude=self.lon, width=256, height=240, frame_rate=42.0,
+                                         camera_name=self.cm_name))
+        self.cmid = get_clip_by_id(cid=self.cid).camera_id
+
+    def test_chain(self):
+        """
+        Test that the clips come in order of start time with the same next clips as get_next_clip, in two queries.
+        """
+        with self.assertNumQueries(2):
+            chain = get_playback_chain_in_camera(cmid=self.cmid, start_time=self.st,
+                                                 end_time=self.et + timezone.timedelta(seconds=230), max_gap=self.gap)
+        self.assertEqual([clip.id for clip, _ in chain], [self.cids[i] for i in [0, 2, 1, 3, 4]])
+        self.assertEqual([next_cid for _, next_cid in chain], [self.cids[2], self.cids[3], self.cids[3], None,
+                                                                self.cids[5]])
+        for clip, next_cid in chain:
+            self.assertEqual(get_next_clip(cid=clip.id, max_gap=self.gap), next_cid)
+
+    def test_no_clips(self):
+        """
+        Test an interval without clips.
+        """
+        with self.assertNumQueries(1):
+            chain = get_playback_chain_in_camera(cmid=self.cmid, start_time=self.et + timezone.timedelta(hours=1),
+                                                 end_time=self.et + timezone.timedelta(hours=2), max_gap=self.gap)
+        self.assertEqual(chain, [])
+
+
 class GetAllClipsFromFolderTest(BaseTestCases.ClipTest):
     @patch('backend.database_wrapper.create_hash_sum')
     def test_existing_fid(self, mock_create_hash_sum):
@@ -1112,6 +1370,8 @@ class GetObjectsInCameraTest(BaseTestCases.ObjectDetectionTest):
                                                    end_time=self.et + timezone.timedelta(minutes=2))), 2)
         self.assertEqual(len(get_objects_in_camera(cmid=self.cmid, end_time=self.et)), 1)
         self.assertEqual(len(get_objects_in_camera(cmid=self.cmid, start_time=self.et)), 4)
+        with self.assertNumQueries(3):
+            get_objects_in_camera(cmid=self.cmid)
 
 
 class CreateObjectDetectionTest(BaseTestCases.ObjectDetectionTest):
@@ -1177,6 +1437,29 @@ class AddObjectsToDetectionTest(BaseTestCases.ObjectDetectionTest):
         self.assertRaises(AssertionError, lambda:
         add_objects_to_detection(odid=999, objects=[("test_object2", self.st + timezone.timedelta(minutes=10))]))
 
+    def test_number_of_queries(self):
+        """
+        Test that the number of queries doesn't depend on the number of objects.
+        """
+        def add(n: int) -> int:
+            objects = [("test_object" + str(i % 3), self.st + timezone.timedelta(seconds=i)) for i in range(n)]
+            with CaptureQueriesContext(connection) as queries:
+                add_objects_to_detection(odid=self.odid, objects=objects)
+            return len(queries)
+
+        add(3)  # Create the object classes
+        self.assertEqual(add(10), add(100))
+        self.assertEqual(len(get_objects_in_detection(odid=self.odid)), 114)
+        self.assertEqual(ObjectClass.objects.count(), 4)
+
+    def test_bad_time(self):
+        """
+        Test that no objects are added if one of them is outside the object detection.
+        """
+        self.assertRaises(ValidationError, add_objects_to_detection, odid=self.odid,
+                          objects=[("test_object2", self.st), ("test_object2", self.et + timezone.timedelta(hours=1))])
+        self.assertEqual(len(get_objects_in_detection(odid=self.odid)), 1)
+
 
 class GetObjectsInDetectionTest(BaseTestCases.ObjectDetectionTest):
     def test_objects(self):
@@ -1196,6 +1479,58 @@ class GetObjectsInDetectionTest(BaseTestCases.ObjectDetectionTest):
                                             end_time=self.st + timezone.timedelta(minutes=12),
                                             object_classes=["test_object"])) == 1
 
+    def test_timeline(self):
+        """
+        Test that objects are read from the timeline of the object detection without loading them one by one.
+        """
+        add_objects_to_detection(odid=self.odid,
+                                 objects=[("test_object", self.st + timezone.timedelta(minutes=1)),
+                                          ("test_object", self.st + timezone.timedelta(minutes=1)),
+                                          ("another_test_object", self.st + timezone.timedelta(minutes=1))])
+        self.assertEqual(len(get_object_detection_by_id(odid=self.odid).get_timeline()), 3)
+        with self.assertNumQueries(2):
+            objects = get_objects_in_detection(odid=self.odid)
+        self.assertEqual(objects, [("test_object", self.st + timezone.timedelta(minutes=1)),
+                                   ("test_object", self.st + timezone.timedelta(minutes=1)),
+                                   ("another_test_object", self.st + timezone.timedelta(minutes=1)),
+                                   ("test_object", self.st + timezone.timedelta(minutes=5))])
+        self.assertEqual(objects[2].object_class, "another_test_object")
+
+
+class GetObjectCountsInClipsTest(BaseTestCases.ObjectDetectionTest):
+    def test_added_objects(self):
+        """
+        Test that the counts are kept up to date when objects are added to an object detection.
+        """
+        add_objects_to_detection(odid=self.odid,
+                                 objects=[("test_object", self.st + timezone.timedelta(minutes=1)),
+                                          ("another_test_object", self.st + timezone.timedelta(minutes=1)),
+                                          ("another_test_object", self.st + timezone.timedelta(minutes=2))])
+        self.assertEqual(get_object_counts_in_clips(cids=[self.cid]),
+                         {self.cid: (0.5, {"test_object": 2, "another_test_object": 2})})
+
+    def test_lowest_rate(self):
+        """
+        Test that the object detection with the lowest sample rate is summarized.
+        """
+        create_object_detection(cid=self.cid, sample_rate=0.25, start_time=self.st, end_time=self.et,
+                                objects=[("test_object", self.st), ("another_test_object", self.st),
+                                         ("another_test_object", self.et)])
+        create_object_detection(cid=self.cid, sample_rate=1, start_time=self.st, end_time=self.et,
+                                objects=[("yet_another_test_object", self.st)])
+        with self.assertNumQueries(1):
+            res = get_object_counts_in_clips(cids=[self.cid, 42])
+        self.assertEqual(res, {self.cid: (0.25, {"test_object": 1, "another_test_object": 2})})
+
+    def test_no_objects(self):
+        """
+        Test that an object detection without objects is summarized.
+        """
+        odid = create_object_detection(cid=self.cid, sample_rate=0.1, start_time=self.st, end_time=self.et)
+        self.assertEqual(get_object_counts_in_clips(cids=[self.cid]), {self.cid: (0.1, {})})
+        delete_object_detection(odid=odid)
+        self.assertEqual(get_object_counts_in_clips(cids=[self.cid]), {self.cid: (0.5, {"test_object": 1})})
+
 
 class GetAllExcludedClipsInFilterTest(BaseTestCases.FilterTest):
     def test_base(self):
@@ -1279,6 +1614,20 @@ class GetAllClipsInProject(BaseTestCases.ClipTest):
         add_folder_to_project(self.fid, self.pid)
         self.assertEqual(len(get_all_clips_in_project(self.pid)), 2)
 
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_sibling_folder(self, mock_create_hash_sum):
+        """
+        Tests that clips in a folder whose id starts with the same digits as a root folder aren't included
+        """
+        mock_create_hash_sum.return_value = '1234567'
+        fids = [create_root_folder(path="/home/other/", name="test" + str(i)) for i in range(10)]
+        create_clip(fid=fids[-1], clip_name="test_clip2", video_format="tvf", start_time=self.st,
+                    end_time=self.et, latitude=self.lat, longitude=self.lon, width=256, height=240,
+                    frame_rate=42.0, camera_name=self.cm_name)
+        with self.assertNumQueries(3):
+            clips = get_all_clips_in_project(self.pid)
+        self.assertEqual([c.id for c in clips], [self.cid])
+
 
 class GetAllMatchingClipsInFilter(BaseTestCases.FilterTest):
     def setUp(self) -> None:
@@ -1343,6 +1692,252 @@ class GetAllMatchingClipsInFilter(BaseTestCases.FilterTest):
         self.assertEqual(clips[0].id, self.cid)
 
 
+class GetMatchingClipsParityTest(TestCase):
+    @patch('backend.database_wrapper.create_hash_sum')
+    def setUp(self, mock_create_hash_sum) -> None:
+        """
+        Create a project with clips that differ in time, resolution, frame rate, location and detected objects.
+        """
+        mock_create_hash_sum.return_value = '1234'
+        self.st = timezone.datetime(2020, 1, 17, tzinfo=timezone.utc)
+        self.rid = create_root_folder(path="/home/user/", name="test_folder")
+        self.sid = create_subfolder(parent_fid=self.rid, name="test_subfolder")
+        self.lat = Decimal(value="59.0")
+        self.lon = Decimal(value="17.0")
+        self.cids = []
+        for i in range(6):
+            self.cids.append(create_clip(fid=self.rid if i % 2 else self.sid, clip_name="test_clip{}".format(i),
+                                         video_format="tvf", start_time=self.st + timezone.timedelta(hours=i),
+                                         end_time=self.st + timezone.timedelta(hours=i + 1),
+                                         latitude=self.lat + Decimal(i) / 100, longitude=self.lon,
+                                         width=256 * (i % 2 + 1), height=240 * (i % 2 + 1),
+                                         frame_rate=10.0 * (i + 1), camera_name="Test camera {}".format(i)))
+        create_object_detection(cid=self.cids[1], sample_rate=1, start_time=self.st + timezone.timedelta(hours=1),
+                                end_time=self.st + timezone.timedelta(hours=2),
+                                objects=[("car", self.st + timezone.timedelta(hours=1, minutes=10)),
+                                         ("person", self.st + timezone.timedelta(hours=1, minutes=50))])
+        create_object_detection(cid=self.cids[2], sample_rate=1, start_time=self.st + timezone.timedelta(hours=2),
+                                end_time=self.st + timezone.timedelta(hours=3),
+                                objects=[("car", self.st + timezone.timedelta(hours=2, minutes=10))])
+        self.pid = create_project(name="test_project")
+        add_folder_to_project(fid=self.rid, pid=self.pid)
+        self.fid = create_filter(pid=self.pid)
+
+    def assert_parity(self):
+        """
+        Asserts that the query and clip_match_filter agree on which clips match the filter.
+        """
+        f = get_filter_by_id(fid=self.fid)
+        expected = [c.id for c in get_all_clips_in_project(pid=self.pid) if f.clip_match_filter(c)]
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], sorted(expected))
+
+    def test_without_params(self):
+        """
+        Test a filter without any params.
+        """
+        self.assert_parity()
+        self.assertEqual(len(get_all_clips_matching_filter(fid=self.fid)), 6)
+
+    def test_time(self):
+        """
+        Test a filter with a time span that partially overlaps clips.
+        """
+        modify_filter(fid=self.fid, start_time=self.st + timezone.timedelta(hours=1, minutes=30),
+                      end_time=self.st + timezone.timedelta(hours=3))
+        self.assert_parity()
+
+    def test_resolution_and_frame_rate(self):
+        """
+        Test a filter with whitelisted resolutions and minimum frame rate.
+        """
+        modify_filter(fid=self.fid, whitelisted_resolutions=[{"height": 480, "width": 512}], min_frame_rate=30)
+        self.assert_parity()
+
+    def test_areas(self):
+        """
+        Test a filter with multiple areas.
+        """
+        create_area(latitude=self.lat, longitude=self.lon, radius=2000, fid=self.fid)
+        create_area(latitude=self.lat + Decimal("0.05"), longitude=self.lon, radius=10, fid=self.fid)
+        self.assert_parity()
+
+    def test_area_edge(self):
+        """
+        Test that cameras on the edge of an area are within it. The second camera is 1111.95 m north of the first.
+        """
+        aid = create_area(latitude=self.lat, longitude=self.lon, radius=1111, fid=self.fid)
+        self.assert_parity()
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], self.cids[:1])
+        delete_area(aid=aid, fid=self.fid)
+        create_area(latitude=self.lat, longitude=self.lon, radius=1112, fid=self.fid)
+        self.assert_parity()
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], self.cids[:2])
+
+    def test_bounding_box_error(self):
+        """
+        Test that the parity check catches cameras left out by the bounding boxes of the areas.
+        """
+        create_area(latitude=self.lat, longitude=self.lon, radius=2000, fid=self.fid)
+        with patch('backend.models.Area.get_bounding_box', return_value=Q(latitude__gt=self.lat)):
+            self.assertRaises(AssertionError, self.assert_parity)
+
+    def test_cameras_in_areas(self):
+        """
+        Test that the cameras within many areas are found in one query and then kept.
+        """
+        for i in range(0, 6, 2):
+            create_area(latitude=self.lat + Decimal(i) / 100, longitude=self.lon, radius=100, fid=self.fid)
+        f = get_filter_by_id(fid=self.fid)
+        with self.assertNumQueries(2):
+            cameras = f.cameras_in_areas
+        with self.assertNumQueries(0):
+            self.assertEqual(f.cameras_in_areas, cameras)
+        self.assertEqual(cameras, set(get_clip_by_id(cid=self.cids[i]).camera_id for i in range(0, 6, 2)))
+
+    def test_classes(self):
+        """
+        Test a filter with classes, inside and outside the time span of the filter.
+        """
+        modify_filter(fid=self.fid, classes=["car"])
+        self.assert_parity()
+        modify_filter(fid=self.fid, classes=["car", "person"])
+        self.assert_parity()
+        modify_filter(fid=self.fid, classes=["car"], start_time=self.st + timezone.timedelta(hours=1, minutes=30))
+        self.assert_parity()
+
+    def test_included_and_excluded(self):
+        """
+        Test a filter with included and excluded clips.
+        """
+        modify_filter(fid=self.fid, min_frame_rate=100, included_clips=[self.cids[0], self.cids[3]],
+                      excluded_clips=[self.cids[3], self.cids[4]])
+        self.assert_parity()
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], [self.cids[0]])
+
+
+class MatchingClipsCacheTest(BaseTestCases.FilterTest):
+    def setUp(self) -> None:
+        super().setUp()
+        add_folder_to_project(self.rid, self.pid)
+        get_all_clips_matching_filter(fid=self.fid)
+
+    def test_cached(self):
+        """
+        Test that the matching clips are materialized in the filter.
+        """
+        f = get_filter_by_id(fid=self.fid)
+        self.assertTrue(f.matching_clips_up_to_date)
+        self.assertEqual([c.id for c in f.matching_clips.all()], [self.cid])
+
+    def test_modify_filter(self):
+        """
+        Test that modifying the filter invalidates the matching clips.
+        """
+        modify_filter(fid=self.fid, min_frame_rate=100)
+        self.assertFalse(get_filter_by_id(fid=self.fid).matching_clips_up_to_date)
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+
+    def test_areas(self):
+        """
+        Test that creating and deleting areas invalidates the matching clips.
+        """
+        aid = create_area(latitude=Decimal("1.0"), longitude=Decimal("1.0"), radius=1, fid=self.fid)
+        self.assertFalse(get_filter_by_id(fid=self.fid).matching_clips_up_to_date)
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+        delete_area(aid=aid, fid=self.fid)
+        self.assertFalse(get_filter_by_id(fid=self.fid).matching_clips_up_to_date)
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], [self.cid])
+
+    def test_stale_filter(self):
+        """
+        Test that updating the matching clips doesn't undo changes made to the filter meanwhile.
+        """
+        modify_filter(fid=self.fid, min_frame_rate=1)
+        stale = get_filter_by_id(fid=self.fid)
+        modify_filter(fid=self.fid, min_frame_rate=100)
+        with patch('backend.database_wrapper.get_filter_by_id', return_value=stale):
+            get_all_clips_matching_filter(fid=self.fid)
+        self.assertEqual(get_filter_by_id(fid=self.fid).min_frame_rate, 100)
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+
+    def test_folder_moved(self):
+        """
+        Test that moving a folder into or out of the project invalidates the matching clips.
+        """
+        rid2 = create_root_folder(path="/home/", name="other_root")
+        folder = get_folder_by_id(fid=self.rid)
+        folder.parent = get_folder_by_id(fid=rid2)
+        folder.save()
+        self.assertFalse(get_filter_by_id(fid=self.fid).matching_clips_up_to_date)
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=self.fid)], [self.cid])
+
+        pid2 = create_project(name="test_project2")
+        sid = create_subfolder(parent_fid=rid2, name="test_subfolder")
+        add_folder_to_project(fid=sid, pid=pid2)
+        fid2 = create_filter(pid=pid2)
+        self.assertEqual(get_all_clips_matching_filter(fid=fid2), [])
+        folder = get_folder_by_id(fid=self.rid)
+        folder.parent = get_folder_by_id(fid=sid)
+        folder.save()
+        self.assertFalse(get_filter_by_id(fid=fid2).matching_clips_up_to_date)
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=fid2)], [self.cid])
+
+    def test_folder_removed_from_project(self):
+        """
+        Test that removing a folder from the project invalidates the matching clips.
+        """
+        delete_folder_from_project(fid=self.rid, pid=self.pid)
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_create_clip(self, mock_create_hash_sum):
+        """
+        Test that a new clip is matched individually without invalidating the matching clips.
+        """
+        mock_create_hash_sum.return_value = '1234'
+        sid = create_subfolder(parent_fid=self.rid, name="test_subfolder")
+        cid2 = create_clip(fid=sid, clip_name="test_clip2", video_format="tvf", start_time=self.st,
+                           end_time=self.et, latitude=self.lat, longitude=self.lon, width=256, height=240,
+                           frame_rate=42.0, camera_name=self.cm_name)
+        f = get_filter_by_id(fid=self.fid)
+        self.assertTrue(f.matching_clips_up_to_date)
+        self.assertEqual([c.id for c in f.matching_clips.all()], [self.cid, cid2])
+
+    def test_create_clips_bulk_outside_project(self):
+        """
+        Test that a batch of clips in folders inside and outside a project only adds the clips in the project.
+        """
+        rid2 = create_root_folder(path="/home/", name="root")
+        aid = create_subfolder(parent_fid=rid2, name="a")
+        bid = create_subfolder(parent_fid=rid2, name="b")
+        pid2 = create_project(name="test_project2")
+        add_folder_to_project(fid=aid, pid=pid2)
+        fid2 = create_filter(pid=pid2)
+        self.assertEqual(get_all_clips_matching_filter(fid=fid2), [])
+
+        cid_a, cid_b = create_clips_bulk(clips=[
+            {'fid': fid, 'clip_name': name, 'video_format': 'mp4', 'start_time': self.st, 'end_time': self.et,
+             'latitude': self.lat, 'longitude': self.lon, 'width': 256, 'height': 240, 'frame_rate': 42.0,
+             'camera_name': self.cm_name, 'hash_sum': name} for fid, name in [(aid, 'x'), (bid, 'y')]])
+        self.assertTrue(get_filter_by_id(fid=fid2).matching_clips_up_to_date)
+        self.assertEqual([c.id for c in get_all_clips_matching_filter(fid=fid2)], [cid_a])
+        self.assertEqual([c.id for c in get_all_clips_in_project(pid=pid2)], [cid_a])
+
+    def test_object_detection(self):
+        """
+        Test that new object detections rematch the clip without invalidating the matching clips.
+        """
+        modify_filter(fid=self.fid, classes=["car"])
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+        odid = create_object_detection(cid=self.cid, sample_rate=1, start_time=self.st, end_time=self.st,
+                                       objects=[("car", self.st)])
+        f = get_filter_by_id(fid=self.fid)
+        self.assertTrue(f.matching_clips_up_to_date)
+        self.assertEqual([c.id for c in f.matching_clips.all()], [self.cid])
+        delete_object_detection(odid=odid)
+        self.assertEqual(get_all_clips_matching_filter(fid=self.fid), [])
+
+
 class GetAllCamerasInProject(BaseTestCases.ClipTest):
     def setUp(self) -> None:
         super().setUp()
@@ -1373,6 +1968,23 @@ class GetAllCamerasInProject(BaseTestCases.ClipTest):
         add_folder_to_project(self.fid, self.pid)
         self.assertEqual(len(get_all_cameras_in_project(self.pid)), 2)
 
+    @patch('backend.database_wrapper.create_hash_sum')
+    def test_clip_ids(self, mock_create_hash_sum):
+        """
+        Tests that the cameras only get the ids of their clips in the project.
+        """
+        mock_create_hash_sum.return_value = '1234567'
+        fid2 = create_root_folder(path="/home/user/", name="test_folder2")
+        cid2 = create_clip(fid=self.fid, clip_name="test_clip2", video_format="tvf", start_time=self.st,
+                           end_time=self.et, latitude=self.lat, longitude=self.lon, width=256, height=240,
+                           frame_rate=42.0, camera_name=self.cm_name)
+        create_clip(fid=fid2, clip_name="test_clip3", video_format="tvf", start_time=self.st,
+                    end_time=self.et, latitude=self.lat, longitude=self.lon, width=256, height=240,
+                    frame_rate=42.0, camera_name=self.cm_name)
+        with self.assertNumQueries(4):
+            cameras = get_all_cameras_in_project(self.pid)
+        self.assertEqual([camera.clip_ids for camera in cameras], [[self.cid, cid2]])
+
 
 class CreateProgressTest(BaseTestCases.ProgressTest):
     def test_create_process(self):
@@ -1453,6 +2065,117 @@ class DeleteProgressTest(BaseTestCases.ProgressTest):
         self.assertEqual(Progress.objects.count(), 1)
 
 
+class DetectionJobTest(BaseTestCases.ObjectDetectionTest):
+    def setUp(self) -> None:
+        """
+        Create a request with jobs for two clips.
+        """
+        super().setUp()
+        self.pid = create_progress(total=2)
+        self.cid2 = create_clip(fid=self.rid, clip_name="test_clip2", video_format="tvf", start_time=self.st,
+                                end_time=self.et, latitude=Decimal(value="13.37"), longitude=Decimal(value="0.42"),
+                                width=256, height=240, frame_rate=42.0, camera_name=self.cm_name,
+                                hash_sum='5678')
+        create_detection_jobs(pid=self.pid, cids=[self.cid, self.cid2], sample_rate=1, start_time=None,
+                              end_time=None)
+
+    def test_create(self):
+        """
+        Test that jobs are pending when created.
+        """
+        self.assertEqual(DetectionJob.objects.filter(state=DetectionJob.PENDING).count(), 2)
+
+    def test_create_bad_time(self):
+        """
+        Test that no jobs are created for an invalid interval.
+        """
+        self.assertRaises(ValidationError, create_detection_jobs, pid=self.pid, cids=[self.cid], sample_rate=1,
+                          start_time=self.et, end_time=self.st)
+        self.assertEqual(DetectionJob.objects.count(), 2)
+
+    def test_take(self):
+        """
+        Test that jobs are taken in order and marked as running.
+        """
+        job = take_detection_job(pid=self.pid)
+        self.assertEqual(job.clip.id, self.cid)
+        self.assertEqual(job.state, DetectionJob.RUNNING)
+        self.assertEqual(take_detection_job(pid=self.pid).clip.id, self.cid2)
+        self.assertIsNone(take_detection_job(pid=self.pid))
+        self.assertEqual(DetectionJob.objects.filter(state=DetectionJob.RUNNING).count(), 2)
+
+    def test_take_claimed(self):
+        """
+        Test that a job taken by another scheduler after being selected is skipped.
+        """
+        first = QuerySet.first
+
+        def first_and_claim(queryset):
+            job = first(queryset)
+            if job is not None and job.clip_id == self.cid:
+                DetectionJob.objects.filter(id=job.id).update(state=DetectionJob.RUNNING)
+            return job
+
+        with patch.object(QuerySet, 'first', autospec=True, side_effect=first_and_claim):
+            self.assertEqual(take_detection_job(pid=self.pid).clip.id, self.cid2)
+        self.assertIsNone(take_detection_job(pid=self.pid))
+
+    def test_finish(self):
+        """
+        Test that finishing jobs updates the progress.
+        """
+        finish_detection_job(jid=take_detection_job(pid=self.pid).id)
+        finish_detection_job(jid=take_detection_job(pid=self.pid).id, failed=True)
+        self.assertEqual(get_progress_by_id(pid=self.pid).current, 2)
+        self.assertEqual(DetectionJob.objects.get(clip_id=self.cid).state, DetectionJob.DONE)
+        self.assertEqual(DetectionJob.objects.get(clip_id=self.cid2).state, DetectionJob.FAILED)
+
+    def test_cancel(self):
+        """
+        Test that jobs are deleted with their progress and can still be finished.
+        """
+        jid = take_detection_job(pid=self.pid).id
+        delete_progress(pid=self.pid)
+        self.assertEqual(DetectionJob.objects.count(), 0)
+        finish_detection_job(jid=jid)
+
+    def test_reset(self):
+        """
+        Test that running jobs are pending again after a reset.
+        """
+        take_detection_job(pid=self.pid)
+        pid2 = create_progress(total=1)
+        create_detection_jobs(pid=pid2, cids=[self.cid], sample_rate=2, start_time=self.st, end_time=self.et)
+        finish_detection_job(jid=take_detection_job(pid=pid2).id)
+        self.assertEqual(reset_detection_jobs(), [self.pid])
+        self.assertEqual(DetectionJob.objects.filter(state=DetectionJob.PENDING).count(), 2)
+
+
+class GetFinerObjectDetectionsTest(BaseTestCases.ObjectDetectionTest):
+    def test_finer(self):
+        """
+        Test that only object detections with the same or a finer sample rate in the interval are found.
+        """
+        self.assertEqual([od.id for od in get_finer_object_detections(cid=self.cid, sample_rate=1, start_time=self.st,
+                                                                      end_time=self.et)], [self.odid])
+        self.assertEqual(get_finer_object_detections(cid=self.cid, sample_rate=0.25, start_time=self.st,
+                                                     end_time=self.et), [])
+        self.assertEqual(get_finer_object_detections(cid=self.cid, sample_rate=1,
+                                                     start_time=self.et + timezone.timedelta(seconds=1),
+                                                     end_time=self.et + timezone.timedelta(seconds=2)), [])
+
+
+class ObjectDetectionExistsTest(BaseTestCases.ObjectDetectionTest):
+    def test_exists(self):
+        """
+        Test that only an object detection with the same sample rate and interval exists.
+        """
+        self.assertTrue(object_detection_exists(cid=self.cid, sample_rate=0.5, start_time=self.st, end_time=self.et))
+        self.assertFalse(object_detection_exists(cid=self.cid, sample_rate=1, start_time=self.st, end_time=self.et))
+        self.assertFalse(object_detection_exists(cid=self.cid, sample_rate=0.5, start_time=self.st,
+                                                 end_time=self.et + timezone.timedelta(seconds=1)))
+
+
 class GetAllResolutionsInProject(TestCase):
     @patch('backend.database_wrapper.create_hash_sum')
     def setUp(self, mock_create_hash_sum) -> None:
@@ -2,6 +2,8 @@ import pytz
 from django.conf import settings
 from django.test import TestCase
 from unittest.mock import patch, call
+import tempfile
+import io
 
 # Import module
 from backend.exporter import *
@@ -63,25 +65,204 @@ class ExportClipsTest(TestCase):
         add_folder_to_project(fid=self.rid, pid=self.pid)
         self.fid = create_filter(pid=self.pid)
 
-    @patch.object(ZipFile, 'write', return_value=None)
-    def test_basic(self, mock_write):
+    @patch('backend.exporter.stream_zip')
+    def test_basic(self, mock_stream_zip):
         """
         Makes a simple call.
         """
-        export_clips(fid=self.fid)
-        self.assertEqual(mock_write.call_count, 6)
-        mock_write.assert_has_calls([
-            call('home/user/test_folder/test_clip1.tvf',
-                 arcname=replace_sep('test_folder/test_clip1.tvf')),
-            call('home/user/test_folder/test_clip1.tvf.txt',
-                 arcname=replace_sep('test_folder/test_clip1.tvf.txt')),
-            call('home/user/test_folder/test_subfolder/test_clip2.tvf',
-                 arcname=replace_sep('test_folder/test_subfolder/test_clip2.tvf')),
-            call('home/user/test_folder/test_subfolder/test_clip2.tvf.txt',
-                 arcname=replace_sep('test_folder/test_subfolder/test_clip2.tvf.txt')),
-            call('home/user/test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf',
-                 arcname=replace_sep('test_folder/test_subfolder/third_test_subfolder'
-                                     '/test_clip3.tvf')),
-            call('home/user/test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf.txt',
-                 arcname=replace_sep('test_folder/test_subfolder/third_test_subfolder'
-                                     '/test_clip3.tvf.txt'))])
+        mock_stream_zip.return_value = iter([b'zip'])
+        res = export_clips(fid=self.fid)
+        self.assertEqual(b''.join(res.streaming_content), b'zip')
+        mock_stream_zip.assert_called_once_with(files=[
+            ('home/user/test_folder/test_clip1.tvf', replace_sep('test_folder/test_clip1.tvf')),
+            ('home/user/test_folder/test_clip1.tvf.txt', replace_sep('test_folder/test_clip1.tvf.txt')),
+            ('home/user/test_folder/test_subfolder/test_clip2.tvf',
+             replace_sep('test_folder/test_subfolder/test_clip2.tvf')),
+            ('home/user/test_folder/test_subfolder/test_clip2.tvf.txt',
+             replace_sep('test_folder/test_subfolder/test_clip2.tvf.txt')),
+            ('home/user/test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf',
+             replace_sep('test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf')),
+            ('home/user/test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf.txt',
+             replace_sep('test_folder/test_subfolder/third_test_subfolder/test_clip3.tvf.txt'))])
+
+
+class StreamZipTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Create two files to archive.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.clip = os.path.join(self.dir.name, 'clip.tvf')
+        self.txt = os.path.join(self.dir.name, 'clip.tvf.txt')
+        with open(self.clip, 'wb') as f:
+            f.write(os.urandom(2500))
+        with open(self.txt, 'w') as f:
+            f.write('metadata')
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    @patch('backend.exporter.CHUNK_SIZE', 1000)
+    def test_basic(self):
+        """
+        Test that the archive is created piece by piece and contains the uncompressed files.
+        """
+        chunks = list(stream_zip(files=[(self.clip, 'folder/clip.tvf'), (self.txt, 'folder/clip.tvf.txt')]))
+        self.assertLess(max(len(chunk) for chunk in chunks), 1200)
+
+        with ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['folder/clip.tvf', 'folder/clip.tvf.txt'])
+            self.assertEqual([info.compress_type for info in archive.infolist()], [ZIP_STORED, ZIP_STORED])
+            with open(self.clip, 'rb') as f:
+                self.assertEqual(archive.read('folder/clip.tvf'), f.read())
+            self.assertEqual(archive.read('folder/clip.tvf.txt'), b'metadata')
+
+    def test_missing_file(self):
+        """
+        Test that a missing file gives FileNotFoundError.
+        """
+        self.assertRaises(FileNotFoundError, list, stream_zip(files=[(self.clip + '.old', 'clip.tvf')]))
+
+
+class ExportClipsToPathTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Setup a project with a filter and a target directory.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.pid = create_project(name="test_project")
+        self.fid = create_filter(pid=self.pid)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    @patch('backend.exporter.run_in_background')
+    def test_basic(self, mock_run_in_background):
+        """
+        Makes a simple call.
+        """
+        code, res = export_clips_to_path(data={FILTER_ID: self.fid, FILE_PATH: self.dir.name, HARD_LINK: True})
+        self.assertEqual(code, 200)
+        self.assertEqual(get_progress_by_id(pid=res[PROGRESS_ID]).total, 0)
+        mock_run_in_background.assert_called_once_with(export_files, files=[], target=self.dir.name,
+                                                       pid=res[PROGRESS_ID], hard_link=True)
+
+    def test_missing_parameter(self):
+        """
+        Test with a missing parameter.
+        """
+        self.assertEqual(export_clips_to_path(data={FILTER_ID: self.fid}), (400, {}))
+
+    def test_non_existing_filter(self):
+        """
+        Test with a filter id that doesn't exist.
+        """
+        self.assertEqual(export_clips_to_path(data={FILTER_ID: 42, FILE_PATH: self.dir.name}), (204, {}))
+
+    def test_existing_target(self):
+        """
+        Test that an existing file or a directory that isn't empty isn't used.
+        """
+        path = os.path.join(self.dir.name, 'clips.tar')
+        open(path, 'w').close()
+        self.assertEqual(export_clips_to_path(data={FILTER_ID: self.fid, FILE_PATH: path}), (400, {}))
+        self.assertEqual(export_clips_to_path(data={FILTER_ID: self.fid, FILE_PATH: self.dir.name}), (400, {}))
+
+
+class ExportFilesTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Create files to export and a progress object.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for name in ['clip.tvf', 'clip.tvf.txt']:
+            path = os.path.join(self.dir.name, name)
+            with open(path, 'w') as f:
+                f.write(name)
+            self.files.append((path, os.path.join('folder', name)))
+        self.pid = create_progress(total=3)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_directory(self):
+        """
+        Test exporting to a directory, skipping missing files.
+        """
+        target = os.path.join(self.dir.name, 'export')
+        with self.assertLogs(level='ERROR'):
+            export_files(files=self.files + [('missing.tvf', 'missing.tvf')], target=target, pid=self.pid)
+        for name in ['clip.tvf', 'clip.tvf.txt']:
+            with open(os.path.join(target, 'folder', name)) as f:
+                self.assertEqual(f.read(), name)
+        self.assertFalse(os.path.exists(os.path.join(target, 'missing.tvf')))
+        self.assertEqual(get_progress_by_id(pid=self.pid).current, 3)
+
+    def test_tar(self):
+        """
+        Test exporting to a tar archive.
+        """
+        target = os.path.join(self.dir.name, 'export', 'clips.tar')
+        export_files(files=self.files, target=target, pid=self.pid)
+        with tarfile.open(target) as archive:
+            self.assertEqual(archive.getnames(), [os.path.join('folder', 'clip.tvf'),
+                                                  os.path.join('folder', 'clip.tvf.txt')])
+            self.assertEqual(archive.extractfile(os.path.join('folder', 'clip.tvf')).read(), b'clip.tvf')
+        self.assertEqual(get_progress_by_id(pid=self.pid).current, 2)
+
+
+class CopyFileTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Create a file to copy.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.dir.name, 'clip.tvf')
+        self.dst = os.path.join(self.dir.name, 'copy.tvf')
+        self.data = os.urandom(5000)
+        with open(self.src, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def assertCopied(self):
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_hard_link(self):
+        """
+        Test that a hard link is made if allowed.
+        """
+        copy_file(src=self.src, dst=self.dst, hard_link=True)
+        self.assertTrue(os.path.samefile(self.src, self.dst))
+
+    def test_copy(self):
+        """
+        Test that a new file is made if hard links aren't allowed.
+        """
+        copy_file(src=self.src, dst=self.dst)
+        self.assertFalse(os.path.samefile(self.src, self.dst))
+        self.assertCopied()
+
+    @patch('backend.exporter.shutil.copyfile', side_effect=shutil.copyfile)
+    @patch('backend.exporter.os.copy_file_range', create=True, side_effect=OSError)
+    @patch('backend.exporter.fcntl')
+    @patch('backend.exporter.os.link', side_effect=OSError)
+    def test_fallback(self, mock_link, mock_fcntl, mock_copy_file_range, mock_copyfile):
+        """
+        Test that the file is copied when it can't be linked, cloned or copied inside the kernel.
+        """
+        mock_fcntl.ioctl.side_effect = OSError
+        copy_file(src=self.src, dst=self.dst, hard_link=True)
+        mock_link.assert_called_once()
+        mock_fcntl.ioctl.assert_called_once()
+        mock_copy_file_range.assert_called_once()
+        mock_copyfile.assert_called_once_with(self.src, self.dst)
+        self.assertCopied()
@@ -1,4 +1,6 @@
 from unittest.mock import patch, mock_open
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
 from django.test import TestCase
 
 # Import module
@@ -146,18 +148,53 @@ class GetClipsTest(TestCase):
         self.cl = Clip.objects.create(folder=self.rf, name='test_clip', video_format='mkv', start_time=self.st,
                                       end_time=self.et, camera=self.ca, frame_rate=42.0, resolution=self.resolution)
 
+    @patch('backend.file_manager.needs_sprite', return_value=True)
+    @patch('backend.file_manager.get_sprite_generator')
     @patch('backend.file_manager.get_all_clips_in_project')
-    def test_basic_call(self, mock_get_all_clips_in_project):
+    def test_basic_call(self, mock_get_all_clips_in_project, mock_get_sprite_generator, mock_needs_sprite):
         """
         Test with a complex file structure.
         """
         mock_get_all_clips_in_project.return_value = [self.cl]
         code, res = get_clips(data={PROJECT_ID: 1})
+        mock_get_sprite_generator.return_value.request.assert_called_once_with(paths=[str(self.cl)])
 
         mock_get_all_clips_in_project.assert_called_once_with(pid=1)
         self.assertEqual(code, 200)
         self.assertEqual(len(res[CLIPS]), 1)
 
+    @patch('backend.file_manager.needs_sprite')
+    @patch('backend.file_manager.get_sprite_generator')
+    @patch('backend.file_manager.get_all_clips_in_project')
+    def test_existing_sprites(self, mock_get_all_clips_in_project, mock_get_sprite_generator, mock_needs_sprite):
+        """
+        Test that sprites are only made of clips without sprites.
+        """
+        other = Clip.objects.create(folder=self.rf, name='test_clip2', video_format='mkv', start_time=self.st,
+                                    end_time=self.et, camera=self.ca, frame_rate=42.0, resolution=self.resolution)
+        mock_get_all_clips_in_project.return_value = [self.cl, other]
+        mock_needs_sprite.side_effect = lambda src: src == str(other)
+        get_clips(data={PROJECT_ID: 1})
+        mock_get_sprite_generator.return_value.request.assert_called_once_with(paths=[str(other)])
+
+    @patch('backend.file_manager.get_proxy_generator')
+    @patch('backend.file_manager.get_sprite_generator')
+    @patch('backend.file_manager.get_all_clips_in_project')
+    def test_proxy_available(self, mock_get_all_clips_in_project, mock_get_sprite_generator,
+                             mock_get_proxy_generator):
+        """
+        Test that clips that can't be played tell if they have a proxy.
+        """
+        playable = Clip.objects.create(folder=self.rf, name='test_clip2', video_format='mp4', start_time=self.st,
+                                       end_time=self.et, camera=self.ca, frame_rate=42.0,
+                                       resolution=self.resolution, playable=True)
+        mock_get_all_clips_in_project.return_value = [self.cl, playable]
+        mock_get_proxy_generator.return_value.cache.contains.return_value = True
+        code, res = get_clips(data={PROJECT_ID: 1})
+        mock_get_proxy_generator.return_value.cache.contains.assert_called_once_with(src=str(self.cl))
+        self.assertEqual({clip['id']: clip['proxy_available'] for clip in res[CLIPS]},
+                         {self.cl.id: True, playable.id: False})
+
     def test_missing_parameter(self):
         """
         Test with a missing parameter.
@@ -191,25 +228,28 @@ class GetFilesTest(TestCase):
 
 class BuildFileStructureTest(TestCase):
 
+    @patch('backend.file_manager.add_clips')
     @patch('backend.file_manager.create_root_folder')
     @patch('backend.file_manager.traverse_subfolders')
     @patch('backend.file_manager.os.path.isdir')
     @patch('backend.file_manager.os.path.dirname')
     @patch('backend.file_manager.os.path.basename')
-    def test_function(self, mock_basename, mock_dirname, mock_isdir, mock_traverse_subfolders, mock_create_root_folder):
+    def test_function(self, mock_basename, mock_dirname, mock_isdir, mock_traverse_subfolders, mock_create_root_folder,
+                      mock_add_clips):
         """
-        Test that a function for create_root_folder and traverse_folder is called with appropriate arguments.
+        Test that a function for create_root_folder, traverse_folder and add_clips is called with appropriate arguments.
         """
         mock_basename.return_value = 'test_folder'
         mock_dirname.return_value = 'home/user'
         mock_isdir.return_value = True
-        mock_traverse_subfolders.return_value = None
+        mock_traverse_subfolders.return_value = []
         mock_create_root_folder.return_value = 1337
 
         build_file_structure('home/user/test_folder')
         mock_isdir.assert_called_once_with('home/user/test_folder')
         mock_create_root_folder.assert_called_once_with(path='home/user/', name='test_folder')
         mock_traverse_subfolders.assert_called_once_with(path='home/user/test_folder', parent_id=1337)
+        mock_add_clips.assert_called_once_with(clips=[], processes=None, batch_size=100, checkpoint=None)
 
 
 class TraverseSubfoldersTest(TestCase):
@@ -225,6 +265,73 @@ class TraverseSubfoldersTest(TestCase):
         mock_os_scandir.assert_called_with('home/user/test_folder')
 
 
+@patch('backend.file_manager.ProcessPoolExecutor', ThreadPoolExecutor)
+class AddClipsTest(TestCase):
+
+    def setUp(self) -> None:
+        self.clips = [('home/user/test_folder/test_clip{0}.avi'.format(i), 1337, 'test_clip{0}'.format(i), 'avi')
+                      for i in range(5)]
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'test.checkpoint')
+
+    @patch('backend.file_manager.create_clips_bulk')
+    @patch('backend.file_manager.probe_clip')
+    def test_batches(self, mock_probe_clip, mock_create_clips_bulk):
+        """
+        Test that all valid clips are probed and written to the database.
+        """
+        mock_probe_clip.side_effect = lambda clip: None if clip[2] == 'test_clip3' else {'clip_name': clip[2]}
+        add_clips(clips=self.clips, processes=2, batch_size=2, checkpoint=self.checkpoint)
+        self.assertEqual(mock_probe_clip.call_count, 5)
+        self.assertEqual(mock_create_clips_bulk.call_count, 3)
+        self.assertEqual(sum(len(c[1]['clips']) for c in mock_create_clips_bulk.call_args_list), 4)
+        self.assertFalse(os.path.isfile(self.checkpoint))
+
+    @patch('backend.file_manager.create_clips_bulk')
+    @patch('backend.file_manager.probe_clip')
+    def test_resume(self, mock_probe_clip, mock_create_clips_bulk):
+        """
+        Test that clips in the checkpoint file are skipped.
+        """
+        mock_probe_clip.side_effect = lambda clip: {'clip_name': clip[2]}
+        with open(self.checkpoint, 'w') as f:
+            f.write(os.path.abspath(self.clips[0][0]) + '\n' + os.path.abspath(self.clips[1][0]) + '\n')
+        add_clips(clips=self.clips, batch_size=2, checkpoint=self.checkpoint)
+        self.assertEqual([[c['clip_name'] for c in call[1]['clips']] for call in mock_create_clips_bulk.call_args_list],
+                         [['test_clip2', 'test_clip3'], ['test_clip4']])
+
+    @patch('backend.file_manager.create_clips_bulk')
+    @patch('backend.file_manager.probe_clip')
+    def test_interrupted(self, mock_probe_clip, mock_create_clips_bulk):
+        """
+        Test that written batches are kept in the checkpoint file when a run is interrupted.
+        """
+        mock_probe_clip.side_effect = lambda clip: {'clip_name': clip[2]}
+        mock_create_clips_bulk.side_effect = [None, KeyboardInterrupt()]
+        self.assertRaises(KeyboardInterrupt, add_clips, clips=self.clips, batch_size=2, checkpoint=self.checkpoint)
+        self.assertEqual(read_checkpoint(checkpoint=self.checkpoint),
+                         {os.path.abspath(self.clips[0][0]), os.path.abspath(self.clips[1][0])})
+
+
+class ProbeClipTest(TestCase):
+
+    @patch('backend.file_manager.get_clip_info')
+    def test_valid_clip(self, mock_get_clip_info):
+        """
+        Test probing a valid clip.
+        """
+        mock_get_clip_info.return_value = {'clip_name': 'test_clip', 'hash_sum': '1234'}
+        self.assertEqual(probe_clip(('home/user/test_folder/test_clip.avi', 1337, 'test_clip', 'avi')),
+                         {'clip_name': 'test_clip', 'hash_sum': '1234'})
+        mock_get_clip_info.assert_called_once_with(file_path='home/user/test_folder/test_clip.avi', folder_id=1337,
+                                                   name='test_clip', video_format='avi')
+
+    def test_non_existing_clip(self):
+        """
+        Test probing a non existing clip.
+        """
+        self.assertIsNone(probe_clip(('home/user/test_folder/test_clip.avi', 1337, 'test_clip', 'avi')))
+
+
 class AnalyzeFileTest(TestCase):
 
     def test_get_name(self):
@@ -265,19 +372,21 @@ class GetClipInfoTest(TestCase):
         self.et = timezone.datetime(year=2018, month=9, day=6, hour=15, minute=46, second=41,
                                     tzinfo=pytz.timezone(settings.TIME_ZONE))  # duration = 42
 
-    @patch('backend.file_manager.get_clip_details')
+    @patch('backend.file_manager.probe_video')
     @patch('backend.file_manager.parse_metadata')
-    def test_valid_clip(self, mock_parse_metadata, mock_get_clip_details):
+    def test_valid_clip(self, mock_parse_metadata, mock_probe_video):
         """
-        Test with valid clip.
+        Test with valid clip. Should round down for duration.
         """
         mock_parse_metadata.return_value = (self.lat, self.lon, self.st, self.cm_name)
-        mock_get_clip_details.return_value = (42, 1337, 256, 240)
+        mock_probe_video.return_value = (42.5, 1337, 256, 240, '1234')
         res = get_clip_info(file_path='home/user/test_folder/test_clip.avi', folder_id=1337, name='test_clip',
                             video_format='avi')
+        mock_probe_video.assert_called_once_with(file_path='home/user/test_folder/test_clip.avi')
         self.assertEqual(res, {'fid': 1337, 'clip_name': 'test_clip', 'video_format': 'avi', 'start_time': self.st,
                                'end_time': self.et, 'latitude': self.lat, 'longitude': self.lon, 'width': 256,
-                               'height': 240, 'frame_rate': 1337, 'camera_name': 'Test camera name'})
+                               'height': 240, 'frame_rate': 1337, 'camera_name': 'Test camera name',
+                               'hash_sum': '1234'})
 
     def test_non_existing_clip(self):
         """
@@ -349,38 +458,3 @@ class ParseMetadataTest(TestCase):
         Test parsing metadata. Should give ValueError.
         """
         self.assertRaises(ValueError, parse_metadata, file_path='home/user/test_folder/test_clip.avi')
-
-
-def cap_get(x):
-    """
-    Function used to mimic the behaviour of VideoCapture.get.
-    :param x: Given argument.
-    """
-    if x == cv2.CAP_PROP_FPS:
-        return 42
-    elif x == cv2.CAP_PROP_FRAME_COUNT:
-        return 1337.0
-    elif x == cv2.CAP_PROP_FRAME_WIDTH:
-        return 256
-    elif x == cv2.CAP_PROP_FRAME_HEIGHT:
-        return 240
-
-
-class GetClipDetailsTest(TestCase):
-
-    @patch('backend.file_manager.os.path.isfile')
-    @patch('backend.file_manager.cv2.VideoCapture')
-    def test_valid_clip(self, mock_cap, mock_isfile):
-        """
-        Test getting details of a clip. Should round down for duration.
-        """
-        mock_isfile.return_value = True
-        mock_cap.return_value.get.side_effect = cap_get
-        self.assertEqual(get_clip_details('home/user/test_folder/test_clip.avi'), (31, 42, 256, 240))
-        mock_cap.assert_called_once_with('home/user/test_folder/test_clip.avi')
-
-    def test_non_existing_clip(self):
-        """
-        Test calling function with non existing clip.
-        """
-        self.assertRaises(FileNotFoundError, get_clip_details, file_path='home/user/test_folder/no_clip.avi')
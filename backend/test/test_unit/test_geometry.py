@@ -0,0 +1,71 @@
+from django.test import TestCase
+
+# Import module
+from backend.geometry import *
+
+
+class HaversineTest(TestCase):
+
+    def test_known_distances(self):
+        """
+        Test distances along a meridian, along the equator and at high latitude.
+        """
+        self.assertAlmostEqual(float(haversine(17, 59, 17, 60)), 111195, delta=1)
+        self.assertAlmostEqual(float(haversine(0, 0, 1, 0)), 111195, delta=1)
+        # A degree of longitude is half as long at 60 degrees latitude
+        self.assertAlmostEqual(float(haversine(0, 60, 1, 60)), 55597, delta=1)
+
+    def test_broadcast(self):
+        """
+        Test that arrays of positions give arrays of distances.
+        """
+        distances = haversine(np.array([[0], [1]]), 0, np.array([0, 1, 2]), 0)
+        self.assertEqual(distances.shape, (2, 3))
+        self.assertEqual(distances[0, 0], 0)
+        self.assertAlmostEqual(distances[1, 2], distances[0, 1])
+
+
+class WithinAreasTest(TestCase):
+
+    def test_matrix(self):
+        """
+        Test that each position is checked against each area.
+        """
+        within = within_areas(longitudes=[17.0, 17.0, 18.0], latitudes=[59.0, 59.01, 59.0],
+                              areas=[(17.0, 59.0, 1112), (17.0, 59.0, 1111), (18.0, 59.0, 10)])
+        self.assertEqual(within.tolist(), [[True, True, False], [True, False, False], [False, False, True]])
+
+    def test_no_areas(self):
+        """
+        Test that no areas give an empty row per position.
+        """
+        self.assertEqual(within_areas(longitudes=[17.0], latitudes=[59.0], areas=[]).shape, (1, 0))
+
+
+class BoundingBoxTest(TestCase):
+
+    def test_contains_area(self):
+        """
+        Test that the edges of the area are on the edges of the box.
+        """
+        min_lon, min_lat, max_lon, max_lat = bounding_box(longitude=17.0, latitude=59.0, radius=1000)
+        self.assertAlmostEqual(float(haversine(17, 59, 17, max_lat)), 1000)
+        self.assertAlmostEqual(float(haversine(17, 59, 17, min_lat)), 1000)
+        # The circle touches the meridians of the box a bit north of its center
+        self.assertAlmostEqual(float(haversine(17, 59, max_lon, 59)), 1000, delta=0.01)
+        self.assertAlmostEqual(float(haversine(17, 59, min_lon, 59)), 1000, delta=0.01)
+
+    def test_pole(self):
+        """
+        Test that an area around a pole spans all longitudes.
+        """
+        min_lon, min_lat, max_lon, max_lat = bounding_box(longitude=17.0, latitude=89.999, radius=1000)
+        self.assertEqual((min_lon, max_lon, max_lat), (-180.0, 180.0, 90.0))
+        self.assertAlmostEqual(float(haversine(17, 89.999, 17, min_lat)), 1000)
+
+    def test_antimeridian(self):
+        """
+        Test that an area across the antimeridian spans all longitudes.
+        """
+        min_lon, min_lat, max_lon, max_lat = bounding_box(longitude=179.9999, latitude=0.0, radius=1000)
+        self.assertEqual((min_lon, max_lon), (-180.0, 180.0))
@@ -1,34 +1,33 @@
 from django.test import TestCase
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 from django.conf import settings
 
 # Import module
 from backend.object_detector import *
+from backend.models import TIMELINE_DTYPE
 
 
 class DetectObjectsTest(TestCase):
 
-    @patch('backend.object_detector.ObjectDetector')
-    @patch('backend.object_detector.threading')
+    @patch('backend.object_detector.get_scheduler')
     @patch('backend.object_detector.create_progress')
-    def test_basic(self, mock_create_progress, mock_threading, mock_od):
+    def test_basic(self, mock_create_progress, mock_get_scheduler):
         """
         Makes a simple call.
         """
         mock_create_progress.return_value = 1337
         code, res = detect_objects({CLIP_IDS: [42, 6, 11], RATE: 1})
         mock_create_progress.assert_called_once_with(total=3)
-        mock_threading.Thread.assert_called_once_with(target=mock_od.return_value.run_object_detection,
-                                                      args=([42, 6, 11], 1337, 1, None, None))
-        mock_threading.Thread.return_value.start.assert_called_once()
+        mock_get_scheduler.return_value.submit.assert_called_once_with(cids=[42, 6, 11], pid=1337, rate=1,
+                                                                        start_time=None, end_time=None)
         self.assertEqual(code, 200)
         self.assertEqual(res, {PROGRESS_ID: 1337})
 
-    @patch('backend.object_detector.ObjectDetector')
-    @patch('backend.object_detector.threading')
+    @patch('backend.object_detector.get_scheduler')
     @patch('backend.object_detector.create_progress')
-    def test_interval(self, mock_create_progress, mock_threading, mock_od):
+    def test_interval(self, mock_create_progress, mock_get_scheduler):
         """
         Makes a simple call with start and end time for detection.
         Checks if parsing of dates is done in a correct way.
@@ -40,9 +39,8 @@ class DetectObjectsTest(TestCase):
         mock_create_progress.assert_called_once_with(total=3)
         st = timezone.datetime(2020, 5, 17, tzinfo=pytz.timezone(settings.TIME_ZONE))
         et = timezone.datetime(2020, 5, 18, tzinfo=pytz.timezone(settings.TIME_ZONE))
-        mock_threading.Thread.assert_called_once_with(target=mock_od.return_value.run_object_detection,
-                                                      args=([42, 6, 11], 1337, 1, st, et))
-        mock_threading.Thread.return_value.start.assert_called_once()
+        mock_get_scheduler.return_value.submit.assert_called_once_with(cids=[42, 6, 11], pid=1337, rate=1,
+                                                                        start_time=st, end_time=et)
         self.assertEqual(code, 200)
         self.assertEqual(res, {PROGRESS_ID: 1337})
 
@@ -219,3 +217,298 @@ class DetectTest(TestCase):
         """
         od = ObjectDetector()
         self.assertRaises(FileNotFoundError, od.detect, clip='home/user/test_folder/test_clip')
+
+    @patch('backend.object_detector.os.path.isfile')
+    @patch('backend.object_detector.get_capture_details')
+    @patch('backend.object_detector.sample_frames')
+    @patch('backend.object_detector.cv2.VideoCapture')
+    @patch('backend.object_detector.cv2.dnn.readNet')
+    def test_batches(self, mock_read_net, mock_cap, mock_sample_frames, mock_get_capture_details, mock_isfile):
+        """
+        Test that sampled frames are given to YOLO in batches and that objects get the time of their frame.
+        """
+        mock_isfile.return_value = True
+        mock_get_capture_details.return_value = (25.0, 250, 256, 240)
+        mock_sample_frames.return_value = ((i, np.zeros((240, 256, 3), np.uint8)) for i in range(0, 125, 25))
+        net = mock_read_net.return_value
+        net.getLayerNames.return_value = ['yolo']
+        net.getUnconnectedOutLayers.return_value = np.array([[1]])
+
+        # One confident detection of the first class in each frame
+        detection = np.zeros(85, np.float32)
+        detection[:4] = [0.5, 0.5, 0.2, 0.2]
+        detection[5] = 0.9
+        net.forward.side_effect = lambda layers: [np.tile(detection, (net.setInput.call_args[0][0].shape[0], 1))]
+
+        od = ObjectDetector(batch_size=2)
+        res = od.detect(clip='home/user/test_folder/test_clip.avi', rate=1, start=0, end=5)
+
+        self.assertEqual(res, [(od.classes[0], i) for i in range(5)])
+        mock_sample_frames.assert_called_once_with(cap=mock_cap.return_value, start=0, end=125, step=25)
+        self.assertEqual([c[0][0].shape[0] for c in net.setInput.call_args_list], [2, 2, 1])
+        mock_cap.return_value.release.assert_called_once()
+
+
+class DetectionSchedulerTest(TestCase):
+
+    def setUp(self) -> None:
+        self.scheduler = DetectionScheduler(processes=2, queue_size=2)
+        self.st = timezone.now()
+        self.et = timezone.now() + timezone.timedelta(seconds=5)
+        self.clip = MagicMock(id=42, start_time=self.st, end_time=self.et, frame_rate=25.0)
+        self.clip.__str__.return_value = 'PATH'
+
+    @patch('backend.database_wrapper.create_hash_sum')
+    @patch('backend.object_detector.threading.Thread')
+    def test_fair(self, mock_thread, mock_create_hash_sum):
+        """
+        Test that jobs are taken from each request in turn.
+        """
+        mock_create_hash_sum.return_value = '1234'
+        fid = create_root_folder(path='/home/user/', name='test_folder')
+        cids = [create_clip(fid=fid, clip_name='test_clip{}'.format(i), video_format='tvf', latitude=Decimal('0.0'),
+                            longitude=Decimal('0.0'), start_time=self.st, end_time=self.et, width=256, height=240,
+                            frame_rate=42, camera_name='test_camera') for i in range(5)]
+        pid1 = create_progress(total=3)
+        pid2 = create_progress(total=2)
+        self.scheduler.submit(cids=cids[:3], pid=pid1, rate=1, start_time=None, end_time=None)
+        self.scheduler.submit(cids=cids[3:], pid=pid2, rate=1, start_time=None, end_time=None)
+        mock_thread.return_value.start.assert_called_once()
+        order = []
+        job = self.scheduler.next_job()
+        while job is not None:
+            order.append((job.progress_id, job.clip.id))
+            job = self.scheduler.next_job()
+        self.assertEqual(order, [(pid1, cids[0]), (pid2, cids[3]), (pid1, cids[1]), (pid2, cids[4]),
+                                 (pid1, cids[2])])
+
+    def run_jobs(self, n: int, detect_in_worker: MagicMock, pending: List[int] = None,
+                 detections: list = None, executor: type = ThreadPoolExecutor, initializer=None) -> MagicMock:
+        """
+        Runs the scheduler with threads instead of processes until n jobs are finished and it waits for more.
+        """
+        jobs = [MagicMock(id=i, clip=self.clip, sample_rate=1, start_time=None, end_time=None) for i in range(n)]
+        done = threading.Semaphore(0)
+        idle = threading.Event()
+
+        def finish(**kwargs):
+            idle.clear()
+            done.release()
+
+        def wait_for_futures(fs, return_when):
+            if len(fs) == 1:
+                idle.set()  # Only waiting to be woken up
+            return wait(fs, return_when=return_when)
+
+        with patch('backend.object_detector.ProcessPoolExecutor', executor), \
+                patch('backend.object_detector.init_worker', initializer or MagicMock()), \
+                patch('backend.object_detector.detect_in_worker', detect_in_worker), \
+                patch('backend.object_detector.replace_sep', lambda path: path), \
+                patch('backend.object_detector.create_detection_jobs'), \
+                patch('backend.object_detector.reset_detection_jobs', return_value=pending or []), \
+                patch('backend.object_detector.get_finer_object_detections', return_value=detections or []), \
+                patch('backend.object_detector.wait', wait_for_futures), \
+                patch('backend.object_detector.take_detection_job',
+                      side_effect=lambda pid: jobs.pop(0) if jobs else None) as mock_take_detection_job, \
+                patch('backend.object_detector.finish_detection_job', side_effect=finish) as mock_finish_detection_job:
+            if pending:
+                self.scheduler.start()
+            else:
+                self.scheduler.submit(cids=list(range(n)), pid=1337, rate=1, start_time=None, end_time=None)
+            for _ in range(n):
+                self.assertTrue(done.acquire(timeout=5))
+            # Keep the patches until the scheduler no longer uses them
+            self.assertTrue(idle.wait(timeout=5))
+        if pending:
+            mock_take_detection_job.assert_any_call(pid=pending[0])
+        return mock_finish_detection_job
+
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_run(self, mock_save_detection, mock_object_detection_exists):
+        """
+        Test that all clips are analyzed and the results saved.
+        """
+        mock_object_detection_exists.return_value = False
+        detect_in_worker = MagicMock(return_value=[('car', 1)])
+        mock_finish_detection_job = self.run_jobs(n=5, detect_in_worker=detect_in_worker)
+        self.assertEqual(detect_in_worker.call_count, 5)
+        detect_in_worker.assert_called_with(clip='PATH', rate=1, intervals=[(0, None)])
+        self.assertEqual(mock_save_detection.call_count, 5)
+        mock_save_detection.assert_called_with(clip=self.clip, rate=1, start_time=self.st, end_time=self.et,
+                                               res=[('car', 1)])
+        self.assertEqual(sorted(c[1]['jid'] for c in mock_finish_detection_job.call_args_list), list(range(5)))
+
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_resume(self, mock_save_detection, mock_object_detection_exists):
+        """
+        Test that pending jobs are run when the scheduler is started.
+        """
+        mock_object_detection_exists.return_value = False
+        self.run_jobs(n=2, detect_in_worker=MagicMock(return_value=[]), pending=[7])
+        self.assertEqual(mock_save_detection.call_count, 2)
+
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_already_detected(self, mock_save_detection, mock_object_detection_exists):
+        """
+        Test that clips that already have been analyzed are skipped.
+        """
+        mock_object_detection_exists.return_value = True
+        detect_in_worker = MagicMock(return_value=[])
+        self.run_jobs(n=2, detect_in_worker=detect_in_worker)
+        detect_in_worker.assert_not_called()
+        mock_save_detection.assert_not_called()
+        mock_object_detection_exists.assert_called_with(cid=42, sample_rate=1, start_time=self.st, end_time=self.et)
+
+    @patch('backend.object_detector.read_timelines')
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_reuse(self, mock_save_detection, mock_object_detection_exists, mock_read_timelines):
+        """
+        Test that an object detection with a finer sample rate is reused instead of running YOLO.
+        """
+        mock_object_detection_exists.return_value = False
+        od = MagicMock(start_time=self.st, end_time=self.et, sample_rate=1)
+        mock_read_timelines.return_value = [DetectedObject(object_class='car',
+                                                           time=self.st + timezone.timedelta(seconds=2))]
+        detect_in_worker = MagicMock(return_value=[])
+        self.run_jobs(n=1, detect_in_worker=detect_in_worker, detections=[od])
+        detect_in_worker.assert_not_called()
+        mock_save_detection.assert_called_once_with(clip=self.clip, rate=1, start_time=self.st, end_time=self.et,
+                                                    res=[('car', 2)])
+
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_failing_clip(self, mock_save_detection, mock_object_detection_exists):
+        """
+        Test that jobs for clips that can't be analyzed are failed.
+        """
+        mock_object_detection_exists.return_value = False
+        with self.assertLogs(level='ERROR'):
+            mock_finish_detection_job = self.run_jobs(n=1, detect_in_worker=MagicMock(side_effect=FileNotFoundError))
+        mock_save_detection.assert_not_called()
+        mock_finish_detection_job.assert_called_once_with(jid=0, failed=True)
+
+    @patch('backend.object_detector.object_detection_exists')
+    @patch('backend.object_detector.save_detection')
+    def test_failing_workers(self, mock_save_detection, mock_object_detection_exists):
+        """
+        Test that jobs are failed and the scheduler keeps running when the worker processes can't be set up.
+        """
+        mock_object_detection_exists.return_value = False
+        with self.assertLogs(level='ERROR'):
+            mock_finish_detection_job = self.run_jobs(n=4, detect_in_worker=MagicMock(return_value=[]),
+                                                      executor=ProcessPoolExecutor, initializer=failing_init_worker)
+        mock_save_detection.assert_not_called()
+        self.assertEqual(sorted(c[1]['jid'] for c in mock_finish_detection_job.call_args_list), list(range(4)))
+        self.assertTrue(all(c[1]['failed'] for c in mock_finish_detection_job.call_args_list))
+        self.assertTrue(self.scheduler.thread.is_alive())
+
+
+def failing_init_worker(yolov: str, batch_size: int) -> None:
+    """
+    Sets up a worker process like init_worker does without the weights of the model.
+    """
+    raise FileNotFoundError(yolov)
+
+
+class PlanDetectionTest(TestCase):
+
+    def setUp(self) -> None:
+        self.st = timezone.now()
+        self.clip = MagicMock(start_time=self.st, end_time=self.st + timezone.timedelta(seconds=60), frame_rate=25.0)
+
+    def detection(self, sample_rate: float, start: int, end: int, seconds: List[int]) -> MagicMock:
+        """
+        Creates an object detection of the clip with a car at each of the given seconds.
+        """
+        od = MagicMock(sample_rate=sample_rate, start_time=self.st + timezone.timedelta(seconds=start),
+                       end_time=self.st + timezone.timedelta(seconds=end))
+        car = ObjectClass.objects.get_or_create(object_class='car')[0]
+        od.get_timeline.return_value = np.frombuffer(merge_timeline(
+            timeline=b'', offsets=[(sec - start) * 10 ** 6 for sec in seconds], object_classes=[car.id] * len(seconds)),
+            dtype=TIMELINE_DTYPE)
+        return od
+
+    def test_no_detections(self):
+        """
+        Test that the whole interval is detected without earlier detections.
+        """
+        self.assertEqual(plan_detection(clip=self.clip, rate=2, start_sec=3, end_sec=None, detections=[]),
+                         ([(3, None)], []))
+
+    def test_downsample(self):
+        """
+        Test that a finer detection of the whole clip answers a coarser request.
+        """
+        od = self.detection(sample_rate=1, start=0, end=60, seconds=[1, 2, 3, 4])
+        self.assertEqual(plan_detection(clip=self.clip, rate=2, start_sec=0, end_sec=None, detections=[od]),
+                         ([], [('car', 2), ('car', 4)]))
+
+    def test_not_aligned(self):
+        """
+        Test that detections that haven't analyzed the requested frames aren't used.
+        """
+        od1 = self.detection(sample_rate=3, start=0, end=60, seconds=[3])
+        od2 = self.detection(sample_rate=1, start=0, end=60, seconds=[3])
+        self.assertEqual(plan_detection(clip=self.clip, rate=2, start_sec=0, end_sec=10, detections=[od1]),
+                         ([(0, 10)], []))
+        self.assertEqual(plan_detection(clip=self.clip, rate=0.5, start_sec=0, end_sec=10, detections=[od2]),
+                         ([(0, 10)], []))
+
+    def test_gaps(self):
+        """
+        Test that only the parts of the interval without detections are detected.
+        """
+        od1 = self.detection(sample_rate=1, start=10, end=20, seconds=[9, 10, 11, 19, 20])
+        od2 = self.detection(sample_rate=2, start=16, end=31, seconds=[24, 25])
+        od3 = self.detection(sample_rate=2, start=15, end=60, seconds=[25])
+        gaps, objects = plan_detection(clip=self.clip, rate=2, start_sec=0, end_sec=None, detections=[od1, od2, od3])
+        self.assertEqual(gaps, [(0, 10), (32, None)])
+        self.assertEqual(objects, [('car', 10), ('car', 24)])
+
+    def test_gap_start(self):
+        """
+        Test that gaps start at a requested frame.
+        """
+        od = self.detection(sample_rate=1, start=0, end=5, seconds=[])
+        self.assertEqual(plan_detection(clip=self.clip, rate=4, start_sec=1, end_sec=5, detections=[od]),
+                         ([], []))
+        self.assertEqual(plan_detection(clip=self.clip, rate=4, start_sec=1, end_sec=20, detections=[od]),
+                         ([(5, 20)], []))
+
+    def test_finer_than_seconds(self):
+        """
+        Test that detections with more than one analyzed frame each second aren't reused, since their objects can't be
+        told apart within a second, while the objects of a detection of each second are reused as found by a new one.
+        """
+        seconds = list(range(10))
+        fresh = [('car', sec) for sec in seconds]
+        od = self.detection(sample_rate=1, start=0, end=10, seconds=seconds)
+        self.assertEqual(plan_detection(clip=self.clip, rate=1, start_sec=0, end_sec=10, detections=[od]), ([], fresh))
+        od = self.detection(sample_rate=0.5, start=0, end=10, seconds=[sec for sec in seconds for _ in range(2)])
+        self.assertEqual(plan_detection(clip=self.clip, rate=1, start_sec=0, end_sec=10, detections=[od]),
+                         ([(0, 10)], []))
+        od = self.detection(sample_rate=0.0, start=0, end=10, seconds=[sec for sec in seconds for _ in range(25)])
+        self.assertEqual(plan_detection(clip=self.clip, rate=1, start_sec=0, end_sec=10, detections=[od]),
+                         ([(0, 10)], []))
+
+
+class SaveDetectionTest(TestCase):
+
+    @patch('backend.object_detector.create_object_detection')
+    def test_times(self, mock_create_object_detection):
+        """
+        Test that objects get the time of the second in the clip, inside the interval.
+        """
+        st = timezone.now()
+        clip = MagicMock(id=42, start_time=st)
+        save_detection(clip=clip, rate=1, start_time=st + timezone.timedelta(seconds=10.5),
+                       end_time=st + timezone.timedelta(seconds=20),
+                       res=[('car', 10), ('car', 15)])
+        mock_create_object_detection.assert_called_once_with(
+            cid=42, sample_rate=1, start_time=st + timezone.timedelta(seconds=10.5),
+            end_time=st + timezone.timedelta(seconds=20),
+            objects=[('car', st + timezone.timedelta(seconds=10.5)), ('car', st + timezone.timedelta(seconds=15))])
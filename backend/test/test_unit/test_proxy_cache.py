@@ -0,0 +1,185 @@
+from unittest.mock import patch
+from django.test import TestCase
+import numpy as np
+import tempfile
+
+# Import module
+from backend.proxy_cache import *
+
+
+class TranscodeTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Write a short clip.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.dir.name, 'test_clip.avi')
+        self.dst = os.path.join(self.dir.name, 'proxy.webm')
+        writer = cv2.VideoWriter(self.src, cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 240))
+        for i in range(10):
+            writer.write(np.full((240, 320, 3), i * 20, np.uint8))
+        writer.release()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_scale_down(self):
+        """
+        Test that the proxy is scaled down and keeps the frames.
+        """
+        transcode(src=self.src, dst=self.dst, max_height=120)
+        cap = cv2.VideoCapture(self.dst)
+        self.assertEqual(get_capture_details(cap=cap)[2:], (160, 120))
+        frames = 0
+        while cap.read()[0]:
+            frames += 1
+        cap.release()
+        self.assertEqual(frames, 10)
+        self.assertEqual(os.listdir(self.dir.name).count('proxy.part.webm'), 0)
+
+    def test_keep_size(self):
+        """
+        Test that small clips aren't scaled up.
+        """
+        transcode(src=self.src, dst=self.dst, max_height=480)
+        cap = cv2.VideoCapture(self.dst)
+        self.assertEqual(get_capture_details(cap=cap)[2:], (320, 240))
+        cap.release()
+
+    def test_unreadable_clip(self):
+        """
+        Test that nothing is written for a clip that can't be read.
+        """
+        with open(self.src, 'w') as f:
+            f.write('not a clip')
+        self.assertRaises(ValueError, transcode, src=self.src, dst=self.dst, max_height=120)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['test_clip.avi'])
+
+
+class ProxyCacheTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Create clips and a cache with room for two proxies.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.clips = []
+        for i in range(3):
+            path = os.path.join(self.dir.name, 'test_clip{0}.avi'.format(i))
+            with open(path, 'w') as f:
+                f.write(str(i))
+            self.clips.append(path)
+        self.cache = ProxyCache(directory=os.path.join(self.dir.name, 'proxies'), max_size=200)
+        os.makedirs(self.cache.directory)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def write(self, i: int, atime: int) -> str:
+        path = self.cache.get_path(src=self.clips[i])
+        with open(path, 'wb') as f:
+            f.write(bytes(100))
+        os.utime(path, (atime, atime))
+        return path
+
+    def test_lookup(self):
+        """
+        Test that a proxy is found and marked as used without changing its modification time.
+        """
+        self.assertIsNone(self.cache.lookup(src=self.clips[0]))
+        path = self.write(i=0, atime=1000)
+        self.assertEqual(self.cache.lookup(src=self.clips[0]), path)
+        self.assertGreater(os.stat(path).st_atime, 1000)
+        self.assertEqual(os.stat(path).st_mtime, 1000)
+
+    def test_contains(self):
+        """
+        Test that a proxy is found without marking it as used.
+        """
+        self.assertFalse(self.cache.contains(src=self.clips[0]))
+        path = self.write(i=0, atime=1000)
+        self.assertTrue(self.cache.contains(src=self.clips[0]))
+        self.assertEqual(os.stat(path).st_atime, 1000)
+        self.assertFalse(self.cache.contains(src=os.path.join(self.dir.name, 'missing_clip.avi')))
+
+    def test_changed_clip(self):
+        """
+        Test that a changed clip gets a new proxy.
+        """
+        path = self.cache.get_path(src=self.clips[0])
+        with open(self.clips[0], 'a') as f:
+            f.write('changed')
+        self.assertNotEqual(self.cache.get_path(src=self.clips[0]), path)
+
+    def test_evict(self):
+        """
+        Test that the least recently used proxy is removed to make room.
+        """
+        first = self.write(i=0, atime=1000)
+        second = self.write(i=1, atime=2000)
+        self.assertTrue(self.cache.is_full())
+        third = self.write(i=2, atime=3000)
+        self.assertTrue(self.cache.add(path=third, evict=True))
+        self.assertEqual([e.path for e in self.cache.get_proxies()], [second, third])
+        self.assertFalse(os.path.exists(first))
+
+    def test_no_room(self):
+        """
+        Test that a new proxy is removed if there is no room and others may not be removed.
+        """
+        first = self.write(i=0, atime=1000)
+        second = self.write(i=1, atime=2000)
+        third = self.write(i=2, atime=3000)
+        self.assertFalse(self.cache.add(path=third, evict=False))
+        self.assertEqual([e.path for e in self.cache.get_proxies()], [first, second])
+
+
+class ProxyGeneratorTest(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ProxyCache(directory=os.path.join(self.dir.name, 'proxies'), max_size=200)
+        self.generator = ProxyGenerator(cache=self.cache, max_height=120)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    @patch('backend.proxy_cache.ProxyGenerator.start')
+    def test_priority(self, mock_start):
+        """
+        Test that viewed clips are taken before others, in the order they were requested.
+        """
+        self.generator.request(path='a', priority=BACKGROUND)
+        self.generator.request(path='b')
+        self.generator.request(path='c', priority=BACKGROUND)
+        self.generator.request(path='d')
+        self.generator.request(path='b')
+        self.assertEqual([self.generator.next_request() for _ in range(4)],
+                         [(VIEWED, 'b'), (VIEWED, 'd'), (BACKGROUND, 'a'), (BACKGROUND, 'c')])
+        self.assertEqual(self.generator.queue, [])
+        mock_start.assert_called()
+
+    @patch('backend.proxy_cache.transcode')
+    def test_generate(self, mock_transcode):
+        """
+        Test that a proxy is generated only if it doesn't exist.
+        """
+        src = os.path.join(self.dir.name, 'test_clip.avi')
+        open(src, 'w').close()
+        mock_transcode.side_effect = lambda src, dst, max_height: open(dst, 'wb').close()
+        self.generator.generate(path=src, priority=VIEWED)
+        self.generator.generate(path=src, priority=VIEWED)
+        mock_transcode.assert_called_once_with(src=src, dst=self.cache.get_path(src=src), max_height=120)
+        self.assertIsNotNone(self.cache.lookup(src=src))
+
+    @patch('backend.proxy_cache.transcode')
+    @patch('backend.proxy_cache.ProxyCache.is_full', return_value=True)
+    def test_full_cache(self, mock_is_full, mock_transcode):
+        """
+        Test that proxies aren't generated in the background when the cache is full.
+        """
+        src = os.path.join(self.dir.name, 'test_clip.avi')
+        open(src, 'w').close()
+        self.generator.generate(path=src, priority=BACKGROUND)
+        mock_transcode.assert_not_called()
@@ -54,6 +54,14 @@ class SerializeTest(TestCase):
                                                    'overlap': [], 'playable': False,
                                                    'objectdetection_set': []})
 
+    def test_serialize_camera_clip_ids(self):
+        """
+        Test that only the given clips of a camera are serialized.
+        """
+        self.cm.clip_ids = []
+        with self.assertNumQueries(0):
+            self.assertEqual(serialize(data=self.cm)['clip_set'], [])
+
     def test_serialize_collection(self):
         """
         Test serializing a collection of objects (folders).
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+import numpy as np
+import tempfile
+
+# Import module
+from backend.thumbnailer import *
+
+
+class GetSpriteTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Create a clip and a sprite cache directory.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.dir.name, 'test_clip.avi')
+        open(self.src, 'w').close()
+        self.settings = override_settings(SPRITE_CACHE_DIR=os.path.join(self.dir.name, 'sprites'), SPRITE_FRAMES=4,
+                                          SPRITE_WIDTH=80)
+        self.settings.enable()
+
+    def tearDown(self) -> None:
+        self.settings.disable()
+        self.dir.cleanup()
+
+    @patch('backend.thumbnailer.make_sprite')
+    def test_cache(self, mock_make_sprite):
+        """
+        Test that the sprite is made once and then read from the cache.
+        """
+        mock_make_sprite.return_value = np.zeros((60, 320, 3), np.uint8)
+        path = get_sprite(src=self.src)
+        self.assertEqual(get_sprite(src=self.src), path)
+        mock_make_sprite.assert_called_once_with(file_path=self.src, count=4, width=80)
+        self.assertEqual(cv2.imread(path).shape, (60, 320, 3))
+        self.assertEqual(os.listdir(settings.SPRITE_CACHE_DIR), [os.path.basename(path)])
+
+    def test_sprite_path(self):
+        """
+        Test that a new sprite is made if the clip or the layout changes.
+        """
+        path = get_sprite_path(src=self.src)
+        with override_settings(SPRITE_FRAMES=5):
+            self.assertNotEqual(get_sprite_path(src=self.src), path)
+        with open(self.src, 'w') as f:
+            f.write('changed')
+        self.assertNotEqual(get_sprite_path(src=self.src), path)
+
+    @patch('backend.thumbnailer.make_sprite')
+    def test_needs_sprite(self, mock_make_sprite):
+        """
+        Test that a sprite is needed until it is made, and never for a clip that doesn't exist.
+        """
+        mock_make_sprite.return_value = np.zeros((60, 320, 3), np.uint8)
+        self.assertTrue(needs_sprite(src=self.src))
+        get_sprite(src=self.src)
+        self.assertFalse(needs_sprite(src=self.src))
+        self.assertFalse(needs_sprite(src=os.path.join(self.dir.name, 'missing_clip.avi')))
+
+
+class SpriteGeneratorTest(TestCase):
+
+    @patch('backend.thumbnailer.threading.Thread')
+    def test_order(self, mock_thread):
+        """
+        Test that clips are taken in the order they were requested, once.
+        """
+        generator = SpriteGenerator()
+        generator.request(paths=['a', 'b'])
+        generator.request(paths=['b', 'c'])
+        self.assertEqual([generator.next_request() for _ in range(3)], ['a', 'b', 'c'])
+        mock_thread.return_value.start.assert_called_once()
@@ -119,6 +119,26 @@ class UrlsTest(TestCase):
         resolver = resolve(url)
         self.assertEqual(resolver.func, export_clips)
 
+    def test_export_clips_to_path(self):
+        '''
+        Test that the url for the export_clips_to_path module is correctly mapped to the view
+        :return: None
+        '''
+
+        url = reverse('backend:export clips to path')
+        resolver = resolve(url)
+        self.assertEqual(resolver.func, export_clips_to_path)
+
+    def test_video_sprite(self):
+        '''
+        Test that the url for the get_clip_sprite module is correctly mapped to the view
+        :return: None
+        '''
+
+        url = reverse('backend:video sprite', args=(42,))
+        resolver = resolve(url)
+        self.assertEqual(resolver.func, get_clip_sprite)
+
     def test_video_get_info(self):
         '''
         Test that the url for the video_get_info module is correctly mapped to the view
@@ -139,6 +159,16 @@ class UrlsTest(TestCase):
         resolver = resolve(url)
         self.assertEqual(resolver.func, video_get_sequential)
 
+    def test_video_get_playback_chain(self):
+        '''
+        Test that the url for the video_get_playback_chain module is correctly mapped to the view
+        :return: None
+        '''
+
+        url = reverse('backend:video playback chain')
+        resolver = resolve(url)
+        self.assertEqual(resolver.func, video_get_playback_chain)
+
     def test_video_get_cameras(self):
         '''
         Test that the url for the video_get_stream module is correctly mapped to the view
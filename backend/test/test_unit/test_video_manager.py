@@ -1,6 +1,7 @@
 from django.http import HttpRequest
-from django.test import TestCase
-from unittest.mock import patch, Mock
+from django.test import TestCase, RequestFactory
+import tempfile
+from unittest.mock import patch, Mock, MagicMock
 
 # Import module
 from backend.video_manager import *
@@ -31,13 +32,15 @@ class GetClipInfoTest(TestCase):
 
 class GetSequentialClipTest(TestCase):
 
+    @patch('backend.video_manager.get_next_clip')
     @patch('backend.video_manager.get_clip_by_id')
-    def test_basic(self, mock_get_clip_by_id):
+    def test_basic(self, mock_get_clip_by_id, mock_get_next_clip):
         """
         Makes a simple call.
         """
-        mock_get_clip_by_id.return_value.camera.clip_set.all.return_value = []
+        mock_get_next_clip.return_value = None
         code, res = get_sequential_clip(data={CLIP_ID: 42})
+        mock_get_next_clip.assert_called_once_with(cid=mock_get_clip_by_id.return_value.id, max_gap=SEQUENTIAL_CLIP_GAP)
         self.assertEqual(code, 200)
         self.assertEqual(res, {CLIP_ID: None})
 
@@ -50,24 +53,61 @@ class GetSequentialClipTest(TestCase):
         self.assertEqual(res, {})
 
 
+class GetPlaybackChainTest(TestCase):
+
+    @patch('backend.video_manager.get_playback_chain_in_camera')
+    @patch('backend.video_manager.get_camera_by_id')
+    def test_basic(self, mock_get_camera_by_id, mock_get_playback_chain_in_camera):
+        """
+        Makes a simple call, with the active interval of the camera as default.
+        """
+        st = timezone.datetime(2020, 1, 17, tzinfo=timezone.utc)
+        et = timezone.datetime(2020, 1, 18, tzinfo=timezone.utc)
+        mock_get_camera_by_id.return_value.start_time = st
+        mock_get_camera_by_id.return_value.end_time = et
+        clip = MagicMock(id=1, start_time=st, end_time=et)
+        mock_get_playback_chain_in_camera.return_value = [(clip, 2)]
+        code, res = get_playback_chain(data={CAMERA_ID: 42, START_TIME: '2020-01-17T12:00:00Z'})
+        mock_get_playback_chain_in_camera.assert_called_once_with(
+            cmid=42, start_time=timezone.datetime(2020, 1, 17, 12, tzinfo=timezone.utc), end_time=et,
+            max_gap=SEQUENTIAL_CLIP_GAP)
+        self.assertEqual(code, 200)
+        self.assertEqual(res, {CLIPS: [{CLIP_ID: 1, START_TIME: st, END_TIME: et, NEXT_CLIP_ID: 2}]})
+
+    @patch('backend.video_manager.get_camera_by_id')
+    def test_non_existent_camera(self, mock_get_camera_by_id):
+        """
+        Test with a camera that doesn't exist.
+        """
+        mock_get_camera_by_id.return_value = None
+        code, res = get_playback_chain(data={CAMERA_ID: 42})
+        self.assertEqual(code, 204)
+        self.assertEqual(res, {})
+
+    def test_missing_parameter(self):
+        """
+        Test with a missing parameter.
+        """
+        code, res = get_playback_chain(data={CLIP_ID: 42})
+        self.assertEqual(code, 400)
+        self.assertEqual(res, {})
+
+
 class GetCamerasTest(TestCase):
 
-    @patch('backend.video_manager.remove_clip_not_in_project_from_camera')
     @patch('backend.video_manager.os_aware')
     @patch('backend.video_manager.serialize')
     @patch('backend.video_manager.get_all_cameras_in_project')
-    def test_basic(self, mock_get_all_cameras_in_project, mock_serialize, mock_os_aware,
-                   mock_remove_clip_not_in_project_from_camera):
+    def test_basic(self, mock_get_all_cameras_in_project, mock_serialize, mock_os_aware):
         """
         Makes a simple call.
         """
         mock_get_all_cameras_in_project.return_value = "RETURNED CAMERAS"
         mock_serialize.return_value = 'RETURN FROM SERIALIZE'
-        mock_remove_clip_not_in_project_from_camera.return_value = "RETURNED MODIFIED CAMERAS"
         code, res = get_cameras(data={PROJECT_ID: 42})
         mock_get_all_cameras_in_project.assert_called_once_with(pid=42)
         mock_serialize.assert_called_once_with("RETURNED CAMERAS")
-        mock_os_aware.assert_called_once_with('RETURNED MODIFIED CAMERAS')
+        mock_os_aware.assert_called_once_with({CAMERAS: 'RETURN FROM SERIALIZE'})
         self.assertEqual(code, 200)
 
     def test_missing_parameter(self):
@@ -80,6 +120,187 @@ class GetCamerasTest(TestCase):
 
 
 class GetVideoStreamTest(TestCase):
-    def test_simple_call(self):
-        pass
-        # TODO: I have no idea how to test this one
+
+    def setUp(self) -> None:
+        """
+        Create a clip to stream.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'test_clip.mp4')
+        self.data = os.urandom(1000)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.factory = RequestFactory()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def get(self, playable: bool = True, **headers) -> HttpResponse:
+        clip = MagicMock(playable=playable)
+        clip.__str__.return_value = self.path
+        with patch('backend.video_manager.get_clip_by_id', return_value=clip):
+            return get_video_stream(self.factory.get('/', **headers), cid=42)
+
+    @staticmethod
+    def content(resp: HttpResponse) -> bytes:
+        content = b''.join(resp.streaming_content)
+        resp.close()
+        return content
+
+    def test_whole_file(self):
+        """
+        Test that the whole clip is sent as a file when no range is requested.
+        """
+        resp = self.get()
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNotNone(resp.file_to_stream)
+        self.assertEqual(resp['Content-Length'], '1000')
+        self.assertEqual(resp['Content-Type'], 'video/mp4')
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', resp)
+        self.assertIn('Last-Modified', resp)
+        self.assertEqual(resp.block_size, settings.VIDEO_STREAM_BLOCK_SIZE)
+        self.assertEqual(self.content(resp), self.data)
+
+    def test_range(self):
+        """
+        Test that a single range is sent as a file.
+        """
+        resp = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(resp.status_code, 206)
+        self.assertIsNotNone(resp.file_to_stream)
+        self.assertEqual(resp['Content-Length'], '100')
+        self.assertEqual(resp['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(self.content(resp), self.data[100:200])
+
+        resp = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(resp['Content-Range'], 'bytes 990-999/1000')
+        self.assertEqual(self.content(resp), self.data[990:])
+
+    def test_multiple_ranges(self):
+        """
+        Test that multiple ranges are sent as multipart/byteranges.
+        """
+        resp = self.get(HTTP_RANGE='bytes=0-9, 500-, 20-29')
+        self.assertEqual(resp.status_code, 206)
+        self.assertTrue(resp['Content-Type'].startswith('multipart/byteranges; boundary='))
+        boundary = resp['Content-Type'].split('=')[1].encode()
+        content = self.content(resp)
+        self.assertEqual(resp['Content-Length'], str(len(content)))
+
+        parts = content.split(b'--' + boundary)
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        for part, (first_byte, last_byte) in zip(parts[1:-1], [(0, 9), (500, 999), (20, 29)]):
+            headers, data = part.split(b'\r\n\r\n', 1)
+            self.assertIn('Content-Range: bytes {0}-{1}/1000'.format(first_byte, last_byte).encode(), headers)
+            self.assertEqual(data, self.data[first_byte:last_byte + 1] + b'\r\n')
+
+    def test_unsatisfiable_range(self):
+        """
+        Test that a range outside the clip gives 416.
+        """
+        resp = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */1000')
+
+    def test_conditional(self):
+        """
+        Test that the clip isn't sent again if the browser has it.
+        """
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_if_range(self):
+        """
+        Test that the whole clip is sent if it has changed since the range was requested.
+        """
+        resp = self.get()
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=resp['ETag']).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=resp['Last-Modified']).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"').status_code, 200)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Thu, 01 Jan 1970 00:00:00 GMT').status_code,
+                         200)
+
+
+    @patch('backend.video_manager.get_proxy_generator')
+    def test_proxy(self, mock_get_proxy_generator):
+        """
+        Test that the proxy of a clip that can't be played is streamed.
+        """
+        proxy = os.path.join(self.dir.name, 'proxy.webm')
+        with open(proxy, 'wb') as f:
+            f.write(b'proxy')
+        mock_get_proxy_generator.return_value.cache.lookup.return_value = proxy
+        resp = self.get(playable=False)
+        mock_get_proxy_generator.return_value.cache.lookup.assert_called_once_with(src=self.path)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'video/webm')
+        self.assertEqual(self.content(resp), b'proxy')
+
+    @patch('backend.video_manager.get_proxy_generator')
+    def test_missing_proxy(self, mock_get_proxy_generator):
+        """
+        Test that a missing proxy is requested before other proxies.
+        """
+        mock_get_proxy_generator.return_value.cache.lookup.return_value = None
+        resp = self.get(playable=False)
+        mock_get_proxy_generator.return_value.request.assert_called_once_with(path=self.path, priority=VIEWED)
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp)
+
+
+class GetClipSpriteTest(TestCase):
+
+    @patch('backend.video_manager.get_sprite')
+    @patch('backend.video_manager.get_clip_by_id')
+    def test_basic(self, mock_get_clip_by_id, mock_get_sprite):
+        """
+        Test that the sprite is sent with long cache headers.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as f:
+            f.write(b'sprite')
+            f.flush()
+            mock_get_clip_by_id.return_value.__str__.return_value = 'home/user/test_folder/test_clip.avi'
+            mock_get_sprite.return_value = f.name
+            resp = get_clip_sprite(RequestFactory().get('/'), cid=42)
+            mock_get_sprite.assert_called_once_with(src='home/user/test_folder/test_clip.avi')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['Content-Type'], 'image/jpeg')
+            self.assertEqual(resp['Cache-Control'], 'public, max-age={0}'.format(settings.SPRITE_MAX_AGE))
+            self.assertEqual(b''.join(resp.streaming_content), b'sprite')
+            resp.close()
+
+
+class ParseRangesTest(TestCase):
+
+    def test_ranges(self):
+        """
+        Test parsing satisfiable ranges.
+        """
+        self.assertEqual(parse_ranges(header='bytes=0-499', size=1000), [(0, 499)])
+        self.assertEqual(parse_ranges(header='bytes=500-', size=1000), [(500, 999)])
+        self.assertEqual(parse_ranges(header='bytes=-200', size=1000), [(800, 999)])
+        self.assertEqual(parse_ranges(header='bytes=-2000', size=1000), [(0, 999)])
+        self.assertEqual(parse_ranges(header='bytes=900-1999', size=1000), [(900, 999)])
+        self.assertEqual(parse_ranges(header='bytes = 0-0 , 2-3', size=1000), [(0, 0), (2, 3)])
+
+    def test_unsatisfiable(self):
+        """
+        Test that ranges outside the file are left out.
+        """
+        self.assertEqual(parse_ranges(header='bytes=1000-', size=1000), [])
+        self.assertEqual(parse_ranges(header='bytes=-0,1000-1001,5-5', size=1000), [(5, 5)])
+
+    def test_whole_file(self):
+        """
+        Test that the whole file is sent for missing, malformed or too many ranges.
+        """
+        self.assertIsNone(parse_ranges(header='', size=1000))
+        self.assertIsNone(parse_ranges(header='bytes=5-4', size=1000))
+        self.assertIsNone(parse_ranges(header='bytes=-', size=1000))
+        self.assertIsNone(parse_ranges(header='items=0-1', size=1000))
+        self.assertIsNone(parse_ranges(header='bytes=' + ','.join(['0-1'] * (MAX_RANGES + 1)), size=1000))
@@ -0,0 +1,157 @@
+from unittest.mock import patch
+from django.test import TestCase
+import numpy as np
+import tempfile
+
+# Import module
+from backend.video_probe import *
+
+
+def cap_get(x):
+    """
+    Function used to mimic the behaviour of VideoCapture.get.
+    :param x: Given argument.
+    """
+    if x == cv2.CAP_PROP_FPS:
+        return 42
+    elif x == cv2.CAP_PROP_FRAME_COUNT:
+        return 1337.0
+    elif x == cv2.CAP_PROP_FRAME_WIDTH:
+        return 256
+    elif x == cv2.CAP_PROP_FRAME_HEIGHT:
+        return 240
+
+
+class ProbeVideoTest(TestCase):
+
+    def setUp(self) -> None:
+        self.frame = np.zeros((240, 256, 3), np.uint8)
+
+    @patch('backend.video_probe.os.path.isfile')
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_valid_clip(self, mock_cap, mock_isfile):
+        """
+        Test getting details and fingerprint of a clip by opening it once.
+        """
+        mock_isfile.return_value = True
+        mock_cap.return_value.get.side_effect = cap_get
+        mock_cap.return_value.read.return_value = (True, self.frame)
+        self.assertEqual(probe_video('home/user/test_folder/test_clip.avi'),
+                         (1337 / 42, 42, 256, 240, get_fingerprint(frame=self.frame)))
+        mock_cap.assert_called_once_with('home/user/test_folder/test_clip.avi')
+        mock_cap.return_value.read.assert_called_once()
+        mock_cap.return_value.release.assert_called_once()
+
+    @patch('backend.video_probe.os.path.isfile')
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_without_fingerprint(self, mock_cap, mock_isfile):
+        """
+        Test getting details of a clip without reading any frames.
+        """
+        mock_isfile.return_value = True
+        mock_cap.return_value.get.side_effect = cap_get
+        self.assertEqual(probe_video('home/user/test_folder/test_clip.avi', fingerprint=False),
+                         (1337 / 42, 42, 256, 240, None))
+        mock_cap.return_value.read.assert_not_called()
+
+    @patch('backend.video_probe.os.path.isfile')
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_unreadable_clip(self, mock_cap, mock_isfile):
+        """
+        Test that the fingerprint is None if the first frame can't be read.
+        """
+        mock_isfile.return_value = True
+        mock_cap.return_value.get.side_effect = cap_get
+        mock_cap.return_value.read.return_value = (False, None)
+        self.assertIsNone(probe_video('home/user/test_folder/test_clip.avi')[4])
+
+    def test_non_existing_clip(self):
+        """
+        Test calling function with non existing clip.
+        """
+        self.assertRaises(FileNotFoundError, probe_video, file_path='home/user/test_folder/no_clip.avi')
+
+
+class GetFingerprintTest(TestCase):
+
+    def test_same_frame(self):
+        """
+        Test that equal frames give the same fingerprint and different frames do not.
+        """
+        frame = np.zeros((240, 256, 3), np.uint8)
+        self.assertEqual(get_fingerprint(frame=frame), get_fingerprint(frame=frame.copy()))
+        self.assertNotEqual(get_fingerprint(frame=frame), get_fingerprint(frame=frame + 1))
+
+
+class SampleFramesTest(TestCase):
+
+    def setUp(self) -> None:
+        self.frame = np.zeros((240, 256, 3), np.uint8)
+
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_skip_frames(self, mock_cap):
+        """
+        Test that only sampled frames are decoded and the frames in between are grabbed.
+        """
+        cap = mock_cap.return_value
+        cap.read.return_value = (True, self.frame)
+        cap.grab.return_value = True
+        self.assertEqual([i for i, _ in sample_frames(cap=cap, start=50, end=200, step=50)], [50, 100, 150])
+        cap.set.assert_called_once_with(cv2.CAP_PROP_POS_FRAMES, 50)
+        self.assertEqual(cap.read.call_count, 3)
+        self.assertEqual(cap.grab.call_count, 98)
+
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_from_start(self, mock_cap):
+        """
+        Test that the clip isn't seeked when starting from the first frame.
+        """
+        cap = mock_cap.return_value
+        cap.read.return_value = (True, self.frame)
+        self.assertEqual([i for i, _ in sample_frames(cap=cap, start=0, end=3, step=1)], [0, 1, 2])
+        cap.set.assert_not_called()
+        cap.grab.assert_not_called()
+
+    @patch('backend.video_probe.cv2.VideoCapture')
+    def test_clip_over(self, mock_cap):
+        """
+        Test that sampling stops when the clip is over.
+        """
+        cap = mock_cap.return_value
+        cap.read.side_effect = [(True, self.frame), (False, None)]
+        cap.grab.side_effect = [True, True, False]
+        self.assertEqual([i for i, _ in sample_frames(cap=cap, start=0, end=100, step=10)], [0])
+        self.assertEqual([i for i, _ in sample_frames(cap=cap, start=0, end=100, step=3)], [])
+
+
+class MakeSpriteTest(TestCase):
+
+    def setUp(self) -> None:
+        """
+        Write a clip where each frame is a bit brighter than the one before.
+        """
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'test_clip.avi')
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 240))
+        for i in range(20):
+            writer.write(np.full((240, 320, 3), i * 10, np.uint8))
+        writer.release()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_sprite(self):
+        """
+        Test that frames spread evenly over the clip are scaled and put side by side.
+        """
+        sprite = make_sprite(file_path=self.path, count=4, width=80)
+        self.assertEqual(sprite.shape, (60, 320, 3))
+        # Frames 2, 7, 12 and 17
+        for i, frame in enumerate([2, 7, 12, 17]):
+            self.assertAlmostEqual(sprite[:, i * 80:(i + 1) * 80].mean(), frame * 10, delta=3)
+
+    def test_non_existent_clip(self):
+        """
+        Test that a missing clip gives FileNotFoundError.
+        """
+        self.assertRaises(FileNotFoundError, make_sprite, file_path=self.path + '.old', count=4, width=80)
@@ -271,6 +271,44 @@ class ExportClipsTest(TestCase):
         mock_mod.export_clips.assert_called_with(42)
 
 
+class ExportClipsToPathTest(TestCase):
+
+    @mock.patch('backend.views.exporter')
+    def test_propagation(self, mock_mod):
+        '''
+        Tests propagation of the 'export clips to path' request.
+        :return: None
+        '''
+        # Set up mock
+        mock_mod.export_clips_to_path.return_value = (200, {})
+
+        # Test function
+        req = APIRequestFactory().post('', {'test': 'data'})
+        response = views.export_clips_to_path(req)
+
+        # Did we propagate properly?
+        mock_mod.export_clips_to_path.assert_called_with(QueryDict('test=data'))
+
+
+class GetClipSpriteTest(TestCase):
+
+    @mock.patch('backend.views.video_manager')
+    def test_propagation(self, mock_mod):
+        '''
+        Tests propagation of the 'get sprite' request.
+        :return: None
+        '''
+        # Set up mock
+        mock_mod.get_clip_sprite.return_value = HttpResponse()
+
+        # Test function
+        req = APIRequestFactory().get('', {'test': 'data'})
+        response = views.get_clip_sprite(req, 42)
+
+        # Did we propagate properly?
+        mock_mod.get_clip_sprite.assert_called_once()
+
+
 class VideoGetInfoTest(TestCase):
 
     @mock.patch('backend.views.video_manager')
@@ -290,6 +328,25 @@ class VideoGetInfoTest(TestCase):
         mock_mod.get_clip_info.assert_called_with(QueryDict('test=data'))
 
 
+class VideoGetPlaybackChainTest(TestCase):
+
+    @mock.patch('backend.views.video_manager')
+    def test_propagation(self, mock_mod):
+        '''
+        Tests propagation of the 'get playback chain' request.
+        :return: None
+        '''
+        # Set up mock
+        mock_mod.get_playback_chain.return_value = (200, {})
+
+        # Test function
+        req = APIRequestFactory().post('', {'test': 'data'})
+        response = views.video_get_playback_chain(req)
+
+        # Did we propagate properly?
+        mock_mod.get_playback_chain.assert_called_with(QueryDict('test=data'))
+
+
 class VideoGetSequentialTest(TestCase):
 
     @mock.patch('backend.views.video_manager')
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import deque
+from typing import List
+
+import cv2
+from django.conf import settings
+
+from .video_probe import make_sprite
+
+# This file represents the backend Thumbnailer.
+# Sprites are images of frames spread evenly over a clip, side by side, so clips can be previewed without streaming.
+
+SPRITE_CONTENT_TYPE = 'image/jpeg'
+
+generator = None
+
+
+def get_sprite_generator() -> 'SpriteGenerator':
+    """
+    Gets the sprite generator of the server.
+
+    :return: The sprite generator.
+    """
+    global generator
+    if generator is None:
+        generator = SpriteGenerator()
+    return generator
+
+
+def get_sprite_path(src: str) -> str:
+    """
+    Gets the path of the sprite of a clip, which may not exist yet. The sprite is named after the path, size and
+    modification time of the clip and the layout of the sprite, so a new sprite is made if any of them change.
+
+    :param src: Absolute path to the clip.
+    :return: Path of the sprite.
+    """
+    stat = os.stat(src)
+    key = '{0}:{1}:{2}:{3}:{4}'.format(os.path.abspath(src), stat.st_size, stat.st_mtime_ns, settings.SPRITE_FRAMES,
+                                       settings.SPRITE_WIDTH)
+    return os.path.join(settings.SPRITE_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.jpg')
+
+
+def needs_sprite(src: str) -> bool:
+    """
+    Checks if a sprite of a clip is still to be made.
+
+    :param src: Absolute path to the clip.
+    :return: Whether the clip exists and has no sprite.
+    """
+    try:
+        return not os.path.exists(get_sprite_path(src=src))
+    except FileNotFoundError:
+        return False  # The clip has been moved or removed
+
+
+def get_sprite(src: str) -> str:
+    """
+    Gets the sprite of a clip and makes it if it doesn't exist.
+
+    :param src: Absolute path to the clip.
+    :return: Path of the sprite.
+    """
+    dst = get_sprite_path(src=src)
+    if not os.path.exists(dst):
+        sprite = make_sprite(file_path=src, count=settings.SPRITE_FRAMES, width=settings.SPRITE_WIDTH)
+        success, data = cv2.imencode('.jpg', sprite)
+        if not success:
+            raise ValueError("Could not encode sprite of {0}.".format(src))
+
+        # Write to a temporary file first so a partly written sprite is never served
+        os.makedirs(settings.SPRITE_CACHE_DIR, exist_ok=True)
+        tmp = '{0}.{1}.part'.format(dst, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data.tobytes())
+        os.replace(tmp, dst)
+    return dst
+
+
+class SpriteGenerator:
+    """
+    Makes sprites of clips ahead of time in a background thread, in the order they were requested.
+    """
+
+    def __init__(self):
+        self.queue = deque()
+        self.queued = set()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def request(self, paths: List[str]) -> None:
+        """
+        Adds clips to make sprites of and starts the generator if not already started.
+
+        :param paths: Absolute paths to the clips.
+        """
+        with self.condition:
+            for path in paths:
+                if path not in self.queued:
+                    self.queued.add(path)
+                    self.queue.append(path)
+            self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def next_request(self) -> str:
+        """
+        Waits for and takes the next clip.
+
+        :return: Path of the clip.
+        """
+        with self.condition:
+            while not self.queue:
+                self.condition.wait()
+            path = self.queue.popleft()
+            self.queued.discard(path)
+            return path
+
+    def run(self) -> None:
+        """
+        Makes requested sprites, forever.
+        """
+        while True:
+            path = self.next_request()
+            try:
+                get_sprite(src=path)
+            except FileNotFoundError:
+                pass  # The clip has been moved or removed
+            except Exception as e:
+                logging.error(msg="Could not make sprite of {0}: {1!r}".format(path, e))
@@ -25,9 +25,11 @@ urlpatterns = [
 
     path('export/filter/<int:fid>/', views.export_filter, name='export filter'),
     path('export/clips/<int:fid>/', views.export_clips, name='export clips'),
+    path('export/clips_to_path', views.export_clips_to_path, name='export clips to path'),
 
     path('video/get_info', views.video_get_info, name='video info'),
     path('video/get_sequential', views.video_get_sequential, name='video sequential'),
+    path('video/get_playback_chain', views.video_get_playback_chain, name='video playback chain'),
     path('video/get_cameras', views.video_get_cameras, name='video get cameras'),
 
     path('file/get_source_folders', views.file_get_source_folders, name='file get source folders'),
@@ -41,4 +43,5 @@ urlpatterns = [
     path('object_detection/get_progress', views.get_progress, name='get progress'),
     path('object_detection/delete_progress', views.delete_progress, name='delete progress'),
     path('video/stream/<int:cid>/', views.get_clip_stream, name='video stream'),
+    path('video/sprite/<int:cid>/', views.get_clip_sprite, name='video sprite'),
 ]
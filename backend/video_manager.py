@@ -1,17 +1,26 @@
 import mimetypes
 import re
-from wsgiref.util import FileWrapper
+import uuid
+from typing import Iterator
 
+from django.conf import settings
 from django.core.handlers.wsgi import WSGIRequest
-from django.http import FileResponse
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 
 from .database_wrapper import *
 from .communication_utils import *
 from .serialization import *
+from .proxy_cache import get_proxy_generator, VIEWED, PROXY_CONTENT_TYPE
+from .thumbnailer import get_sprite, SPRITE_CONTENT_TYPE
 
 
 # This file represents the backend Video Manager.
 
+# The longest time between two clips on a camera for them to be played one after the other
+SEQUENTIAL_CLIP_GAP = timezone.timedelta(seconds=5)
+
 
 def get_clip_info(data: dict) -> (int, dict):
     """
@@ -51,13 +60,35 @@ def get_sequential_clip(data: dict) -> (int, dict):
     if clip is None:
         return 204, {}  # No content
 
-    camera = clip.camera
-    for c in camera.clip_set.all():
-        if clip != c and (clip.end_time <= c.start_time <= (clip.end_time + timezone.timedelta(seconds=5))):
-            cid = c.id
-            return 200, {CLIP_ID: cid}
+    return 200, {CLIP_ID: get_next_clip(cid=clip.id, max_gap=SEQUENTIAL_CLIP_GAP)}
+
 
-    return 200, {CLIP_ID: None}
+def get_playback_chain(data: dict) -> (int, dict):
+    """
+    Gets the clips of a camera in a time span in order of start time, each with the id of its sequential clip,
+    so continuous playback doesn't need a request at every clip boundary.
+
+    :param data: Camera id and optionally start time and end time, else the whole active interval of the camera.
+    :return: Status code, clips with their times and the id of their sequential clip if any.
+    """
+    try:
+        cmid = data[CAMERA_ID]
+    except KeyError:
+        return 400, {}  # Bad request
+
+    camera = get_camera_by_id(cmid=cmid)
+    if camera is None:
+        return 204, {}  # No content
+
+    start_time = date_str_to_datetime(date_str=data.get(START_TIME)) or camera.start_time
+    end_time = date_str_to_datetime(date_str=data.get(END_TIME)) or camera.end_time
+    if start_time is None or end_time is None:
+        return 200, {CLIPS: []}  # The camera has no clips
+
+    chain = get_playback_chain_in_camera(cmid=cmid, start_time=start_time, end_time=end_time,
+                                         max_gap=SEQUENTIAL_CLIP_GAP)
+    return 200, {CLIPS: [{CLIP_ID: clip.id, START_TIME: clip.start_time, END_TIME: clip.end_time,
+                          NEXT_CLIP_ID: next_cid} for clip, next_cid in chain]}
 
 
 def get_cameras(data: dict) -> (int, dict):
@@ -77,115 +108,236 @@ def get_cameras(data: dict) -> (int, dict):
     except AssertionError:
         return 204, {}  # No content
 
-    res = remove_clip_not_in_project_from_camera({CAMERAS: serialize(cameras)}, pid=pid)
-
-    return 200, os_aware(res)
+    # The clip sets of the cameras only contain the clips in the project
+    return 200, os_aware({CAMERAS: serialize(cameras)})
 
 
-def remove_clip_not_in_project_from_camera(data: dict, pid: int) -> dict:
+def get_video_stream(request: WSGIRequest, cid: int) -> HttpResponse:
     """
-    Removes clips in camera that is not in project.
+    Returns a response to a request for a video
 
-    :param data: dict with cameras.
-    :param pid: project id.
-    :return: dict with cameras with updated clip_set.
+    Solution based on this: https://stackoverflow.com/questions/33208849/python-django-streaming-video-mp4-file-using-httpresponse
+    Stream the given clip. Clips that can't be played in the browser are streamed as a proxy, which is generated
+    before other proxies if it doesn't exist yet. Meanwhile, 503 is returned.
+    :param request:
+    :param cid: the clip id
+    :return: a response to a request for a part of a video
     """
-    for cm in data[CAMERAS]:
-        cid_not_in_project = []
-
-        for cid in cm['clip_set']:
-            clip = get_clip_by_id(cid=cid)
-            if clip not in get_all_clips_in_project(pid=pid):
-                cid_not_in_project.append(cid)
+    clip = get_clip_by_id(cid)
+    assert clip is not None
+    path = str(clip)
+    content_type = None
 
-        for cid in cid_not_in_project:
-            cm['clip_set'].remove(cid)
+    if not clip.playable:
+        proxies = get_proxy_generator()
+        proxy = proxies.cache.lookup(src=path)
+        if proxy is None:
+            proxies.request(path=path, priority=VIEWED)
+            resp = HttpResponse(status=503)
+            resp['Retry-After'] = str(PROXY_RETRY_AFTER)
+            return resp
+        path, content_type = proxy, PROXY_CONTENT_TYPE
 
-    return data
+    return get_file_stream(request=request, path=path, content_type=content_type)
 
 
-def get_video_stream(request: WSGIRequest, cid: int) -> FileResponse:
+def get_clip_sprite(request: WSGIRequest, cid: int) -> HttpResponse:
     """
-    Returns a response to a request for a video
+    Returns a sprite of a clip: SPRITE_FRAMES frames spread evenly over the clip, each SPRITE_WIDTH pixels wide,
+    side by side in one JPEG image. The sprite is made on the first request.
 
-    Solution based on this: https://stackoverflow.com/questions/33208849/python-django-streaming-video-mp4-file-using-httpresponse
-    Stream the given clip
-    :param request:
-    :param cid: the clip id
-    :return: a response to a request for a part of a video
+    :param request: The request.
+    :param cid: The clip id.
+    :return: A response with the sprite, which browsers may cache for SPRITE_MAX_AGE seconds.
     """
     clip = get_clip_by_id(cid)
     assert clip is not None
-    path = str(clip)
 
-    # Get range parameters from request header
-    range_header = request.META.get('HTTP_RANGE', '').strip()
-    range_match = range_re.match(range_header)
+    resp = get_file_stream(request=request, path=get_sprite(src=str(clip)), content_type=SPRITE_CONTENT_TYPE)
+    resp['Cache-Control'] = 'public, max-age={0}'.format(settings.SPRITE_MAX_AGE)
+    return resp
+
 
+def get_file_stream(request: WSGIRequest, path: str, content_type: str = None) -> HttpResponse:
+    """
+    Returns a response to a request for a file.
+    Single ranges and whole files are sent as files, so a WSGI server with sendfile support
+    sends them without copying through Python. Multiple ranges are sent as multipart/byteranges.
+    Conditional requests are answered using the file's ETag and modification time.
+
+    :param request: The request.
+    :param path: Absolute path to the file.
+    :param content_type: Content type of the file, guessed from the file name if not given.
+    :return: A response to a request for a part of a file.
+    """
     # Get information about file to be sent
-    size = os.path.getsize(path)
-    content_type, encoding = mimetypes.guess_type(path)
-    content_type = content_type or 'application/octet-stream'
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = '"{0:x}-{1:x}"'.format(stat.st_mtime_ns, size)
+    last_modified = int(stat.st_mtime)
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+
+    # Get what parts of the file that should be sent, the whole file is sent if If-Range doesn't match
+    ranges = None
+    if if_range_matches(header=request.META.get('HTTP_IF_RANGE', '').strip(), etag=etag,
+                        last_modified=last_modified):
+        ranges = parse_ranges(header=request.META.get('HTTP_RANGE', '').strip(), size=size)
+
+    resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    # The browser already has the file or a precondition failed
+    if resp is not None:
+        pass
+
+    # The entire file should be sent
+    elif ranges is None:
+        resp = FileResponse(open(path, 'rb'), content_type=content_type)
+        resp['Content-Length'] = str(size)
+
+    # No part of the file can be sent
+    elif not ranges:
+        resp = HttpResponse(status=416)
+        resp['Content-Range'] = 'bytes */%s' % size
 
     # Part of the file should be sent
-    if range_match:
-        # Get what parts of the file that should be sent
-        first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte) if last_byte else size - 1
-        if last_byte >= size:
-            last_byte = size - 1
+    elif len(ranges) == 1:
+        first_byte, last_byte = ranges[0]
         length = last_byte - first_byte + 1
-
-        # Create response and set headers
-        resp = FileResponse(RangeFileWrapper(open(path, 'rb'), offset=first_byte, length=length), status=206,
+        resp = FileResponse(RangeFile(open(path, 'rb'), offset=first_byte, length=length), status=206,
                             content_type=content_type)
         resp['Content-Length'] = str(length)
         resp['Content-Range'] = 'bytes %s-%s/%s' % (first_byte, last_byte, size)
 
-    # The entire file should be sent
+    # Several parts of the file should be sent
     else:
-        resp = FileResponse(FileWrapper(open(path, 'rb')), content_type=content_type)
-        resp['Content-Length'] = str(size)
+        boundary = uuid.uuid4().hex
+        headers = ['--{0}\r\nContent-Type: {1}\r\nContent-Range: bytes {2}-{3}/{4}\r\n\r\n'
+                   .format(boundary, content_type, first_byte, last_byte, size).encode() for
+                   first_byte, last_byte in ranges]
+        end = '--{0}--\r\n'.format(boundary).encode()
+        length = sum(len(header) + last_byte - first_byte + 3 for header, (first_byte, last_byte) in
+                     zip(headers, ranges)) + len(end)
+        resp = StreamingHttpResponse(stream_ranges(path=path, ranges=ranges, headers=headers, end=end), status=206,
+                                     content_type='multipart/byteranges; boundary=' + boundary)
+        resp['Content-Length'] = str(length)
 
+    resp.block_size = settings.VIDEO_STREAM_BLOCK_SIZE
     resp['Accept-Ranges'] = 'bytes'
+    resp['ETag'] = etag
+    resp['Last-Modified'] = http_date(last_modified)
     return resp
 
 
-class RangeFileWrapper(object):
+def parse_ranges(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses the range header of a request.
+
+    :param header: The range header.
+    :param size: Size of the file in bytes.
+    :return: A list of tuples with the first and last byte of each range that can be sent.
+             None if the header is missing, malformed or has too many ranges, so the whole file should be sent.
     """
-    Wrapper for a file that is sent in a request
+    match = ranges_re.match(header)
+    if match is None:
+        return None
+
+    specs = match.group(1).split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first_byte, last_byte = [b.strip() for b in spec.split('-')]
+        if not first_byte:
+            # The last bytes of the file
+            if not last_byte:
+                return None
+            if int(last_byte) > 0:
+                ranges.append((max(size - int(last_byte), 0), size - 1))
+        else:
+            first_byte = int(first_byte)
+            if last_byte and int(last_byte) < first_byte:
+                return None
+            if first_byte < size:
+                ranges.append((first_byte, min(int(last_byte), size - 1) if last_byte else size - 1))
+    return ranges
+
+
+def if_range_matches(header: str, etag: str, last_modified: int) -> bool:
+    """
+    Checks if the file hasn't changed according to the If-Range header of a request.
+
+    :param header: The If-Range header.
+    :param etag: The ETag of the file.
+    :param last_modified: The modification time of the file, in seconds since the epoch.
+    :return: Whether ranges of the file should be sent.
+    """
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith('W/'):
+        return header == etag  # Strong comparison, weak ETags never match
+    return parse_http_date_safe(header) == last_modified
+
+
+def stream_ranges(path: str, ranges: List[Tuple[int, int]], headers: List[bytes], end: bytes) -> Iterator[bytes]:
     """
+    Streams ranges of a file as the body of a multipart/byteranges response.
 
-    def __init__(self, file, blksize=8192, offset=0, length=None):
+    :param path: Path of the file.
+    :param ranges: List of tuples with the first and last byte of each range.
+    :param headers: The header of each part.
+    :param end: The end of the body.
+    :return: An iterator of the body.
+    """
+    with open(path, 'rb') as file:
+        for header, (first_byte, last_byte) in zip(headers, ranges):
+            yield header
+            yield from RangeFile(file, offset=first_byte, length=last_byte - first_byte + 1,
+                                 blksize=settings.VIDEO_STREAM_BLOCK_SIZE)
+            yield b'\r\n'
+    yield end
+
+
+class RangeFile(object):
+    """
+    A file that is read from an offset and a given number of bytes.
+    The underlying file can be used directly from its current position, e.g. by sendfile.
+    """
+
+    def __init__(self, file, offset=0, length=None, blksize=8192):
         self.file = file
         self.file.seek(offset, os.SEEK_SET)
         self.remaining = length
         self.blksize = blksize
 
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            # If remaining is None, we're reading the entire file.
+            return self.file.read(size)
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
     def close(self):
         if hasattr(self.file, 'close'):
             self.file.close()
 
     def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.remaining is None:
-            # If remaining is None, we're reading the entire file.
-            data = self.file.read(self.blksize)
-            if data:
-                return data
-            raise StopIteration()
-        else:
-            if self.remaining <= 0:
-                raise StopIteration()
-            data = self.file.read(min(self.remaining, self.blksize))
-            if not data:
-                raise StopIteration()
-            self.remaining -= len(data)
-            return data
+        return iter(lambda: self.read(self.blksize), b'')
 
 
 # Pattern for parameters in range header
-range_re = re.compile(r'bytes\s*=\s*(\d+)\s*-\s*(\d*)', re.I)
+ranges_re = re.compile(r'^bytes\s*=\s*(\d*\s*-\s*\d*(?:\s*,\s*\d*\s*-\s*\d*)*)\s*$', re.I)
+
+# Largest number of ranges sent in one response, the whole file is sent for more
+MAX_RANGES = 100
+
+# Seconds to wait before requesting a clip again while its proxy is generated
+PROXY_RETRY_AFTER = 5
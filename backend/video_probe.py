@@ -0,0 +1,122 @@
+import hashlib
+import os
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# This file represents the backend Video Probe.
+# It doesn't depend on Django so it can be used by worker processes and stand-alone scripts.
+
+
+def probe_video(file_path: str, fingerprint: bool = True) -> Tuple[float, float, int, int, Optional[str]]:
+    """
+    Opens a clip once and gets its duration, frame rate, dimensions (width, height) and a fingerprint of its content.
+
+    :param file_path: The absolute path to a clip.
+    :param fingerprint: Whether to read the first frame to get a fingerprint.
+    :return: Duration in seconds, frame rate in FPS, width and height in pixels and fingerprint.
+             This is given in the form of a tuple (duration, frame rate, width, height, fingerprint).
+             The fingerprint is None if it isn't requested or the first frame can't be read.
+    """
+    # Check if clip exists
+    if not os.path.isfile(path=file_path):
+        raise FileNotFoundError
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        fps, frames, width, height = get_capture_details(cap=cap)
+        hash_sum = None
+        if fingerprint:
+            success, frame = cap.read()
+            if success:
+                hash_sum = get_fingerprint(frame=frame)
+    finally:
+        cap.release()
+
+    duration = frames / fps if fps else 0
+    return duration, fps, width, height, hash_sum
+
+
+def get_capture_details(cap: cv2.VideoCapture) -> Tuple[float, int, int, int]:
+    """
+    Gets the details of an opened clip without reading any frames.
+
+    :param cap: An opened clip.
+    :return: Frame rate in FPS, number of frames and width and height in pixels.
+             This is given in the form of a tuple (frame rate, frames, width, height).
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    return fps, frames, width, height
+
+
+def sample_frames(cap: cv2.VideoCapture, start: int, end: int, step: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Decodes every step:th frame of an opened clip in the interval [start, end).
+    The clip is seeked to the first frame and the frames in between are grabbed without being decoded.
+
+    :param cap: An opened clip.
+    :param start: The first frame.
+    :param end: The frame after the last frame.
+    :param step: Number of frames between each decoded frame.
+    :return: An iterator of tuples with frame number and decoded frame. Stops early if the clip is over.
+    """
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for i in range(start, end, step):
+        if i > start:
+            for _ in range(step - 1):
+                if not cap.grab():
+                    return
+        success, frame = cap.read()
+        if not success:
+            return
+        yield i, frame
+
+
+def make_sprite(file_path: str, count: int, width: int) -> np.ndarray:
+    """
+    Opens a clip once and puts frames spread evenly over the clip side by side in one image.
+
+    :param file_path: The absolute path to a clip.
+    :param count: Number of frames.
+    :param width: Width of each frame in pixels. The height keeps the aspect ratio of the clip.
+    :return: The sprite. Frames that can't be read are left black.
+    """
+    # Check if clip exists
+    if not os.path.isfile(path=file_path):
+        raise FileNotFoundError
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        fps, frames, clip_width, clip_height = get_capture_details(cap=cap)
+        if not clip_width or not clip_height:
+            raise ValueError("Could not read {0}.".format(file_path))
+
+        height = max(round(clip_height * width / clip_width), 1)
+        sprite = np.zeros((height, width * count, 3), np.uint8)
+        for i in range(count):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((i + 0.5) * frames / count))
+            success, frame = cap.read()
+            if success:
+                sprite[:, i * width:(i + 1) * width] = cv2.resize(frame, (width, height),
+                                                                  interpolation=cv2.INTER_AREA)
+    finally:
+        cap.release()
+
+    return sprite
+
+
+def get_fingerprint(frame: np.ndarray) -> str:
+    """
+    Gets the fingerprint of a frame, used to find duplicate clips.
+
+    :param frame: A decoded frame.
+    :return: The SHA-256 hash sum of the frame.
+    """
+    file_hash = hashlib.sha256()
+    file_hash.update(frame)
+    return file_hash.hexdigest()
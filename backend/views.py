@@ -145,6 +145,16 @@ def export_clips(request, fid):
     return response
 
 
+@api_view(['POST'])
+def export_clips_to_path(request):
+    """
+    Delegates a 'clips to path' request to the Exporter.
+    :return: A response from the Exporter.
+    """
+    data = exporter.export_clips_to_path(request.data)
+    return Response(data[1], data[0])
+
+
 @api_view(['POST'])
 def video_get_info(request):
     """
@@ -165,6 +175,16 @@ def video_get_sequential(request):
     return Response(data[1], data[0])
 
 
+@api_view(['POST'])
+def video_get_playback_chain(request):
+    """
+    Delegates a 'playback chain' request to the Video Manager.
+    :return: A response from the Video Manager.
+    """
+    data = video_manager.get_playback_chain(request.data)
+    return Response(data[1], data[0])
+
+
 @api_view(['POST'])
 def video_get_cameras(request):
     """
@@ -273,3 +293,13 @@ def get_clip_stream(request, cid):
     """
     response = video_manager.get_video_stream(request, cid)
     return response
+
+
+@api_view(['GET'])
+def get_clip_sprite(request, cid):
+    """
+    Delegates a 'get sprite' request to the video manager.
+    :return: A response from the Video Manager.
+    """
+    response = video_manager.get_clip_sprite(request, cid)
+    return response
@@ -159,9 +159,8 @@ class ClipBrowser extends Component {
                                   right: "1em",
                                 }}
                                 onClick={() => this.playClip(clipID)}
-                                disabled={!this.props.clips[clipID].playable}
                                 variant={
-                                  this.props.clips[clipID].playable
+                                  this.props.clips[clipID].isPlayableNow()
                                     ? "primary"
                                     : "secondary"
                                 }
@@ -395,7 +395,6 @@ class InspectorBrowser extends Component {
               className={styles.browserInspectorButton}
               variant="light"
               onClick={() => this.playClip(clip.id)}
-              disabled={!this.props.clips[clip.id].playable}
             >
               Play
             </Button>
@@ -460,7 +459,13 @@ class InspectorBrowser extends Component {
               </tr>
               <tr>
                 <td>Playable</td>
-                <td>{clip.playable ? "Yes" : "No"}</td>
+                <td>
+                  {clip.playable
+                    ? "Yes"
+                    : clip.proxyAvailable
+                    ? "Through proxy"
+                    : "After making a proxy"}
+                </td>
               </tr>
               <tr>
                 <td>Overlapping</td>
@@ -22,16 +22,21 @@ import {
   VolumeMenuButton,
 } from "video-react";
 
+// Milliseconds to wait before loading a clip again while its proxy is made
+const PROXY_RETRY_DELAY = 5000;
+
 /* -- Player -- */
 class Player extends Component {
   constructor(props) {
     super(props);
     this.playNext = this.playNext.bind(this);
+    this.handleSourceError = this.handleSourceError.bind(this);
   }
 
   // Load the source of the player if it updates
   componentDidUpdate(prevProps, prevState) {
     if (this.props.clipID !== prevProps.clipID) {
+      clearTimeout(this.retry);
       this.player.load();
     }
   }
@@ -41,6 +46,20 @@ class Player extends Component {
     this.props.setPlayer(this.player);
   }
 
+  componentWillUnmount() {
+    clearTimeout(this.retry);
+  }
+
+  // Clips that can't be played in the browser can't be loaded until their proxy is made,
+  // so load them again until it is
+  handleSourceError() {
+    const clip = this.props.clips[this.props.clipID];
+    if (clip != undefined && !clip.playable) {
+      clearTimeout(this.retry);
+      this.retry = setTimeout(() => this.player.load(), PROXY_RETRY_DELAY);
+    }
+  }
+
   handleStateChange(state) {
     // Update states in store based on state of player
     // Update the current position state
@@ -64,7 +83,7 @@ class Player extends Component {
         if (
           this.props.nextClip != undefined &&
           this.props.clips.hasOwnProperty(this.props.nextClip) &&
-          this.props.clips[this.props.nextClip].playable
+          this.props.clips[this.props.nextClip].isPlayableNow()
         ) {
           this.props.playClip(this.props.nextClip);
           setTimeout(() => this.props.play(), 100);
@@ -87,7 +106,10 @@ class Player extends Component {
           onPause={this.props.pause}
           onEnded={this.playNext}
         >
-          <source src={"/video/stream/" + this.props.clipID + "/"} />
+          <source
+            src={"/video/stream/" + this.props.clipID + "/"}
+            onError={this.handleSourceError}
+          />
           <ControlBar>
             <ReplayControl seconds={10} order={1.1} />
             <ForwardControl seconds={30} order={1.2} />
@@ -106,7 +106,6 @@ class Cliplines extends Component {
     this.props.changeMode(INSPECTOR_MODE_CLIP, id);
     this.props.changeBrowserTab();
 
-    if (!this.props.clips[id].playable) return;
     this.props.playClip(id);
     setTimeout(() => this.props.play(), 100);
 
@@ -161,7 +160,9 @@ class Cliplines extends Component {
                     key={clipID}
                     className={styles.cliplineClip}
                     style={{
-                      backgroundColor: this.props.clips[clipID].playable
+                      backgroundColor: this.props.clips[
+                        clipID
+                      ].isPlayableNow()
                         ? COLOR_LIST[i % COLOR_LIST.length]
                         : "#6c757d",
                       width:
@@ -173,9 +174,9 @@ class Cliplines extends Component {
                         this.getLeftPosition(
                           this.props.clips[clipID].startTime
                         ) + "%",
-                      cursor: this.props.clips[clipID].playable
+                      cursor: this.props.clips[clipID].isPlayableNow()
                         ? "pointer"
-                        : "not-allowed",
+                        : "progress",
                     }}
                     onClick={() => this.handleClipSelection(clipID)}
                   ></div>
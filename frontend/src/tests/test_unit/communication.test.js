@@ -1068,6 +1068,7 @@ describe("Communication reducer", () => {
               overlap: [4, 5],
               frame_rate: 69,
               playable: false,
+              proxy_available: true,
             },
           ],
         })
@@ -1093,7 +1094,8 @@ describe("Communication reducer", () => {
             objects: {
               person: 1,
             },
-          }
+          },
+          true
         ),
       },
     });
@@ -1170,6 +1172,7 @@ describe("Communication reducer", () => {
               overlap: [4, 5],
               frame_rate: 69,
               playable: false,
+              proxy_available: true,
             },
           ],
         })
@@ -1205,7 +1208,8 @@ describe("Communication reducer", () => {
             objects: {
               person: 1,
             },
-          }
+          },
+          true
         ),
       },
     });
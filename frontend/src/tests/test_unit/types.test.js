@@ -51,7 +51,8 @@ describe("Clip class", () => {
     [1338],
     42,
     true,
-    { rate: 1337, objects: { monkey: 33 } }
+    { rate: 1337, objects: { monkey: 33 } },
+    false
   );
 
   it("should have all members set correctly", () => {
@@ -71,6 +72,8 @@ describe("Clip class", () => {
       rate: 1337,
       objects: { monkey: 33 },
     });
+    expect(clip.proxyAvailable).toEqual(false);
+    expect(clip.isPlayableNow()).toEqual(true);
   });
 
   it("should produce correct full path", () => {
@@ -71,6 +71,7 @@ export class Clip {
    * @param {Number} frameRate The value of the framerate of this clip.
    * @param {boolean} playable The bool value if clip is playable.
    * @param {Object[rate: Number, objects: Object[string: number]]} objectDetection An object detection on the clip.
+   * @param {boolean} proxyAvailable The bool value if a playable proxy of the clip exists.
    */
   constructor(
     id,
@@ -85,7 +86,8 @@ export class Clip {
     overlapping = [],
     frameRate,
     playable,
-    objectDetection = undefined
+    objectDetection = undefined,
+    proxyAvailable = false
   ) {
     this.id = id;
     this.name = name;
@@ -100,6 +102,17 @@ export class Clip {
     this.frameRate = frameRate;
     this.playable = playable;
     this.objectDetection = objectDetection;
+    this.proxyAvailable = proxyAvailable;
+  }
+
+  /**
+   *
+   * Checks whether this clip can be played right away. Other clips are played
+   * once a proxy of the clip has been made.
+   * @return {boolean} true if the clip or a proxy of it is playable.
+   */
+  isPlayableNow() {
+    return this.playable || this.proxyAvailable;
   }
 
   /**
@@ -164,7 +164,8 @@ export function parseClips(clipResponse) {
       c.overlap,
       c.frame_rate,
       c.playable,
-      c.objectdetection_set == null ? undefined : c.objectdetection_set
+      c.objectdetection_set == null ? undefined : c.objectdetection_set,
+      c.proxy_available
     );
   }
 
@@ -4,7 +4,7 @@ import random
 import math
 from datetime import *
 
-import cv2
+from backend.video_probe import probe_video
 
 def syntax():
     return "Syntax: [rootDir] [latitude] [longitude] [radius] [minStartTime] [maxEndTime]"
@@ -100,8 +100,7 @@ def generateMetadata(directory):
             f.close()
 
             # Obtain clip data
-            cap = cv2.VideoCapture(os.path.abspath(path))
-            duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+            duration = probe_video(os.path.abspath(path), fingerprint=False)[0]
 
             # Increment date
             date = datetime.fromtimestamp(date.timestamp() + math.ceil(duration))